@@ -0,0 +1,606 @@
+# -*- encoding: utf-8 -*-
+"""
+@File    :   bench.py
+@Description:   client.py 性能基准
+
+用法：
+  python bench.py payload [--cores 8] [--nics 2] [--disks 4] [--iterations 2000]
+      对比各上报格式的编码耗时与请求体大小：
+      legacy JSON（当前默认）/ raw JSON / raw JSON + gzip / msgpack
+
+  python bench.py collectors [--cores 128] [--nics 8] [--mounts 16] [--pids 5000]
+                             [--baseline bench_baseline.json] [--save-baseline]
+                             [--max-retained-kb 1.0]
+      在合成的 /proc、/sys 目录上逐个运行采集函数，输出每次调用的
+      耗时、读写系统调用次数（/proc/self/io）与 tracemalloc 内存分配，
+      并与基线文件对比（--save-baseline 写入新基线）；
+      复用 /proc 缓冲区的读取函数若出现稳态内存增长则以非零状态退出
+
+  python bench.py soak [--ticks 200000] [--collect] [--format legacy] [--delta]
+      长时间连续生成、编码上报样本（--collect 时每周期同时在合成 /proc 上采集），
+      定期输出每周期 CPU 耗时、RSS 与存活对象数；RSS 增长超过 --max-growth-kb 时返回非 0。
+      开始前对比改造前的快照生成方式（复制 dict + 易读格式化 + 逐键转小驼峰）与 HostSample.to_wire
+
+  python bench.py startup [--runs 10]
+      在子进程中反复启动客户端，分别统计导入 client、创建 SystemMonitor
+      与首次采集的耗时；对比无静态信息缓存（冷启动）与有缓存（热启动）
+"""
+
+import argparse
+import gc
+import gzip
+import json
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import client
+
+
+# ============================
+# 合成样本
+# ============================
+def synthetic_info(cores=8, nics=2, disks=4, processes=0, seed=None):
+    """
+    生成与 HostSample.to_dict() 结构一致的原始（数值）样本。
+    """
+    rnd = random.Random(seed)
+    mem_total = 64 * 1024**3
+    swap_total = 8 * 1024**3
+    return {
+        "cpu_usage": round(rnd.uniform(0, 100), 2),
+        "cpu_model": "Intel(R) Xeon(R) Gold 6230 CPU @ 2.10GHz",
+        "cpu_count": cores,
+        "cpu_freq": 2.1,
+        "mem_total": mem_total,
+        "mem_used": rnd.randint(0, mem_total),
+        "mem_percent": round(rnd.uniform(0, 100), 2),
+        "swap_total": swap_total,
+        "swap_used": rnd.randint(0, swap_total),
+        "swap_percent": round(rnd.uniform(0, 100), 2),
+        "network_sent": rnd.randint(0, 2**40),
+        "network_received": rnd.randint(0, 2**40),
+        "network_pocket_sent": rnd.randint(0, 2**32),
+        "process_count": rnd.randint(100, 2000),
+        "disks": [
+            ("/data{}".format(i), 2 * 1024**4, rnd.randint(0, 2 * 1024**4), round(rnd.uniform(0, 100), 2))
+            for i in range(disks)
+        ],
+        "disk_io": [
+            ("sd{}".format(chr(97 + i % 26)), round(rnd.uniform(0, 1e5), 2), round(rnd.uniform(0, 1e5), 2),
+             round(rnd.uniform(0, 1e3), 2), round(rnd.uniform(0, 1e3), 2), round(rnd.uniform(0, 100), 2))
+            for i in range(disks)
+        ],
+        "cpu_cores": [
+            ("cpu{}".format(i), round(rnd.uniform(0, 100), 2), round(rnd.uniform(0, 5), 2), 0.0)
+            for i in range(cores)
+        ],
+        "net_interfaces": [
+            ("eth{}".format(i),) + tuple(round(rnd.uniform(0, 1e4), 2) for _ in range(8))
+            for i in range(nics)
+        ],
+        "top_cpu_processes": [
+            (rnd.randint(1, 2**22), "proc{}".format(i), "/usr/bin/proc{} --flag".format(i),
+             round(rnd.uniform(0, 100), 2), rnd.randint(0, 2**32))
+            for i in range(processes)
+        ],
+        "top_mem_processes": [],
+        "metric_stats": {},
+        "agent_stats": {},
+        "uptime": rnd.uniform(0, 1e7),
+        "sent_speed": round(rnd.uniform(0, 1e4), 2),
+        "recv_speed": round(rnd.uniform(0, 1e4), 2),
+        "os": "Ubuntu 22.04.4 LTS (Jammy Jellyfish)",
+        "secret_key": "0123456789abcdef0123456789abcdef",
+        "last_update": client.now_shanghai_str(),
+    }
+
+
+def synthetic_sample(cores=8, nics=2, disks=4, processes=0, seed=None):
+    """
+    synthetic_info() 写入 HostSample，编码时与 SystemMonitor 一样调用 to_wire()。
+    """
+    sample = client.HostSample(None)
+    sample.update(synthetic_info(cores, nics, disks, processes, seed))
+    return sample
+
+
+def timed(func, iterations):
+    """
+    返回 (单次平均耗时 µs, 最后一次的返回值)
+    """
+    result = None
+    start = time.perf_counter()
+    for _ in range(iterations):
+        result = func()
+    return (time.perf_counter() - start) / iterations * 1e6, result
+
+
+# ============================
+# 上报编码对比
+# ============================
+def payload_encoders():
+    legacy = client.SystemMonitor.legacy_formatters()
+    return [
+        ("legacy json", lambda sample: client.encode_payload(sample.to_wire(legacy), "json")[0]),
+        ("raw json", lambda sample: client.encode_payload(sample.to_wire(), "json")[0]),
+        ("raw json+gzip", lambda sample: gzip.compress(client.encode_payload(sample.to_wire(), "json")[0], 5)),
+        ("msgpack", lambda sample: client.encode_payload(sample.to_wire(), "msgpack")[0]),
+        ("msgpack+gzip", lambda sample: gzip.compress(client.encode_payload(sample.to_wire(), "msgpack")[0], 5)),
+    ]
+
+
+def bench_payload(args):
+    sample = synthetic_sample(args.cores, args.nics, args.disks, args.processes, seed=1)
+    rows = []
+    for name, encode in payload_encoders():
+        usec, body = timed(lambda: encode(sample), args.iterations)
+        rows.append((name, usec, len(body)))
+
+    base_usec, base_size = rows[0][1], rows[0][2]
+    print("{:<16}{:>12}{:>10}{:>10}{:>10}".format("format", "encode µs", "x time", "bytes", "x size"))
+    for name, usec, size in rows:
+        print("{:<16}{:>12.1f}{:>10.2f}{:>10}{:>10.2f}".format(
+            name, usec, usec / base_usec, size, size / base_size))
+    return 0
+
+
+# ============================
+# 合成 /proc、/sys 目录
+# ============================
+def write_file(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(content)
+
+
+def build_proc_fixture(root, cores=8, nics=2, mounts=4, pids=500, disks=2, seed=1):
+    """
+    在 root 下生成 proc/ 与 sys/ 两个目录，规模由参数决定；
+    挂载点建在 root/mnt 下，保证 os.statvfs 可以真实执行。
+    返回 (proc_root, sys_root)。
+    """
+    rnd = random.Random(seed)
+    proc = os.path.join(root, "proc")
+    sysfs = os.path.join(root, "sys")
+
+    def cpu_line(name):
+        return "{} {}\n".format(name, " ".join(str(rnd.randint(0, 10**7)) for _ in range(10)))
+
+    write_file(os.path.join(proc, "stat"), "".join(
+        [cpu_line("cpu")] + [cpu_line("cpu{}".format(i)) for i in range(cores)] +
+        ["intr 123456 0 0\n", "ctxt 987654\n", "btime 1700000000\n",
+         "processes {}\n".format(pids), "procs_running 2\n", "procs_blocked 0\n"]
+    ))
+    write_file(os.path.join(proc, "cpuinfo"), "".join(
+        "processor\t: {}\nmodel name\t: Intel(R) Xeon(R) Gold 6230 CPU @ 2.10GHz\n"
+        "cpu MHz\t\t: 2100.000\n\n".format(i) for i in range(cores)
+    ))
+    meminfo_keys = [
+        "MemTotal", "MemFree", "MemAvailable", "Buffers", "Cached", "SwapCached", "Active", "Inactive",
+        "Active(anon)", "Inactive(anon)", "Active(file)", "Inactive(file)", "Unevictable", "Mlocked",
+        "SwapTotal", "SwapFree", "Dirty", "Writeback", "AnonPages", "Mapped", "Shmem", "KReclaimable",
+        "Slab", "SReclaimable", "SUnreclaim", "KernelStack", "PageTables", "NFS_Unstable", "Bounce",
+        "WritebackTmp", "CommitLimit", "Committed_AS", "VmallocTotal", "VmallocUsed", "VmallocChunk",
+        "Percpu", "HardwareCorrupted", "AnonHugePages", "ShmemHugePages", "ShmemPmdMapped",
+        "FileHugePages", "FilePmdMapped", "HugePages_Total", "HugePages_Free", "HugePages_Rsvd",
+        "HugePages_Surp", "Hugepagesize", "Hugetlb", "DirectMap4k", "DirectMap2M", "DirectMap1G",
+    ]
+    write_file(os.path.join(proc, "meminfo"), "".join(
+        "{:<16}{:>12} kB\n".format(k + ":", rnd.randint(1, 64 * 1024**2)) for k in meminfo_keys
+    ))
+    write_file(os.path.join(proc, "net", "dev"), "".join(
+        ["Inter-|   Receive                                                |  Transmit\n",
+         " face |bytes    packets errs drop fifo frame compressed multicast|bytes    packets errs drop fifo colls carrier compressed\n",
+         "    lo: " + " ".join(str(rnd.randint(0, 10**9)) for _ in range(16)) + "\n"] +
+        ["  eth{}: {}\n".format(i, " ".join(str(rnd.randint(0, 10**12)) for _ in range(16))) for i in range(nics)]
+    ))
+    write_file(os.path.join(proc, "uptime"), "{:.2f} {:.2f}\n".format(rnd.uniform(1e3, 1e7), rnd.uniform(1e3, 1e8)))
+
+    mount_lines = []
+    for i in range(mounts):
+        path = os.path.join(root, "mnt", "data{}".format(i))
+        os.makedirs(path, exist_ok=True)
+        mount_lines.append("{} 1 8:{} / {} rw,relatime shared:{} - ext4 /dev/sd{}{} rw\n".format(
+            100 + i, i, path, i, chr(97 + i % 26), i))
+    # 与真实主机一样混入应被过滤的伪文件系统
+    mount_lines.append("20 1 0:20 / /proc rw,nosuid - proc proc rw\n")
+    mount_lines.append("21 1 0:21 / /sys rw,nosuid - sysfs sysfs rw\n")
+    mount_lines.append("22 1 0:22 / /dev/shm rw,nosuid - tmpfs tmpfs rw\n")
+    write_file(os.path.join(proc, "self", "mountinfo"), "".join(mount_lines))
+
+    disk_names = ["sd{}".format(chr(97 + i % 26)) for i in range(disks)]
+    diskstats = []
+    for major, name in enumerate(disk_names):
+        diskstats.append("   8 {:>7} {} {}\n".format(major * 16, name, " ".join(str(rnd.randint(0, 10**9)) for _ in range(17))))
+        diskstats.append("   8 {:>7} {}1 {}\n".format(major * 16 + 1, name, " ".join(str(rnd.randint(0, 10**9)) for _ in range(17))))
+        os.makedirs(os.path.join(sysfs, "block", name), exist_ok=True)
+    diskstats.append("   7       0 loop0 {}\n".format(" ".join("0" for _ in range(17))))
+    write_file(os.path.join(proc, "diskstats"), "".join(diskstats))
+
+    for resource in ("cpu", "memory", "io"):
+        write_file(os.path.join(proc, "pressure", resource), "".join(
+            "{} avg10=1.50 avg60=0.80 avg300=0.20 total={}\n".format(kind, rnd.randint(0, 10**10))
+            for kind in ("some", "full")))
+
+    # cgroup v2：根目录 + 一个带限额的容器 cgroup（bench.slice）
+    cgroup = os.path.join(sysfs, "fs", "cgroup")
+    write_file(os.path.join(cgroup, "cgroup.controllers"), "cpu io memory pids\n")
+    slice_dir = os.path.join(cgroup, "bench.slice")
+    write_file(os.path.join(slice_dir, "cpu.stat"), "".join("{} {}\n".format(k, rnd.randint(0, 10**9)) for k in (
+        "usage_usec", "user_usec", "system_usec", "nr_periods", "nr_throttled", "throttled_usec")))
+    write_file(os.path.join(slice_dir, "cpu.max"), "200000 100000\n")
+    write_file(os.path.join(slice_dir, "memory.current"), "{}\n".format(rnd.randint(0, 2**32)))
+    write_file(os.path.join(slice_dir, "memory.max"), "{}\n".format(2**33))
+    write_file(os.path.join(slice_dir, "io.stat"), "".join(
+        "8:{} rbytes={} wbytes={} rios={} wios={} dbytes=0 dios=0\n".format(
+            i * 16, rnd.randint(0, 10**12), rnd.randint(0, 10**12), rnd.randint(0, 10**8), rnd.randint(0, 10**8))
+        for i in range(disks)))
+
+    for pid in range(1, pids + 1):
+        name = "worker-{}".format(pid % 50)
+        stat = "{} ({}) S 1 {} {} 0 -1 4194560 100 0 0 0 {} {} 0 0 20 0 1 0 {} {} {} 18446744073709551615\n".format(
+            pid, name, pid, pid, rnd.randint(0, 10**6), rnd.randint(0, 10**6),
+            rnd.randint(0, 10**7), rnd.randint(10**6, 10**9), rnd.randint(100, 10**6))
+        write_file(os.path.join(proc, str(pid), "stat"), stat)
+        write_file(os.path.join(proc, str(pid), "cmdline"), "/usr/bin/{}\0--config\0/etc/{}.conf\0".format(name, name))
+    return proc, sysfs
+
+
+# ============================
+# 采集函数基准
+# ============================
+def read_syscalls():
+    """
+    当前进程累计的读写类系统调用次数（syscr + syscw），不可用时返回 None。
+    """
+    try:
+        with open("/proc/self/io") as f:
+            values = dict(line.split(": ") for line in f.read().splitlines())
+        return int(values["syscr"]) + int(values["syscw"])
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def measure(func, iterations):
+    """
+    返回 {"usec": 单次耗时, "syscalls": 单次读写系统调用数,
+          "alloc_kb": 单次调用的 tracemalloc 峰值, "retained_kb": 多次调用后的净增长}
+    """
+    func()  # 预热
+    syscalls_before = read_syscalls()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    usec = (time.perf_counter() - start) / iterations * 1e6
+    syscalls_after = read_syscalls()
+    syscalls = None
+    if syscalls_before is not None and syscalls_after is not None:
+        # 读取 /proc/self/io 自身也有一次 read，忽略不计
+        syscalls = round((syscalls_after - syscalls_before) / iterations, 1)
+
+    alloc_runs = max(1, min(iterations, 20))
+    tracemalloc.start()
+    try:
+        base, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+        for _ in range(alloc_runs):
+            func()
+        retained, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        "usec": round(usec, 1),
+        "syscalls": syscalls,
+        "alloc_kb": round((peak - base) / 1024, 2),
+        "retained_kb": round((retained - base) / 1024, 2),
+    }
+
+
+def collector_cases(monitor):
+    table = client.ProcessTable(10)
+    table.scan()
+    return [
+        ("read_cpu_stat", monitor.read_cpu_stat),
+        ("read_cpu_stat_all", monitor.read_cpu_stat_all),
+        ("get_linux_memory", monitor.get_linux_memory),
+        ("read_net_dev", monitor.read_net_dev),
+        ("get_linux_uptime", monitor.get_linux_uptime),
+        ("get_linux_disks", monitor.get_linux_disks),
+        ("read_diskstats", monitor.read_diskstats),
+        ("get_linux_process_count", monitor.get_linux_process_count),
+        ("process_table_scan", table.scan),
+        ("collect_linux_pressure", monitor.collect_linux_pressure),
+        ("collect_linux_cgroup", monitor.collect_linux_cgroup),
+        ("update_info", monitor.update_info),
+        ("history_update", lambda: monitor.history.update(monitor.sample_metrics)),
+        ("build_snapshot", monitor.build_snapshot),
+        ("serialize_json", lambda: client.encode_payload(monitor.sample.to_wire(), "json")),
+        ("serialize_msgpack", lambda: client.encode_payload(monitor.sample.to_wire(), "msgpack")),
+    ]
+
+
+# 复用 /proc 文件描述符与缓冲区的读取函数：稳态下不应有净内存增长
+STEADY_STATE_CASES = ("read_cpu_stat_all", "get_linux_memory", "read_net_dev", "get_linux_uptime")
+
+
+def compare_baseline(results, baseline, threshold):
+    """
+    打印与基线相比的耗时变化，返回超过阈值的回归项。
+    """
+    regressions = []
+    for name, row in results.items():
+        old = baseline.get(name)
+        if not old or not old.get("usec"):
+            row["change"] = None
+            continue
+        change = (row["usec"] - old["usec"]) / old["usec"] * 100
+        row["change"] = round(change, 1)
+        if change > threshold:
+            regressions.append(name)
+    return regressions
+
+
+def bench_collectors(args):
+    root = tempfile.mkdtemp(prefix="hm_proc_")
+    old_roots = client.PROC_ROOT, client.SYS_ROOT
+    try:
+        client.PROC_ROOT, client.SYS_ROOT = build_proc_fixture(
+            root, cores=args.cores, nics=args.nics, mounts=args.mounts, pids=args.pids, disks=args.disks)
+        monitor = client.SystemMonitor(
+            "0" * 32, "http://127.0.0.1",
+            options={"net_exclude": "lo", "cgroup_path": "bench.slice", "static_cache": "",
+                     "history_file": os.path.join(root, "history.rrd")}, autostart=False)
+        monitor.collect_info()
+        results = {}
+        for name, func in collector_cases(monitor):
+            results[name] = measure(func, args.iterations)
+    finally:
+        client.PROC_ROOT, client.SYS_ROOT = old_roots
+        shutil.rmtree(root, ignore_errors=True)
+
+    fixture = {"cores": args.cores, "nics": args.nics, "mounts": args.mounts,
+               "pids": args.pids, "disks": args.disks}
+    baseline = {}
+    if args.baseline and os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            stored = json.load(f)
+        if stored.get("fixture") == fixture:
+            baseline = stored.get("results", {})
+        else:
+            print("基线的合成目录规模 {} 与本次不同，跳过对比".format(stored.get("fixture")))
+    regressions = compare_baseline(results, baseline, args.threshold)
+
+    print("fixture: cores={} nics={} mounts={} pids={} disks={}  iterations={}".format(
+        args.cores, args.nics, args.mounts, args.pids, args.disks, args.iterations))
+    print("{:<26}{:>12}{:>10}{:>12}{:>14}{:>10}".format(
+        "collector", "µs/call", "syscalls", "alloc KB", "retained KB", "vs base"))
+    for name, row in results.items():
+        change = row.get("change")
+        print("{:<26}{:>12.1f}{:>10}{:>12.2f}{:>14.2f}{:>10}".format(
+            name, row["usec"], "-" if row["syscalls"] is None else row["syscalls"],
+            row["alloc_kb"], row["retained_kb"],
+            "-" if change is None else "{:+.1f}%".format(change)))
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({
+                "fixture": fixture,
+                "python": sys.version.split()[0],
+                "results": results,
+            }, f, indent=2)
+        print("基线已写入 {}".format(args.baseline))
+    leaks = [name for name in STEADY_STATE_CASES
+             if name in results and results[name]["retained_kb"] > args.max_retained_kb]
+    if leaks:
+        print("稳态内存增长超过 {} KB：{}".format(args.max_retained_kb, ", ".join(leaks)))
+    if regressions:
+        print("耗时回归超过 {}%：{}".format(args.threshold, ", ".join(regressions)))
+    return 1 if regressions or leaks else 0
+
+
+# ============================
+# 启动耗时
+# ============================
+# 在独立进程中执行，输出各阶段耗时（秒）的 JSON
+STARTUP_SCRIPT = """
+import json, sys, time
+t0 = time.perf_counter()
+import client
+t1 = time.perf_counter()
+monitor = client.SystemMonitor("0" * 32, "http://127.0.0.1",
+                               options={"static_cache": sys.argv[1], "history_file": ""}, autostart=False)
+t2 = time.perf_counter()
+monitor.collect_info()
+t3 = time.perf_counter()
+print(json.dumps([t1 - t0, t2 - t1, t3 - t2]))
+"""
+
+
+def run_startup(cache_path):
+    here = os.path.dirname(os.path.abspath(__file__))
+    start = time.perf_counter()
+    out = subprocess.check_output([sys.executable, "-c", STARTUP_SCRIPT, cache_path],
+                                  cwd=here, stderr=subprocess.DEVNULL)
+    wall = time.perf_counter() - start
+    return json.loads(out.decode().strip().splitlines()[-1]) + [wall]
+
+
+def bench_startup(args):
+    root = tempfile.mkdtemp(prefix="hm_startup_")
+    cache_path = os.path.join(root, "static_cache.json")
+    rows = {}
+    try:
+        # 预热 __pycache__，避免首次编译计入
+        run_startup(cache_path)
+        for mode in ("cold", "warm"):
+            samples = []
+            for _ in range(args.runs):
+                if mode == "cold" and os.path.exists(cache_path):
+                    os.remove(cache_path)
+                samples.append(run_startup(cache_path))
+            rows[mode] = [statistics.median(col) * 1000 for col in zip(*samples)]
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+    print("runs={}（中位数，毫秒）".format(args.runs))
+    print("{:<8}{:>14}{:>14}{:>16}{:>14}".format("cache", "import", "__init__", "first collect", "process"))
+    for mode, (imp, init, first, wall) in rows.items():
+        print("{:<8}{:>14.1f}{:>14.1f}{:>16.1f}{:>14.1f}".format(mode, imp, init, first, wall))
+
+
+# ============================
+# 长时间运行
+# ============================
+def old_camel(data):
+    """
+    HostSample 之前 snake_to_small_camel 的做法：每个键每次都拆分、首字母大写。
+    """
+    new = {}
+    for k, v in data.items():
+        if "_" not in k:
+            new[k] = v
+            continue
+        parts = k.split("_")
+        new[parts[0] + ''.join(p.capitalize() for p in parts[1:])] = v
+    return new
+
+
+def old_snapshot(info, formatters):
+    """
+    HostSample 之前的快照生成方式：复制 snake_case dict，legacy 格式逐字段转换为易读字符串，
+    再逐键转小驼峰（嵌套的统计 dict 同样转换）。
+    """
+    if formatters is not None:
+        info = {
+            key: formatters[key](value) if value is not None and key in formatters else value
+            for key, value in info.items()
+        }
+    else:
+        info = dict(info)
+    for key in client.HostSample.STATS_FIELDS:
+        if key in info:
+            info[key] = old_camel(info[key])
+    return old_camel(info)
+
+
+def compare_snapshot_paths(monitor, iterations):
+    info = monitor.sample.to_dict()
+    old_usec, old = timed(lambda: old_snapshot(info, monitor.wire_formatters), iterations)
+    new_usec, new = timed(lambda: monitor.sample.to_wire(monitor.wire_formatters), iterations)
+    assert old == new, "HostSample.to_wire 与原有转换结果不一致"
+    print("快照转换：复制 dict + 逐键转小驼峰 {:.1f} µs，HostSample.to_wire {:.1f} µs，每周期节省 {:.1f} µs".format(
+        old_usec, new_usec, old_usec - new_usec))
+
+
+def bench_soak(args):
+    root = tempfile.mkdtemp(prefix="hm_soak_")
+    old_roots = client.PROC_ROOT, client.SYS_ROOT
+    try:
+        client.PROC_ROOT, client.SYS_ROOT = build_proc_fixture(
+            root, cores=args.cores, nics=args.nics, mounts=4, pids=args.pids, disks=2)
+        monitor = client.SystemMonitor(
+            "0" * 32, "http://127.0.0.1",
+            options={"net_exclude": "lo", "cgroup_path": "bench.slice", "static_cache": "", "history_file": "",
+                     "payload_format": args.format, "delta_upload": args.delta}, autostart=False)
+        monitor.collect_info()
+        compare_snapshot_paths(monitor, 2000)
+
+        checkpoint = max(args.ticks // args.checkpoints, 1)
+        print("ticks={} collect={} format={} delta={}".format(args.ticks, args.collect, args.format, args.delta))
+        print("{:>12}{:>14}{:>12}{:>12}".format("tick", "µs/tick", "RSS KB", "objects"))
+        rows = []
+        gc.collect()
+        cpu_start = time.process_time()
+        for tick in range(1, args.ticks + 1):
+            if args.collect:
+                monitor.collect_info()
+            else:
+                monitor.aggregator.add(monitor.sample_metrics)
+            snapshot = monitor.build_snapshot()
+            if monitor.delta_encoder is not None:
+                snapshot = monitor.delta_encoder.encode(snapshot)
+                monitor.delta_encoder.ack()
+            client.encode_payload(snapshot, monitor.wire_format)
+            if tick % checkpoint == 0:
+                usec = (time.process_time() - cpu_start) / checkpoint * 1e6
+                rss, _ = client.AgentTelemetry.process_usage()
+                # 不计 rows 自身保存的检查点
+                row = (tick, usec, (rss or 0) / 1024, len(gc.get_objects()) - len(rows))
+                rows.append(row)
+                print("{:>12}{:>14.1f}{:>12.0f}{:>12}".format(*row))
+                cpu_start = time.process_time()
+    finally:
+        client.PROC_ROOT, client.SYS_ROOT = old_roots
+        shutil.rmtree(root, ignore_errors=True)
+
+    if len(rows) < 2:
+        return 0
+    # 第一个检查点之前包含预热（缓存、直方图等一次性分配），从第一个检查点开始比较
+    growth = rows[-1][2] - rows[0][2]
+    print("RSS 增长 {:.0f} KB，存活对象数变化 {:+d}".format(growth, rows[-1][3] - rows[0][3]))
+    if growth > args.max_growth_kb:
+        print("RSS 增长超过 {} KB".format(args.max_growth_kb))
+        return 1
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="client.py 性能基准")
+    sub = parser.add_subparsers(dest="command")
+
+    p = sub.add_parser("payload", help="上报编码耗时与大小对比")
+    p.add_argument("--cores", type=int, default=8)
+    p.add_argument("--nics", type=int, default=2)
+    p.add_argument("--disks", type=int, default=4)
+    p.add_argument("--processes", type=int, default=0)
+    p.add_argument("--iterations", type=int, default=2000)
+    p.set_defaults(func=bench_payload)
+
+    p = sub.add_parser("collectors", help="在合成 /proc 上测量各采集函数")
+    p.add_argument("--cores", type=int, default=8)
+    p.add_argument("--nics", type=int, default=2)
+    p.add_argument("--mounts", type=int, default=4)
+    p.add_argument("--pids", type=int, default=500)
+    p.add_argument("--disks", type=int, default=2)
+    p.add_argument("--iterations", type=int, default=200)
+    p.add_argument("--baseline", default="bench_baseline.json", help="基线文件路径")
+    p.add_argument("--save-baseline", action="store_true", help="把本次结果写为新基线")
+    p.add_argument("--threshold", type=float, default=20.0, help="耗时回归告警阈值（%%）")
+    p.add_argument("--max-retained-kb", type=float, default=1.0,
+                   help="复用缓冲区的读取函数允许的稳态内存增长（KB）")
+    p.set_defaults(func=bench_collectors)
+
+    p = sub.add_parser("soak", help="长时间运行的内存与每周期 CPU 开销")
+    p.add_argument("--ticks", type=int, default=200000)
+    p.add_argument("--checkpoints", type=int, default=10)
+    p.add_argument("--collect", action="store_true", help="每周期同时在合成 /proc 上采集（较慢）")
+    p.add_argument("--format", default="legacy", choices=("legacy", "raw", "msgpack"))
+    p.add_argument("--delta", action="store_true", help="同时进行增量编码")
+    p.add_argument("--cores", type=int, default=8)
+    p.add_argument("--nics", type=int, default=2)
+    p.add_argument("--pids", type=int, default=200)
+    p.add_argument("--max-growth-kb", type=float, default=512.0, help="允许的 RSS 增长（KB）")
+    p.set_defaults(func=bench_soak)
+
+    p = sub.add_parser("startup", help="冷 / 热启动耗时（静态信息缓存）")
+    p.add_argument("--runs", type=int, default=10)
+    p.set_defaults(func=bench_startup)
+
+    args = parser.parse_args()
+    if not getattr(args, "func", None):
+        parser.print_help()
+        return 0
+    return args.func(args) or 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
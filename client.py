@@ -1,586 +1,3934 @@
-# -*- encoding: utf-8 -*-
-# 外部变量/注释开始
-# 外部变量/注释结束
-"""
-@File    :   client.py    
-@Author  :   Guesser
-@Modify Time      @Version    @Description
-------------      --------    -----------
-2025/10/25 0:09    1.0         去掉类型提示,兼容旧版本python,整合linux和Windows
-"""
-
-
-"""
-最终版 client.py
-整合：
-  - Windows + Linux 全统一监控
-  - Energy-saving mode（节能模式）
-  - Windows 网速使用 psutil（性能稳定）
-  - Linux 过滤虚拟挂载点（snap/dev/shm/run/... 等）
-"""
-
-import sys
-import atexit
-import logging
-import os
-import signal
-import subprocess
-import threading
-from datetime import datetime, timedelta
-import platform
-import time
-import json
-import urllib.request
-# import pytz
-# tz = pytz.timezone("Asia/Shanghai")
-
-SYSTEM = platform.system()
-
-# Windows 需要 psutil
-if SYSTEM == "Windows":
-    import psutil
-else:
-    # Linux imports
-    pass
-
-logging.basicConfig(
-    format='[%(asctime)s] %(levelname)s     %(message)s',
-    level=logging.INFO
-)
-
-IS_EXITED = False
-
-
-def real_path():
-    if getattr(sys, 'frozen', False):
-        return os.path.dirname(os.path.realpath(sys.executable))
-    return os.path.dirname(os.path.realpath(__file__))
-
-
-def now_shanghai_str():
-    # 用 UTC + 8 计算“上海时间”
-    return (datetime.utcnow() + timedelta(hours=8)).strftime("%Y-%m-%d %H:%M:%S")
-
-# ============================
-# HTTP POST (标准库实现)
-# ============================
-def http_post(url, data, timeout=10):
-    try:
-        req = urllib.request.Request(
-            url=url,
-            data=json.dumps(data).encode('utf-8'),
-            headers={"Content-Type": "application/json"},
-            method="POST"
-        )
-        with urllib.request.urlopen(req, timeout=timeout) as resp:
-            return resp.read().decode()
-    except Exception as e:
-        return str(e)
-
-
-# ============================
-# 参数读取
-# ============================
-class ProcessParams:
-    def __init__(self):
-        self.secret_key = ''
-        self.api_address = ''
-        self.path = "config.txt"
-        self.real_path = real_path()
-
-    @staticmethod
-    def open(path):
-        with open(path, 'r', encoding="utf-8") as f:
-            return f.read()
-
-    @staticmethod
-    def write(path, content):
-        with open(path, 'w', encoding="utf-8") as f:
-            f.write(content)
-
-    def ask_user_params(self):
-        ask_list = ["api_address", "secret_key"]
-        result = ""
-        for item in ask_list:
-            user_input = input("请输入{}\n".format(item))
-            result += "{}={}\n".format(item, user_input)
-        self.write(os.path.join(self.real_path,self.path), result)
-
-    def check_params(self):
-        if self.secret_key and self.api_address and self.api_address.startswith("http"):
-            logging.info("参数检查通过")
-            return True
-        logging.error("密钥为空或 api 地址为空或 api 地址未以 http 开头")
-        return False
-
-    def read_params(self):
-        if os.path.exists(os.path.join(self.real_path, self.path)):
-            raw = self.open(os.path.join(self.real_path, self.path))
-            for line in raw.splitlines():
-                key, value = line.split("=")
-                if key.strip() == "secret_key":
-                    self.secret_key = value.strip()
-                if key.strip() == "api_address":
-                    self.api_address = value.strip()
-
-        if self.check_params():
-            return self.api_address, self.secret_key
-
-        self.ask_user_params()
-        return self.read_params()
-
-
-# ============================
-# 主监控类
-# ============================
-class SystemMonitor:
-    def __init__(self, secret_key, api_address, energy_saving_mode=False):
-        self.secret_key = secret_key
-        self.energy_saving_mode = energy_saving_mode
-        self.api_address = api_address
-        self.system_info_dict = {
-            "cpu_usage": None,
-            "cpu_model": None,
-            "cpu_count": None,
-            "cpu_freq": None,
-            "mem_total": None,
-            "mem_used": None,
-            "mem_percent": None,
-            "swap_total": None,
-            "swap_used": None,
-            "swap_percent": None,
-            "network_sent": None,
-            "network_received": None,
-            "network_pocket_sent": None,
-            "process_count": None,
-            "disks": [],
-            "uptime": None,
-            "sent_speed": None,
-            "recv_speed": None,
-            "os": self.get_os_pretty_name(),
-            "secret_key": secret_key
-        }
-
-        # 静态参数缓存
-        self.cached_static = {
-            "cpu_model": None,
-            "cpu_count": None,
-            "cpu_freq": None,
-            "disks": None,
-            "last_disk_update": 0
-        }
-
-        if SYSTEM == "Linux":
-            self.prev_net = self.read_net_dev()
-
-        threading.Thread(target=self.update_worker, daemon=True).start()
-
-    # ---------------------------------------
-    # 通用格式化方法
-    # ---------------------------------------
-    @staticmethod
-    def change_data_to_human_friendly(data):
-        for unit in ["B", "KB", "MB", "GB", "TB"]:
-            if data < 1024:
-                return "{} {}".format(round(data,2), unit)
-            data /= 1024
-        return "{} TB".format(round(data,2))
-
-    @staticmethod
-    def change_time_to_human_friendly(seconds):
-        units = [
-            # ("years", 365*86400),
-            # ("months", 30*86400),
-            ("days", 86400),
-            ("hours", 3600),
-            ("minutes", 60),
-            ("seconds", 1)
-        ]
-        result = []
-        for name, sec in units:
-            if seconds >= sec:
-                val = int(seconds // sec)
-                seconds %= sec
-                result.append("{}{}".format(val,name))
-        return " ".join(result) if result else "0s"
-
-    @staticmethod
-    def snake_to_small_camel(data):
-        new = {}
-        for k, v in data.items():
-            if "_" not in k:
-                new[k] = v
-                continue
-            parts = k.split("_")
-            new[parts[0] + ''.join(p.capitalize() for p in parts[1:])] = v
-        return new
-
-    # ---------------------------------------
-    # OS 名称
-    # ---------------------------------------
-    @staticmethod
-    def get_os_pretty_name():
-        if SYSTEM == "Windows":
-            try:
-                result = subprocess.check_output("wmic os get Caption", shell=True)
-                lines = result.decode().strip().split("\n")
-                if len(lines) > 1:
-                    return lines[1].strip()
-            except:
-                pass
-            return "Windows {}".format(platform.release())
-
-        elif SYSTEM == "Linux":
-            try:
-                with open("/etc/os-release") as f:
-                    info = {}
-                    for line in f:
-                        if "=" in line:
-                            k, v = line.strip().split("=", 1)
-                            info[k] = v.strip('"')
-                return "{} {}".format(info.get('NAME','Linux'), info.get('VERSION',''))
-            except:
-                return "Linux {}".format(platform.release())
-
-        return SYSTEM
-
-    # ===========================================================
-    # LINUX SECTION
-    # ===========================================================
-    def read_cpu_stat(self):
-        with open("/proc/stat") as f:
-            for line in f:
-                if line.startswith("cpu "):
-                    parts = line.split()
-                    return list(map(int, parts[1:]))
-        return [0]*10
-
-    def get_linux_cpu_usage(self):
-        s1 = self.read_cpu_stat()
-        time.sleep(0.1)
-        s2 = self.read_cpu_stat()
-        idle1, idle2 = s1[3], s2[3]
-        total1, total2 = sum(s1), sum(s2)
-        total_delta = total2 - total1
-        idle_delta = idle2 - idle1
-        if total_delta <= 0:
-            return 0
-        return round((1 - idle_delta/total_delta)*100, 2)
-
-    @staticmethod
-    def get_linux_cpu_model():
-        with open("/proc/cpuinfo") as f:
-            for line in f:
-                if "model name" in line:
-                    return line.split(":")[1].strip()
-        return "Unknown"
-
-    @staticmethod
-    def get_linux_cpu_freq():
-        with open("/proc/cpuinfo") as f:
-            for line in f:
-                if "cpu MHz" in line:
-                    return round(float(line.split(":")[1])/1000, 3)
-        return None
-
-    @staticmethod
-    def get_linux_memory():
-        mem = {}
-        with open("/proc/meminfo") as f:
-            for line in f:
-                key, value = line.split(":")
-                mem[key] = int(value.split()[0])*1024
-        mem_total = mem.get("MemTotal", 0)
-        mem_free = mem.get("MemAvailable", mem.get("MemFree", 0))
-        mem_used = mem_total - mem_free
-        swap_total = mem.get("SwapTotal", 0)
-        swap_free = mem.get("SwapFree", 0)
-        swap_used = swap_total - swap_free
-        mem_percent = round(mem_used/mem_total*100, 2)
-        swap_percent = round(swap_used/max(swap_total,1)*100,2)
-        return mem_total, mem_used, mem_percent, swap_total, swap_used, swap_percent
-
-    def read_net_dev(self):
-        bytes_sent = bytes_recv = packets_sent = 0
-        with open("/proc/net/dev") as f:
-            for line in f:
-                if ":" not in line:
-                    continue
-                iface, data = line.split(":")
-                parts = data.split()
-                bytes_recv += int(parts[0])
-                bytes_sent += int(parts[8])
-                packets_sent += int(parts[9])
-        return bytes_sent, bytes_recv, packets_sent
-
-    def get_linux_net_speed(self):
-        old_sent, old_recv, _ = self.prev_net
-        new_sent, new_recv, _ = self.read_net_dev()
-        self.prev_net = (new_sent, new_recv, 0)
-        return round((new_sent-old_sent)/1024,2), round((new_recv-old_recv)/1024,2)
-
-    @staticmethod
-    def get_linux_process_count():
-        return sum(1 for pid in os.listdir("/proc") if pid.isdigit())
-
-    @staticmethod
-    def get_linux_disks():
-        result = subprocess.check_output(
-            "df -B1 --output=target,size,used,fstype",
-            shell=True
-        ).decode().splitlines()
-
-        disks = []
-        for line in result[1:]:
-            parts = line.split()
-            if len(parts) != 4:
-                continue
-
-            mount, total, used, fstype = parts
-            total = int(total)
-            used = int(used)
-
-            # 过滤虚拟挂载
-            skip_fs = [
-                "tmpfs", "devtmpfs", "squashfs", "overlay"
-            ]
-            skip_prefix = [
-                "/snap", "/run", "/sys", "/dev/shm", "/boot/efi"
-            ]
-
-            if fstype in skip_fs:
-                continue
-
-            if any(mount.startswith(p) for p in skip_prefix):
-                continue
-
-            percent = round(used/max(total,1)*100,2)
-            disks.append((mount, total, used, percent))
-
-        return disks
-
-    @staticmethod
-    def get_linux_uptime():
-        with open("/proc/uptime") as f:
-            return float(f.read().split()[0])
-
-    def update_info_linux(self):
-        now = time.time()
-
-        # CPU usage
-        cpu_usage = self.get_linux_cpu_usage()
-
-        # static params
-        if not self.cached_static["cpu_model"]:
-            self.cached_static["cpu_model"] = self.get_linux_cpu_model()
-            self.cached_static["cpu_count"] = os.cpu_count()
-            self.cached_static["cpu_freq"] = self.get_linux_cpu_freq()
-
-        cpu_model = self.cached_static["cpu_model"]
-        cpu_count = self.cached_static["cpu_count"]
-        cpu_freq = self.cached_static["cpu_freq"]
-
-        mem_total, mem_used, mem_percent, swap_total, swap_used, swap_percent = self.get_linux_memory()
-
-        # if self.energy_saving_mode:
-        #     sent_speed = recv_speed = 0
-        #     net_sent, net_recv, packets_sent = self.prev_net
-        # else:
-        net_sent, net_recv, packets_sent = self.read_net_dev()
-        sent_speed, recv_speed = self.get_linux_net_speed()
-
-        if now - self.cached_static["last_disk_update"] > 60 or not self.cached_static["disks"]:
-            self.cached_static["disks"] = self.get_linux_disks()
-            self.cached_static["last_disk_update"] = now
-
-        disks = self.cached_static["disks"]
-
-        uptime = self.get_linux_uptime()
-
-        self.system_info_dict.update({
-            "cpu_usage": cpu_usage,
-            "cpu_model": cpu_model,
-            "cpu_count": cpu_count,
-            "cpu_freq": cpu_freq,
-            "mem_total": self.change_data_to_human_friendly(mem_total),
-            "mem_used": self.change_data_to_human_friendly(mem_used),
-            "mem_percent": mem_percent,
-            "swap_total": self.change_data_to_human_friendly(swap_total),
-            "swap_used": self.change_data_to_human_friendly(swap_used),
-            "swap_percent": swap_percent,
-            "network_sent": self.change_data_to_human_friendly(net_sent),
-            "network_received": self.change_data_to_human_friendly(net_recv),
-            "network_pocket_sent": packets_sent,
-            "process_count": self.get_linux_process_count(),
-            "disks": [
-                (d[0], self.change_data_to_human_friendly(d[1]),
-                 self.change_data_to_human_friendly(d[2]), d[3])
-                for d in disks
-            ],
-            "sent_speed": "{} KB/s".format(sent_speed),
-            "recv_speed": "{} KB/s".format(recv_speed),
-            "uptime": self.change_time_to_human_friendly(uptime),
-            "last_update": now_shanghai_str(),
-            "secret_key": self.secret_key
-        })
-
-    # ===========================================================
-    # WINDOWS SECTION
-    # ===========================================================
-    def get_windows_cpu(self):
-        cpu_usage = psutil.cpu_percent(interval=0.1)
-        cpu_model = platform.processor() or "Unknown"
-        cpu_count = psutil.cpu_count()
-        cpu_freq = psutil.cpu_freq()
-        return cpu_usage, cpu_model, cpu_count, round(cpu_freq.max/1000,3)
-
-    @staticmethod
-    def get_windows_memory():
-        mem = psutil.virtual_memory()
-        swap = psutil.swap_memory()
-        return mem.total, mem.used, mem.percent, swap.total, swap.used, swap.percent
-
-    @staticmethod
-    def get_windows_net():
-        io = psutil.net_io_counters()
-        return io.bytes_sent, io.bytes_recv, io.packets_sent
-
-    @staticmethod
-    def get_windows_process_count():
-        return len(psutil.pids())
-
-    @staticmethod
-    def get_windows_disks():
-        partitions = psutil.disk_partitions()
-        disks = []
-        for part in partitions:
-            try:
-                usage = psutil.disk_usage(part.mountpoint)
-                disks.append((part.mountpoint, usage.total, usage.used, usage.percent))
-            except:
-                continue
-        return disks
-
-    @staticmethod
-    def get_windows_uptime():
-        return time.time() - psutil.boot_time()
-
-    # Windows 实时网速（稳定版）
-    def get_windows_realtime_network(self, interval=1):
-        old = psutil.net_io_counters()
-        time.sleep(interval)
-        new = psutil.net_io_counters()
-        sent_speed = (new.bytes_sent - old.bytes_sent) / interval / 1024
-        recv_speed = (new.bytes_recv - old.bytes_recv) / interval / 1024
-        return round(sent_speed, 2), round(recv_speed, 2)
-
-    def update_info_windows(self):
-        now = time.time()
-
-        cpu_usage, cpu_model, cpu_count, cpu_freq = self.get_windows_cpu()
-        mem_total, mem_used, mem_percent, swap_total, swap_used, swap_percent = self.get_windows_memory()
-        net_sent, net_recv, net_pk_sent = self.get_windows_net()
-
-        # if self.energy_saving_mode:
-        #     sent_speed = recv_speed = 0
-        # else:
-        sent_speed, recv_speed = self.get_windows_realtime_network()
-
-        # 每 60 秒更新一次磁盘
-        if now - self.cached_static["last_disk_update"] > 60 or not self.cached_static["disks"]:
-            self.cached_static["disks"] = self.get_windows_disks()
-            self.cached_static["last_disk_update"] = now
-
-        disks = self.cached_static["disks"]
-        uptime = self.get_windows_uptime()
-
-        self.system_info_dict.update({
-            "cpu_usage": cpu_usage,
-            "cpu_model": cpu_model,
-            "cpu_count": cpu_count,
-            "cpu_freq": cpu_freq,
-            "mem_total": self.change_data_to_human_friendly(mem_total),
-            "mem_used": self.change_data_to_human_friendly(mem_used),
-            "mem_percent": mem_percent,
-            "swap_total": self.change_data_to_human_friendly(swap_total),
-            "swap_used": self.change_data_to_human_friendly(swap_used),
-            "swap_percent": swap_percent,
-            "network_sent": self.change_data_to_human_friendly(net_sent),
-            "network_received": self.change_data_to_human_friendly(net_recv),
-            "network_pocket_sent": net_pk_sent,
-            "process_count": self.get_windows_process_count(),
-            "disks": [
-                (d[0], self.change_data_to_human_friendly(d[1]),
-                 self.change_data_to_human_friendly(d[2]), d[3])
-                for d in disks
-            ],
-            "sent_speed": "{} KB/s".format(sent_speed),
-            "recv_speed": "{} KB/s".format(recv_speed),
-            "uptime": self.change_time_to_human_friendly(uptime),
-            "last_update": now_shanghai_str(),
-            "secret_key": self.secret_key
-        })
-
-    # ===========================================================
-    # 统一后台更新线程
-    # ===========================================================
-    def update_worker(self):
-        while True:
-            try:
-                if SYSTEM == "Linux":
-                    self.update_info_linux()
-                elif SYSTEM == "Windows":
-                    self.update_info_windows()
-                res = json.loads(http_post(
-                    "{}/api/host/update_host_details".format(self.api_address),
-                    data=self.snake_to_small_camel(self.system_info_dict),
-                    timeout=10
-                ))
-                if res["code"] != 200:
-                    logging.error("Failed to update host details: {}".format(res['message']))
-                    os._exit(0)
-                if self.energy_saving_mode:
-                    if SYSTEM == "Windows":
-                        time.sleep(2)
-                    else:
-                        time.sleep(3)
-                else:
-                    time.sleep(2)
-            except Exception as e:
-                logging.error(e)
-
-
-# ============================
-# 退出处理
-# ============================
-def exit_func():
-    global IS_EXITED
-    IS_EXITED = True
-
-
-def handle_exit(signum, frame):
-    exit_func()
-
-
-atexit.register(exit_func)
-signal.signal(signal.SIGINT, handle_exit)
-signal.signal(signal.SIGTERM, handle_exit)
-
-
-# ============================
-# 主流程
-# ============================
-def main(energy_saving_mode=False):
-    api_address, secret_key = ProcessParams().read_params()
-
-    # ⚠ 可根据需要设为 True
-    SystemMonitor(secret_key, api_address, energy_saving_mode=energy_saving_mode)
-    logging.info("客户端正常运行")
-    while True:
-        if IS_EXITED:
-            break
-        time.sleep(1)
-
-
-if __name__ == '__main__':
-    main(True)
+# -*- encoding: utf-8 -*-
+# 外部变量/注释开始
+# 外部变量/注释结束
+"""
+@File    :   client.py    
+@Author  :   Guesser
+@Modify Time      @Version    @Description
+------------      --------    -----------
+2025/10/25 0:09    1.0         去掉类型提示,兼容旧版本python,整合linux和Windows
+"""
+
+
+"""
+最终版 client.py
+整合：
+  - Windows + Linux 全统一监控
+  - Energy-saving mode（节能模式）
+  - Windows 网速使用 psutil（性能稳定）
+  - Linux 过滤虚拟挂载点（snap/dev/shm/run/... 等）
+"""
+
+import sys
+import atexit
+import bisect
+import contextlib
+import logging
+import os
+import signal
+import subprocess
+import threading
+from array import array
+from datetime import datetime, timedelta
+from operator import itemgetter, gt, ge, lt, le
+import platform
+import collections
+import queue
+import random
+import re
+import select
+import time
+import json
+import mmap
+import struct
+import zlib
+import gzip
+import fnmatch
+import hashlib
+import heapq
+import http.client
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+# import pytz
+# tz = pytz.timezone("Asia/Shanghai")
+
+SYSTEM = platform.system()
+
+
+class LazyModule:
+    """
+    首次访问属性时才导入模块，缩短启动时间
+    """
+    def __init__(self, name):
+        self.name = name
+        self.module = None
+
+    def __getattr__(self, attr):
+        if self.module is None:
+            self.module = __import__(self.name)
+        return getattr(self.module, attr)
+
+
+# Windows 需要 psutil（首次使用时导入）
+psutil = LazyModule("psutil")
+
+logging.basicConfig(
+    format='[%(asctime)s] %(levelname)s     %(message)s',
+    level=logging.INFO
+)
+
+IS_EXITED = False
+
+# /proc 与 /sys 的根目录：容器中挂载宿主机 /proc 或基准测试使用合成目录时可修改
+PROC_ROOT = "/proc"
+SYS_ROOT = "/sys"
+
+# /proc/stat 每个 cpu 行保留的计数器：
+# user nice system idle iowait irq softirq steal guest guest_nice
+CPU_STAT_FIELDS = 10
+# 每块网卡保留的计数器（/proc/net/dev 列序号）：
+# rx_bytes rx_packets rx_errs rx_drop tx_bytes tx_packets tx_errs tx_drop
+NET_DEV_COLUMNS = (0, 1, 2, 3, 8, 9, 10, 11)
+NET_FIELDS = len(NET_DEV_COLUMNS)
+# 每块磁盘保留的 I/O 计数器：reads read_bytes writes write_bytes busy_ms
+DISK_IO_FIELDS = 5
+
+# 磁盘过滤：虚拟文件系统 / 挂载点前缀（与原 df 方案保持一致）
+SKIP_FSTYPES = ("tmpfs", "devtmpfs", "squashfs", "overlay")
+SKIP_MOUNT_PREFIXES = ("/snap", "/run", "/sys", "/dev/shm", "/boot/efi")
+# 伪文件系统不调用 statvfs（df 默认同样跳过；autofs 调用 statvfs 还会触发自动挂载）
+PSEUDO_FSTYPES = (
+    "autofs", "proc", "sysfs", "cgroup", "cgroup2", "devpts", "mqueue", "debugfs",
+    "tracefs", "securityfs", "pstore", "bpf", "configfs", "fusectl", "hugetlbfs",
+    "binfmt_misc", "rpc_pipefs", "nsfs", "efivarfs", "selinuxfs",
+)
+# /proc/diskstats 中忽略的设备
+SKIP_BLOCK_PREFIXES = ("loop", "ram", "zram", "fd", "sr")
+
+
+def real_path():
+    if getattr(sys, 'frozen', False):
+        return os.path.dirname(os.path.realpath(sys.executable))
+    return os.path.dirname(os.path.realpath(__file__))
+
+
+def proc_path(*parts):
+    return os.path.join(PROC_ROOT, *parts)
+
+
+def sys_path(*parts):
+    return os.path.join(SYS_ROOT, *parts)
+
+
+def now_shanghai_str():
+    # 用 UTC + 8 计算“上海时间”
+    return (datetime.utcnow() + timedelta(hours=8)).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def shanghai_time_str(timestamp):
+    return (datetime.utcfromtimestamp(timestamp) + timedelta(hours=8)).strftime("%Y-%m-%d %H:%M:%S")
+
+# ============================
+# HTTP 长连接传输（http.client 实现）
+# ============================
+class HttpTransport:
+    """
+    每个 API 主机 (scheme, host:port) 复用一条 keep-alive 连接；
+    服务端主动断开时自动重连并重发一次；可选 gzip 压缩请求体。
+    非线程安全的连接由 self.lock 串行化。
+    generation 在每次（重新）建立连接时加一；依赖连接状态的调用方（增量上报）发送时带上预期的代号，
+    连接若已换成新的，请求不会发出，而是抛出 ConnectionRenewed。
+    """
+    # 复用旧连接时遇到这些异常，说明连接已被服务端关闭，可安全重连重发
+    RECONNECT_ERRORS = (
+        http.client.RemoteDisconnected,
+        http.client.CannotSendRequest,
+        http.client.ResponseNotReady,
+        ConnectionResetError,
+        ConnectionAbortedError,
+        BrokenPipeError,
+    )
+
+    def __init__(self, keep_alive=True, gzip_body=False, gzip_min_size=256, headers=None):
+        self.keep_alive = keep_alive
+        self.gzip_body = gzip_body
+        self.gzip_min_size = gzip_min_size
+        # 每个请求都携带的请求头
+        self.headers = headers or {}
+        self.connections = {}
+        self.lock = threading.Lock()
+        self.generation = 0
+        self.stats = {
+            "connections_opened": 0,
+            "requests": 0,
+            "payload_bytes": 0,
+            "wire_bytes": 0,
+            "received_bytes": 0,
+        }
+
+    def _connection(self, scheme, netloc, timeout):
+        key = (scheme, netloc)
+        conn = self.connections.get(key)
+        if conn is None:
+            if scheme == "https":
+                conn = http.client.HTTPSConnection(netloc, timeout=timeout)
+            else:
+                conn = http.client.HTTPConnection(netloc, timeout=timeout)
+            self.connections[key] = conn
+        elif conn.sock is not None and self.dropped(conn.sock):
+            conn.close()
+        conn.timeout = timeout
+        if conn.sock is not None:
+            conn.sock.settimeout(timeout)
+        return conn
+
+    def _request(self, conn, path, body, headers):
+        fresh = conn.sock is None
+        if fresh:
+            self.stats["connections_opened"] += 1
+            self.generation += 1
+        conn.request("POST", path, body=body, headers=headers)
+        resp = conn.getresponse()
+        content = resp.read()
+        if not self.keep_alive:
+            conn.close()
+        return resp, content
+
+    @staticmethod
+    def dropped(sock):
+        # 空闲的长连接变为可读，说明服务端已关闭连接（或发来了意外数据），不能再复用
+        try:
+            readable, _, _ = select.select([sock], [], [], 0)
+        except (OSError, ValueError):
+            return True
+        return bool(readable)
+
+    def next_generation(self, url):
+        """
+        下一次向 url 发送请求将使用的连接代号：现有长连接仍可用时不变，需要（重新）建连时加一。
+        短连接模式下每个请求都是新连接，代号每次都变。
+        """
+        parts = urlsplit(url)
+        with self.lock:
+            conn = self.connections.get((parts.scheme, parts.netloc))
+            if conn is not None and conn.sock is not None and not self.dropped(conn.sock):
+                return self.generation
+            return self.generation + 1
+
+    def post(self, url, body, headers=None, timeout=10, generation=None):
+        """
+        发送已编码的请求体，返回 (status, 响应 bytes)。
+        generation 不为 None 时，只在该代号的连接上发送。
+        """
+        parts = urlsplit(url)
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+
+        send_headers = {
+            "Connection": "keep-alive" if self.keep_alive else "close",
+        }
+        send_headers.update(self.headers)
+        if headers:
+            send_headers.update(headers)
+        self.stats["payload_bytes"] += len(body)
+        if self.gzip_body and len(body) >= self.gzip_min_size:
+            body = gzip.compress(body, compresslevel=5)
+            send_headers["Content-Encoding"] = "gzip"
+
+        with self.lock:
+            conn = self._connection(parts.scheme, parts.netloc, timeout)
+            reused = conn.sock is not None
+            if generation is not None and generation != self.generation + (not reused):
+                raise ConnectionRenewed("连接已重建，请求未发送")
+            try:
+                resp, content = self._request(conn, path, body, send_headers)
+            except self.RECONNECT_ERRORS:
+                conn.close()
+                if not reused:
+                    raise
+                if generation is not None:
+                    raise ConnectionRenewed("连接已被服务端关闭，请求未重发")
+                # 旧连接已失效：重新建连后重发一次
+                resp, content = self._request(conn, path, body, send_headers)
+            except Exception:
+                conn.close()
+                raise
+            self.stats["requests"] += 1
+            self.stats["wire_bytes"] += len(body)
+            self.stats["received_bytes"] += len(content)
+        return resp.status, content
+
+    def post_payload(self, url, data, timeout=10, wire_format="json", generation=None):
+        body, headers = encode_payload(data, wire_format)
+        status, content = self.post(url, body, headers=headers, timeout=timeout, generation=generation)
+        if status == 415 and wire_format != "json":
+            raise PayloadFormatRejected("服务端不支持 {} 格式".format(wire_format))
+        return content.decode()
+
+    def close(self):
+        with self.lock:
+            for conn in self.connections.values():
+                conn.close()
+            self.connections.clear()
+
+
+# ============================
+# 紧凑二进制编码（msgpack 子集）
+# ============================
+# 二进制格式版本，随请求头 X-Payload-Version 发送
+WIRE_VERSION = 1
+
+
+_FLOAT32 = struct.Struct(">f")
+
+
+def _msgpack_pack(obj, out):
+    if obj is None:
+        out.append(0xc0)
+    elif obj is True:
+        out.append(0xc3)
+    elif obj is False:
+        out.append(0xc2)
+    elif isinstance(obj, int):
+        if 0 <= obj < 0x80:
+            out.append(obj)
+        elif -0x20 <= obj < 0:
+            out.append(obj & 0xff)
+        elif 0 <= obj <= 0xff:
+            out += struct.pack(">BB", 0xcc, obj)
+        elif 0 <= obj <= 0xffff:
+            out += struct.pack(">BH", 0xcd, obj)
+        elif 0 <= obj <= 0xffffffff:
+            out += struct.pack(">BI", 0xce, obj)
+        elif 0 <= obj:
+            out += struct.pack(">BQ", 0xcf, obj)
+        elif -0x80 <= obj:
+            out += struct.pack(">Bb", 0xd0, obj)
+        elif -0x8000 <= obj:
+            out += struct.pack(">Bh", 0xd1, obj)
+        elif -0x80000000 <= obj:
+            out += struct.pack(">Bi", 0xd2, obj)
+        else:
+            out += struct.pack(">Bq", 0xd3, obj)
+    elif isinstance(obj, float):
+        # float32 能精确还原的值（如 0.5、12.25）用 float32 编码，其余用 float64，解码结果与原值一致
+        f32 = _FLOAT32.pack(obj) if -3.4e38 < obj < 3.4e38 else None
+        if f32 is not None and _FLOAT32.unpack(f32)[0] == obj:
+            out.append(0xca)
+            out += f32
+        else:
+            out += struct.pack(">Bd", 0xcb, obj)
+    elif isinstance(obj, str):
+        raw = obj.encode("utf-8")
+        n = len(raw)
+        if n < 32:
+            out.append(0xa0 | n)
+        elif n <= 0xff:
+            out += struct.pack(">BB", 0xd9, n)
+        elif n <= 0xffff:
+            out += struct.pack(">BH", 0xda, n)
+        else:
+            out += struct.pack(">BI", 0xdb, n)
+        out += raw
+    elif isinstance(obj, (bytes, bytearray)):
+        n = len(obj)
+        if n <= 0xff:
+            out += struct.pack(">BB", 0xc4, n)
+        elif n <= 0xffff:
+            out += struct.pack(">BH", 0xc5, n)
+        else:
+            out += struct.pack(">BI", 0xc6, n)
+        out += obj
+    elif isinstance(obj, (list, tuple)):
+        n = len(obj)
+        if n < 16:
+            out.append(0x90 | n)
+        elif n <= 0xffff:
+            out += struct.pack(">BH", 0xdc, n)
+        else:
+            out += struct.pack(">BI", 0xdd, n)
+        for item in obj:
+            _msgpack_pack(item, out)
+    elif isinstance(obj, dict):
+        n = len(obj)
+        if n < 16:
+            out.append(0x80 | n)
+        elif n <= 0xffff:
+            out += struct.pack(">BH", 0xde, n)
+        else:
+            out += struct.pack(">BI", 0xdf, n)
+        for k, v in obj.items():
+            _msgpack_pack(k, out)
+            _msgpack_pack(v, out)
+    else:
+        raise TypeError("无法编码的类型: {}".format(type(obj).__name__))
+
+
+def msgpack_dumps(obj):
+    out = bytearray()
+    _msgpack_pack(obj, out)
+    return bytes(out)
+
+
+# 定长类型：首字节 -> (struct 格式, 字节数)
+_MSGPACK_FIXED = {
+    0xcc: (">B", 1), 0xcd: (">H", 2), 0xce: (">I", 4), 0xcf: (">Q", 8),
+    0xd0: (">b", 1), 0xd1: (">h", 2), 0xd2: (">i", 4), 0xd3: (">q", 8),
+    0xca: (">f", 4), 0xcb: (">d", 8),
+}
+# 变长类型：首字节 -> (种类, 长度字段格式, 长度字段字节数)
+_MSGPACK_SIZED = {
+    0xd9: ("str", ">B", 1), 0xda: ("str", ">H", 2), 0xdb: ("str", ">I", 4),
+    0xc4: ("bin", ">B", 1), 0xc5: ("bin", ">H", 2), 0xc6: ("bin", ">I", 4),
+    0xdc: ("array", ">H", 2), 0xdd: ("array", ">I", 4),
+    0xde: ("map", ">H", 2), 0xdf: ("map", ">I", 4),
+}
+
+
+def _msgpack_unpack(buf, pos):
+    b = buf[pos]
+    pos += 1
+    if b < 0x80:
+        return b, pos
+    if b >= 0xe0:
+        return b - 0x100, pos
+    if b == 0xc0:
+        return None, pos
+    if b == 0xc2:
+        return False, pos
+    if b == 0xc3:
+        return True, pos
+    if b in _MSGPACK_FIXED:
+        fmt, size = _MSGPACK_FIXED[b]
+        return struct.unpack_from(fmt, buf, pos)[0], pos + size
+    if 0xa0 <= b <= 0xbf:
+        kind, n = "str", b & 0x1f
+    elif 0x90 <= b <= 0x9f:
+        kind, n = "array", b & 0x0f
+    elif 0x80 <= b <= 0x8f:
+        kind, n = "map", b & 0x0f
+    elif b in _MSGPACK_SIZED:
+        kind, fmt, size = _MSGPACK_SIZED[b]
+        n = struct.unpack_from(fmt, buf, pos)[0]
+        pos += size
+    else:
+        raise ValueError("无法解码的类型字节: 0x{:02x}".format(b))
+
+    if kind == "str":
+        return bytes(buf[pos:pos+n]).decode("utf-8"), pos + n
+    if kind == "bin":
+        return bytes(buf[pos:pos+n]), pos + n
+    if kind == "array":
+        items = []
+        for _ in range(n):
+            item, pos = _msgpack_unpack(buf, pos)
+            items.append(item)
+        return items, pos
+    result = {}
+    for _ in range(n):
+        key, pos = _msgpack_unpack(buf, pos)
+        result[key], pos = _msgpack_unpack(buf, pos)
+    return result, pos
+
+
+def msgpack_loads(buf):
+    obj, pos = _msgpack_unpack(buf, 0)
+    if pos != len(buf):
+        raise ValueError("msgpack 数据末尾有多余字节")
+    return obj
+
+
+# 上报编码：json（默认）/ msgpack
+WIRE_CONTENT_TYPES = {
+    "json": "application/json",
+    "msgpack": "application/msgpack",
+}
+
+
+def encode_payload(data, wire_format="json"):
+    """
+    返回 (请求体 bytes, 请求头)；二进制格式通过请求头声明格式与版本。
+    """
+    if wire_format == "msgpack":
+        return msgpack_dumps(data), {
+            "Content-Type": WIRE_CONTENT_TYPES["msgpack"],
+            "X-Payload-Format": "msgpack",
+            "X-Payload-Version": str(WIRE_VERSION),
+        }
+    return json.dumps(data).encode('utf-8'), {"Content-Type": WIRE_CONTENT_TYPES["json"]}
+
+
+def decode_payload(body, content_type):
+    if content_type.split(";")[0].strip() == WIRE_CONTENT_TYPES["msgpack"]:
+        return msgpack_loads(body)
+    return json.loads(body.decode("utf-8"))
+
+
+class PayloadFormatRejected(Exception):
+    """
+    服务端以 415 拒绝了二进制格式，调用方应回退为 JSON。
+    """
+
+
+class ConnectionRenewed(Exception):
+    """
+    请求要求的长连接已失效、需要新建连接，请求没有发出；调用方可按新连接重新编码后再发。
+    """
+
+
+class UploadDeferred(Exception):
+    """
+    服务端或中继暂时繁忙（429 / 503），本次上报按失败处理，稍后重试。
+    """
+
+
+# ============================
+# HTTP POST (标准库实现)
+# ============================
+# 客户端在请求头中携带 secret_key，中继据此在解压请求体之前完成鉴权
+SECRET_KEY_HEADER = "X-Secret-Key"
+# 请求失败：网络错误、HTTP 协议错误、响应不是 JSON（json.loads 抛出 ValueError）
+REQUEST_ERRORS = (OSError, http.client.HTTPException, ValueError)
+
+
+def http_post(url, data, timeout=10, transport=None, wire_format="json", generation=None):
+    """
+    返回响应文本；请求失败时抛出 REQUEST_ERRORS 中的异常。
+    """
+    if transport is not None:
+        return transport.post_payload(url, data, timeout=timeout, wire_format=wire_format, generation=generation)
+    import urllib.request
+    req = urllib.request.Request(
+        url=url,
+        data=json.dumps(data).encode('utf-8'),
+        headers={"Content-Type": "application/json"},
+        method="POST"
+    )
+    with urllib.request.urlopen(req, timeout=timeout) as resp:
+        return resp.read().decode()
+
+
+# ============================
+# 退避、熔断与多地址故障转移
+# ============================
+class Backoff:
+    """
+    带随机抖动的指数退避：第 n 次失败后等待 min(cap, base * 2^n) 的一半到全部之间的随机时长，
+    既保证间隔逐次拉长，又避免大量客户端在 API 恢复的同一时刻一起重试。
+    """
+    def __init__(self, base=1.0, cap=60.0):
+        self.base = base
+        self.cap = cap
+        self.failures = 0
+
+    def next(self):
+        delay = min(self.cap, self.base * 2 ** min(self.failures, 30))
+        self.failures += 1
+        return delay/2 + random.uniform(0, delay/2)
+
+    def reset(self):
+        self.failures = 0
+
+
+class CircuitBreaker:
+    """
+    连续失败 threshold 次后熔断（open），熔断期间不发请求，时长按 Backoff 递增；
+    到期后进入半开（half_open），只放行一个探测请求：成功则恢复（closed），失败则再次熔断。
+    探测请求 PROBE_TIMEOUT 秒内没有结果时再放行一个。
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+    PROBE_TIMEOUT = 30
+
+    def __init__(self, threshold=3, backoff=None):
+        self.threshold = max(threshold, 1)
+        self.backoff = backoff or Backoff(5, 300)
+        self.state = self.CLOSED
+        self.failures = 0
+        self.open_until = 0
+
+    def allow(self, now):
+        if self.state == self.CLOSED:
+            return True
+        if now < self.open_until:
+            return False
+        self.state = self.HALF_OPEN
+        self.open_until = now + self.PROBE_TIMEOUT
+        return True
+
+    def success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+        self.backoff.reset()
+
+    def failure(self, now):
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.threshold:
+            self.state = self.OPEN
+            self.open_until = now + self.backoff.next()
+
+
+class EndpointPool:
+    """
+    api_address 可配置多个地址（逗号分隔），按顺序优先使用，每个地址一个熔断器：
+    当前地址熔断后改用下一个可用地址；靠前的地址熔断到期后，下一个请求作为探测发往该地址，
+    成功即切回。探测请求不算切换，只有改用另一个正常（closed）地址时才记录并计数。线程安全。
+    """
+    def __init__(self, addresses, threshold=3, open_seconds=5.0, max_open_seconds=300.0):
+        self.addresses = addresses
+        self.breakers = [
+            CircuitBreaker(threshold, Backoff(open_seconds, max_open_seconds)) for _ in addresses
+        ]
+        self.lock = threading.Lock()
+        self.current = 0
+        self.failovers = 0
+
+    @staticmethod
+    def split(value):
+        return [address.strip() for address in value.split(",") if address.strip()]
+
+    def acquire(self):
+        """
+        返回本次请求使用的地址序号；所有地址都在熔断中时返回 None。
+        """
+        now = time.monotonic()
+        with self.lock:
+            for index, breaker in enumerate(self.breakers):
+                if breaker.allow(now):
+                    if index != self.current and breaker.state == breaker.CLOSED:
+                        logging.warning("API 地址切换：{} -> {}".format(
+                            self.addresses[self.current], self.addresses[index]))
+                        self.current = index
+                        self.failovers += 1
+                    return index
+        return None
+
+    def url(self, index, path):
+        return "{}{}".format(self.addresses[index], path)
+
+    def success(self, index):
+        with self.lock:
+            self.breakers[index].success()
+
+    def failure(self, index):
+        with self.lock:
+            breaker = self.breakers[index]
+            was_open = breaker.state != breaker.CLOSED
+            breaker.failure(time.monotonic())
+            if breaker.state == breaker.OPEN and not was_open:
+                logging.error("API 地址 {} 连续失败 {} 次，熔断 {:.1f} 秒".format(
+                    self.addresses[index], breaker.failures, breaker.open_until - time.monotonic()))
+
+    def open_count(self):
+        with self.lock:
+            return sum(breaker.state != breaker.CLOSED for breaker in self.breakers)
+
+
+# ============================
+# 增量上报（delta 协议）
+# ============================
+class DeltaEncoder:
+    """
+    首次上报（以及上报失败、重新建立连接、服务端要求重同步之后）发送带静态指纹的全量快照，
+    之后每次只发送与“上次已确认快照”相比发生变化的字段。
+    字段的值整体比较、整体发送（如磁盘列表），列表中删除的元素随新值一起生效；
+    增量无法表达顶层字段被删除，出现这种情况时改发全量。
+    """
+    # 参与指纹计算的静态字段（上传用的小驼峰 key）
+    STATIC_KEYS = ("os", "cpuModel", "cpuCount", "cpuFreq")
+    # 每次都必须携带的字段
+    ALWAYS_KEYS = ("secretKey", "lastUpdate")
+    # 服务端返回该 code（或 "resync": true）表示指纹不匹配，需要重发全量
+    RESYNC_CODE = 409
+
+    def __init__(self):
+        self.fingerprint = None
+        self.acked = None
+        self.pending = None
+
+    @classmethod
+    def make_fingerprint(cls, data):
+        raw = json.dumps([data.get(k) for k in cls.STATIC_KEYS], sort_keys=True)
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+
+    def encode(self, data):
+        fingerprint = self.make_fingerprint(data)
+        # data 为每次新生成的快照，之后不会再被修改，无需复制
+        self.pending = data
+        acked = self.acked
+        if acked is None or fingerprint != self.fingerprint or not acked.keys() <= data.keys():
+            self.fingerprint = fingerprint
+            payload = dict(data)
+            payload["payloadType"] = "full"
+        else:
+            payload = {
+                k: v for k, v in data.items()
+                if k in self.ALWAYS_KEYS or k not in acked or acked[k] != v
+            }
+            payload["payloadType"] = "delta"
+        payload["fingerprint"] = fingerprint
+        return payload
+
+    def ack(self):
+        self.acked = self.pending
+        self.pending = None
+
+    def reset(self):
+        self.acked = None
+        self.pending = None
+
+    @classmethod
+    def needs_resync(cls, res):
+        return res.get("code") == cls.RESYNC_CODE or bool(res.get("resync"))
+
+
+# ============================
+# 计数器采样（无 sleep 的速率计算）
+# ============================
+class CounterSampler:
+    """
+    跨采集周期保存上一次的计数器快照及 time.monotonic() 时间戳，
+    差值与速率按两次采集之间真实经过的时间计算，采集路径中不再 sleep。
+    """
+    def __init__(self):
+        self.snapshots = {}
+
+    def delta(self, name, values, now=None, layout=None):
+        """
+        记录新快照，返回 (与上次快照的差值列表, 经过秒数)；
+        values 可以是扁平的 array，整批差值在一次遍历中算出。
+        首次采样、计数器个数变化或 layout（如网卡名列表）变化时差值为 None。
+        """
+        if now is None:
+            now = time.monotonic()
+        prev = self.snapshots.get(name)
+        self.snapshots[name] = (now, values, layout)
+        if prev is None:
+            return None, 0.0
+        prev_time, prev_values, prev_layout = prev
+        elapsed = now - prev_time
+        if elapsed <= 0 or len(prev_values) != len(values) or prev_layout != layout:
+            return None, elapsed
+        return [new - old for old, new in zip(prev_values, values)], elapsed
+
+    def rates(self, name, values, now=None, layout=None):
+        """
+        每秒速率列表；计数器回绕/重置产生的负差值按 0 处理。
+        """
+        deltas, elapsed = self.delta(name, values, now, layout)
+        if deltas is None:
+            return None
+        return [max(d, 0) / elapsed for d in deltas]
+
+
+# ============================
+# 常驻打开的 /proc 文件
+# ============================
+class ProcFile:
+    """
+    常驻打开的 /proc 文件：每次从偏移 0 重新读入预分配的 bytearray，
+    不再重复 open / close，也不解码为 str。内容超过缓冲区时扩容一次。
+    """
+    def __init__(self, path, size=4096):
+        self.path = path
+        self.fd = None
+        self.buf = bytearray(size)
+        self.view = memoryview(self.buf)
+
+    def _read_into(self, offset):
+        if hasattr(os, "preadv"):
+            return os.preadv(self.fd, [self.view[offset:]], offset)
+        # 没有 preadv 的平台：lseek + readv
+        os.lseek(self.fd, offset, os.SEEK_SET)
+        return os.readv(self.fd, [self.view[offset:]])
+
+    def read(self):
+        """
+        返回内容长度，内容位于 self.buf[:长度]。
+        """
+        if self.fd is None:
+            self.fd = os.open(self.path, os.O_RDONLY)
+        size = 0
+        while True:
+            if size == len(self.buf):
+                # 缓冲区不足：扩容后从头重读，保证内容来自同一次生成
+                self.view.release()
+                self.buf = bytearray(len(self.buf)*2)
+                self.view = memoryview(self.buf)
+                size = 0
+            n = self._read_into(size)
+            size += n
+            # /proc 文件一次读取会尽量填满缓冲区，读到的少于剩余空间即已到末尾
+            if size < len(self.buf):
+                return size
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+class ProcReader:
+    """
+    按相对 PROC_ROOT 的路径懒打开并缓存 ProcFile；读取失败时重新打开一次。
+    """
+    def __init__(self):
+        self.files = {}
+
+    def read(self, *parts):
+        """
+        返回 (bytearray, 内容长度)；bytearray 会在下次读取时被覆盖。
+        """
+        f = self.files.get(parts)
+        if f is None:
+            f = self.files[parts] = ProcFile(proc_path(*parts))
+        # 先读再取 f.buf：读取时缓冲区可能被扩容替换
+        try:
+            n = f.read()
+        except OSError:
+            f.close()
+            n = f.read()
+        return f.buf, n
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+        self.files.clear()
+
+
+# ============================
+# 带超时保护的 statvfs
+# ============================
+class StatvfsGuard:
+    """
+    在独立线程中执行 os.statvfs，超时（如失联的 NFS）即放弃该挂载点，
+    之后 retry_after 秒内、以及卡住的调用返回之前直接跳过，不会拖住采集线程；
+    每个挂载点最多占用一个卡在内核调用里的线程。
+    """
+    def __init__(self, timeout=2.0, retry_after=600):
+        self.timeout = timeout
+        self.retry_after = retry_after
+        # {挂载点: (超时时刻, 卡住的请求的完成事件)}
+        self.hung = {}
+        self.requests = None
+
+    @staticmethod
+    def _run(requests):
+        while True:
+            path, box, done = requests.get()
+            try:
+                box.append(os.statvfs(path))
+            except OSError as e:
+                box.append(e)
+            done.set()
+
+    def statvfs(self, path):
+        hung = self.hung.get(path)
+        if hung is not None:
+            hung_at, stuck = hung
+            if not stuck.is_set() or time.monotonic() - hung_at < self.retry_after:
+                return None
+            del self.hung[path]
+
+        if self.requests is None:
+            self.requests = queue.Queue()
+            threading.Thread(target=self._run, args=(self.requests,), daemon=True).start()
+
+        box = []
+        done = threading.Event()
+        self.requests.put((path, box, done))
+        if not done.wait(self.timeout):
+            logging.warning("挂载点 {} statvfs 超时，暂时跳过".format(path))
+            self.hung[path] = (time.monotonic(), done)
+            # 旧线程卡在内核调用里，后续请求交给新线程
+            self.requests = None
+            return None
+        result = box[0]
+        if isinstance(result, OSError):
+            return None
+        return result
+
+
+# ============================
+# Top-N 进程表（增量缓存）
+# ============================
+class ProcessTable:
+    """
+    以 (pid, 启动时间) 为键缓存进程名、命令行和上次累计 CPU 时间；
+    每次扫描只读取 /proc/[pid]/stat，CPU 使用率按两次扫描间的增量计算，
+    只输出 CPU、内存各自的 Top N。新进程才会读取 cmdline。
+    """
+    # 命令行最多读取的字节数
+    CMDLINE_LIMIT = 512
+
+    def __init__(self, top_n=10):
+        self.top_n = top_n
+        # (pid, starttime) -> [name, cmdline, cpu_seconds]
+        self.cache = {}
+        self.last_scan = None
+        if SYSTEM == "Linux":
+            self.clock_ticks = float(os.sysconf("SC_CLK_TCK"))
+            self.page_size = os.sysconf("SC_PAGE_SIZE")
+
+    @classmethod
+    def read_cmdline(cls, pid):
+        try:
+            with open(proc_path(str(pid), "cmdline"), "rb") as f:
+                raw = f.read(cls.CMDLINE_LIMIT)
+        except OSError:
+            return ""
+        return raw.replace(b"\0", b" ").decode("utf-8", "replace").strip()
+
+    def _iter_linux(self):
+        """
+        产出 (pid, starttime, cpu_seconds, rss_bytes, raw_stat)
+        """
+        proc_root = PROC_ROOT
+        with os.scandir(proc_root) as entries:
+            for entry in entries:
+                pid = entry.name
+                if not pid.isdigit():
+                    continue
+                try:
+                    with open(os.path.join(proc_root, pid, "stat"), "rb") as f:
+                        raw = f.read()
+                except OSError:
+                    # 进程已退出
+                    continue
+                # 进程名可能包含空格和括号，以最后一个 ")" 为界
+                fields = raw[raw.rfind(b")")+2:].split()
+                if len(fields) < 22:
+                    continue
+                # fields[n] 对应 stat 第 n+3 个字段：utime=14 stime=15 starttime=22 rss=24
+                yield (
+                    int(pid), int(fields[19]),
+                    (int(fields[11]) + int(fields[12])) / self.clock_ticks,
+                    int(fields[21]) * self.page_size,
+                    raw
+                )
+
+    @staticmethod
+    def _iter_windows():
+        for p in psutil.process_iter(["pid", "name", "create_time", "cpu_times", "memory_info"]):
+            info = p.info
+            if info["cpu_times"] is None or info["memory_info"] is None:
+                continue
+            yield (
+                info["pid"], info["create_time"],
+                info["cpu_times"].user + info["cpu_times"].system,
+                info["memory_info"].rss,
+                p
+            )
+
+    @staticmethod
+    def _describe(pid, raw):
+        # 仅对新进程调用：解析进程名与命令行
+        if SYSTEM == "Linux":
+            name = raw[raw.find(b"(")+1:raw.rfind(b")")].decode("utf-8", "replace")
+            return name, ProcessTable.read_cmdline(pid)
+        try:
+            return raw.info["name"] or "", " ".join(raw.cmdline())[:ProcessTable.CMDLINE_LIMIT]
+        except Exception:
+            return raw.info["name"] or "", ""
+
+    def scan(self):
+        """
+        返回 (进程数, CPU Top N, 内存 Top N)，
+        每项为 (pid, 进程名, 命令行, CPU%（单核为 100）, RSS 字节)。
+        """
+        now = time.monotonic()
+        elapsed = now - self.last_scan if self.last_scan is not None else 0
+        self.last_scan = now
+
+        cache = self.cache
+        seen = {}
+        rows = []
+        entries = self._iter_linux() if SYSTEM == "Linux" else self._iter_windows()
+        for pid, started, cpu_seconds, rss, raw in entries:
+            key = (pid, started)
+            item = cache.get(key)
+            if item is None:
+                name, cmdline = self._describe(pid, raw)
+                item = [name, cmdline, cpu_seconds]
+                cpu = 0.0
+            else:
+                cpu = (cpu_seconds - item[2]) / elapsed * 100 if elapsed > 0 else 0.0
+                item[2] = cpu_seconds
+            seen[key] = item
+            rows.append((cpu, rss, pid, item))
+        # 已退出的进程随旧缓存一起丢弃
+        self.cache = seen
+
+        def fmt(row):
+            cpu, rss, pid, item = row
+            return pid, item[0], item[1], round(cpu, 2), rss
+
+        top_cpu = [fmt(r) for r in heapq.nlargest(self.top_n, rows, key=itemgetter(0))]
+        top_mem = [fmt(r) for r in heapq.nlargest(self.top_n, rows, key=itemgetter(1))]
+        return len(rows), top_cpu, top_mem
+
+
+# ============================
+# 本地落盘缓冲（固定大小的 mmap 环形文件）
+# ============================
+class SampleSpool:
+    """
+    上报失败的样本写入固定大小的内存映射文件，文件不会无限增长。
+    文件由固定大小的槽位组成，第 seq 条样本写入 seq % slot_count 号槽位，
+    写满后覆盖最旧的样本。每个槽位：
+        seq(u64) + length(u32) + crc32(u32) + zlib 压缩的 JSON
+    写入顺序为“先清槽头 -> 写数据 -> 写槽头”，进程在任意时刻被杀，
+    重启后该槽位都只会因 CRC 不匹配而被忽略，不影响其他样本。
+    """
+    MAGIC = b"HMSPOOL1"
+    HEADER = struct.Struct("<8sII16x")
+    SLOT_HEADER = struct.Struct("<QII")
+
+    def __init__(self, path, slot_count=1024, slot_size=8192):
+        self.path = path
+        self.slot_count = slot_count
+        self.slot_size = slot_size
+        self.lock = threading.Lock()
+        size = self.HEADER.size + slot_count*slot_size
+
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fresh = os.fstat(fd).st_size != size
+            if fresh:
+                os.ftruncate(fd, 0)
+                os.ftruncate(fd, size)
+            self.mm = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+
+        magic, file_slot_size, file_slot_count = self.HEADER.unpack_from(self.mm, 0)
+        if fresh or (magic, file_slot_size, file_slot_count) != (self.MAGIC, slot_size, slot_count):
+            # 新文件或槽位参数变化：整体重建
+            self.mm[:] = bytes(size)
+            self.HEADER.pack_into(self.mm, 0, self.MAGIC, slot_size, slot_count)
+            self.mm.flush()
+
+        # seq -> 槽位号，启动时扫描所有槽位重建
+        self.valid = {}
+        for slot in range(slot_count):
+            record = self._read_slot(slot)
+            if record is not None:
+                self.valid[record[0]] = slot
+        self.next_seq = max(self.valid) + 1 if self.valid else 1
+
+    def __len__(self):
+        return len(self.valid)
+
+    def _offset(self, slot):
+        return self.HEADER.size + slot*self.slot_size
+
+    @staticmethod
+    def _checksum(seq, payload):
+        return zlib.crc32(payload, zlib.crc32(struct.pack("<QI", seq, len(payload))))
+
+    def _read_slot(self, slot):
+        off = self._offset(slot)
+        seq, length, crc = self.SLOT_HEADER.unpack_from(self.mm, off)
+        if seq == 0 or seq % self.slot_count != slot or length > self.slot_size - self.SLOT_HEADER.size:
+            return None
+        start = off + self.SLOT_HEADER.size
+        payload = self.mm[start:start+length]
+        if self._checksum(seq, payload) != crc:
+            return None
+        return seq, payload
+
+    def append(self, data):
+        payload = zlib.compress(json.dumps(data).encode("utf-8"))
+        if len(payload) > self.slot_size - self.SLOT_HEADER.size:
+            logging.warning("样本过大（{} 字节），无法写入缓冲文件".format(len(payload)))
+            return False
+        with self.lock:
+            seq = self.next_seq
+            self.next_seq += 1
+            slot = seq % self.slot_count
+            off = self._offset(slot)
+            old = self._read_slot(slot)
+            if old is not None:
+                # 环形覆盖最旧的样本
+                self.valid.pop(old[0], None)
+            self.mm[off:off+self.SLOT_HEADER.size] = bytes(self.SLOT_HEADER.size)
+            start = off + self.SLOT_HEADER.size
+            self.mm[start:start+len(payload)] = payload
+            self.SLOT_HEADER.pack_into(self.mm, off, seq, len(payload), self._checksum(seq, payload))
+            self.mm.flush()
+            self.valid[seq] = slot
+        return True
+
+    def peek(self, count, newest_first=False):
+        """
+        取出最多 count 条样本（不删除），返回 [(seq, data), ...]。
+        """
+        result = []
+        with self.lock:
+            for seq in sorted(self.valid, reverse=newest_first):
+                if len(result) >= count:
+                    break
+                record = self._read_slot(self.valid[seq])
+                if record is None or record[0] != seq:
+                    self.valid.pop(seq, None)
+                    continue
+                result.append((seq, json.loads(zlib.decompress(record[1]).decode("utf-8"))))
+        return result
+
+    def remove(self, seqs):
+        with self.lock:
+            for seq in seqs:
+                slot = self.valid.pop(seq, None)
+                if slot is None:
+                    continue
+                off = self._offset(slot)
+                self.mm[off:off+self.SLOT_HEADER.size] = bytes(self.SLOT_HEADER.size)
+            self.mm.flush()
+
+    def close(self):
+        with self.lock:
+            self.mm.close()
+
+
+# ============================
+# 本地历史数据（RRD 式固定大小的 mmap 文件）
+# ============================
+class MetricHistory:
+    """
+    按多个分辨率保存指标历史，文件大小固定，与运行时长无关。
+    每个归档为 rows 行的环形数组，时间 t 落在第 (t // step) % rows 行；
+    样本到达时直接合并进各归档的当前行（增量平均值与最大值），不保存原始样本，
+    行的起始时间与 slot 不符时说明是一轮之前的旧数据，先清空再写。
+    文件布局：
+        头部(magic, 指标数, 归档数) + 指标名 + 各归档 (step, rows) + 各归档数据
+    每行：slot 起始时间(u32) + 每个指标 [平均值(f32), 最大值(f32), 样本数(u16)]
+    """
+    MAGIC = b"HMRRD001"
+    HEADER = struct.Struct("<8sHH")
+    NAME = struct.Struct("<32s")
+    ARCHIVE = struct.Struct("<II")
+    TIMESTAMP = struct.Struct("<I")
+    CELL = struct.Struct("<ffH")
+    MAX_COUNT = 0xFFFF
+
+    def __init__(self, path, metrics=None, archives=None):
+        self.path = path
+        if metrics is None:
+            # 只读打开（history 子命令），布局取自文件头
+            with open(path, "rb") as f:
+                self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            layout = self.read_header(self.mm)
+            if layout is None:
+                self.mm.close()
+                raise ValueError("{} 不是历史数据文件".format(path))
+            self.metrics, self.archives = layout
+            self.layout()
+            return
+
+        self.metrics = tuple(metrics)
+        self.archives = tuple(archives)
+        size = self.layout()
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fresh = os.fstat(fd).st_size != size
+            if fresh:
+                os.ftruncate(fd, 0)
+                os.ftruncate(fd, size)
+            self.mm = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+        if fresh or self.read_header(self.mm) != (self.metrics, self.archives):
+            # 新文件或指标 / 归档变化：整体重建
+            self.mm[:] = bytes(size)
+            self.write_header()
+            self.mm.flush()
+
+    @staticmethod
+    def parse_archives(value):
+        """
+        "1:3600,60:1440" -> ((1, 3600), (60, 1440))，按步长排序
+        """
+        archives = []
+        for item in value.split(","):
+            step, rows = item.split(":")
+            archives.append((int(step), int(rows)))
+        if not archives or any(step <= 0 or rows <= 0 for step, rows in archives):
+            raise ValueError("归档格式应为 \"步长秒数:行数,...\"")
+        return tuple(sorted(archives))
+
+    def layout(self):
+        """
+        计算每行结构与各归档的起始偏移，返回文件总大小。
+        """
+        self.row = struct.Struct("<I" + "ffH"*len(self.metrics))
+        offset = self.HEADER.size + self.NAME.size*len(self.metrics) + self.ARCHIVE.size*len(self.archives)
+        self.offsets = []
+        for step, rows in self.archives:
+            self.offsets.append(offset)
+            offset += rows*self.row.size
+        return offset
+
+    @classmethod
+    def read_header(cls, mm):
+        if len(mm) < cls.HEADER.size:
+            return None
+        magic, metric_count, archive_count = cls.HEADER.unpack_from(mm, 0)
+        pos = cls.HEADER.size
+        if magic != cls.MAGIC or len(mm) < pos + metric_count*cls.NAME.size + archive_count*cls.ARCHIVE.size:
+            return None
+        metrics = []
+        for _ in range(metric_count):
+            metrics.append(cls.NAME.unpack_from(mm, pos)[0].rstrip(b"\0").decode("utf-8"))
+            pos += cls.NAME.size
+        archives = []
+        for _ in range(archive_count):
+            archives.append(cls.ARCHIVE.unpack_from(mm, pos))
+            pos += cls.ARCHIVE.size
+        return tuple(metrics), tuple(archives)
+
+    def write_header(self):
+        self.HEADER.pack_into(self.mm, 0, self.MAGIC, len(self.metrics), len(self.archives))
+        pos = self.HEADER.size
+        for name in self.metrics:
+            self.NAME.pack_into(self.mm, pos, name.encode("utf-8"))
+            pos += self.NAME.size
+        for step, rows in self.archives:
+            self.ARCHIVE.pack_into(self.mm, pos, step, rows)
+            pos += self.ARCHIVE.size
+
+    def update(self, values, now=None):
+        """
+        把一个样本 {指标: 数值} 合并进各归档的当前行，缺失的指标不计数。
+        """
+        now = int(time.time() if now is None else now)
+        for (step, rows), base in zip(self.archives, self.offsets):
+            slot = now // step
+            off = base + (slot % rows)*self.row.size
+            row = list(self.row.unpack_from(self.mm, off))
+            if row[0] != slot*step:
+                row = [slot*step] + [0.0, 0.0, 0]*len(self.metrics)
+            for i, name in enumerate(self.metrics):
+                value = values.get(name)
+                j = 1 + i*3
+                count = row[j+2]
+                if value is None or count == self.MAX_COUNT:
+                    continue
+                row[j] += (value - row[j])/(count + 1)
+                row[j+1] = value if count == 0 else max(row[j+1], value)
+                row[j+2] = count + 1
+            self.row.pack_into(self.mm, off, *row)
+
+    def pick_archive(self, start, now, step=None):
+        """
+        指定 step 时返回该归档；否则返回覆盖 start 的最细归档，都不覆盖时返回跨度最长的归档。
+        按 slot 个数比较，避免浮点秒数的误差让整点区间（如 1 小时）错过对应归档。
+        """
+        for index, (archive_step, rows) in enumerate(self.archives):
+            if archive_step == step or (step is None and int(now)//archive_step - int(start)//archive_step <= rows):
+                return index
+        if step is not None:
+            raise ValueError("没有步长为 {} 秒的归档".format(step))
+        return max(range(len(self.archives)), key=lambda i: self.archives[i][0]*self.archives[i][1])
+
+    def read(self, metric, start, end, step=None, now=None):
+        """
+        返回 (步长, [(slot 起始时间, 平均值, 最大值, 样本数), ...])，按时间排序，只含有样本的行。
+        now 应与计算 start 时所用的当前时间一致，默认取 time.time()。
+        """
+        if metric not in self.metrics:
+            raise ValueError("历史数据中没有指标 {}".format(metric))
+        index = self.pick_archive(start, time.time() if now is None else now, step)
+        step, rows = self.archives[index]
+        base = self.offsets[index]
+        cell = self.TIMESTAMP.size + self.metrics.index(metric)*self.CELL.size
+        points = []
+        last = int(end) // step
+        for slot in range(max(int(start) // step, last - rows + 1), last + 1):
+            off = base + (slot % rows)*self.row.size
+            if self.TIMESTAMP.unpack_from(self.mm, off)[0] != slot*step:
+                continue
+            avg, peak, count = self.CELL.unpack_from(self.mm, off + cell)
+            if count:
+                points.append((slot*step, avg, peak, count))
+        return step, points
+
+    def size(self):
+        return len(self.mm)
+
+    def close(self):
+        self.mm.close()
+
+
+# ============================
+# 窗口聚合（min / max / avg / p95 / last）
+# ============================
+class P2Quantile:
+    """
+    P² 算法（Jain & Chlamtac, 1985）：只用 5 个标记点估计分位数，内存恒定。
+    """
+    def __init__(self, p=0.95):
+        self.p = p
+        self.heights = []
+        self.positions = [1, 2, 3, 4, 5]
+        self.desired = [1, 1 + 2*p, 1 + 4*p, 3 + 2*p, 5]
+        self.increments = [0, p/2, p, (1 + p)/2, 1]
+
+    def add(self, x):
+        q = self.heights
+        if len(q) < 5:
+            q.append(x)
+            q.sort()
+            return
+
+        n = self.positions
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = 0
+            while x >= q[k+1]:
+                k += 1
+        for i in range(k+1, 5):
+            n[i] += 1
+        for i in range(5):
+            self.desired[i] += self.increments[i]
+
+        # 调整中间 3 个标记点
+        for i in range(1, 4):
+            d = self.desired[i] - n[i]
+            if (d >= 1 and n[i+1] - n[i] > 1) or (d <= -1 and n[i-1] - n[i] < -1):
+                d = 1 if d > 0 else -1
+                # 抛物线插值，越界时退化为线性插值
+                qp = q[i] + d/(n[i+1] - n[i-1]) * (
+                    (n[i] - n[i-1] + d)*(q[i+1] - q[i])/(n[i+1] - n[i])
+                    + (n[i+1] - n[i] - d)*(q[i] - q[i-1])/(n[i] - n[i-1])
+                )
+                if not q[i-1] < qp < q[i+1]:
+                    qp = q[i] + d*(q[i+d] - q[i])/(n[i+d] - n[i])
+                q[i] = qp
+                n[i] += d
+
+    def value(self):
+        q = self.heights
+        if not q:
+            return None
+        if len(q) < 5:
+            return q[int(round(self.p*(len(q) - 1)))]
+        return q[2]
+
+
+class MetricWindow:
+    """
+    单个指标在一个上报窗口内的统计量，内存恒定。
+    """
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self.last = None
+        self.p95 = P2Quantile(0.95)
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        self.last = value
+        self.p95.add(value)
+
+    def summary(self):
+        return {
+            "min": round(self.min, 2),
+            "max": round(self.max, 2),
+            "avg": round(self.total/self.count, 2),
+            "p95": round(self.p95.value(), 2),
+            "last": round(self.last, 2),
+            "count": self.count,
+        }
+
+
+class WindowAggregator:
+    """
+    按指标名聚合一个上报窗口内的所有采样，summary() 后开始新窗口。
+    """
+    def __init__(self):
+        self.windows = {}
+
+    def add(self, metrics):
+        for name, value in metrics.items():
+            if value is None:
+                continue
+            window = self.windows.get(name)
+            if window is None:
+                window = self.windows[name] = MetricWindow()
+            window.add(value)
+
+    def summary(self):
+        result = {name: w.summary() for name, w in self.windows.items() if w.count}
+        self.windows = {}
+        return result
+
+
+# ============================
+# 采集 -> 上报 之间的有界队列
+# ============================
+class SampleQueue:
+    """
+    有界样本队列，队列满时按策略处理：
+      drop_oldest：丢弃最旧的待上报样本；
+      coalesce：用新样本替换队尾的待上报样本（只保留最新状态）。
+    """
+    POLICIES = ("drop_oldest", "coalesce")
+
+    def __init__(self, maxsize=10, policy="drop_oldest"):
+        if policy not in self.POLICIES:
+            logging.error("未知的队列策略 {}，使用 drop_oldest".format(policy))
+            policy = "drop_oldest"
+        self.maxsize = max(maxsize, 1)
+        self.policy = policy
+        self.items = collections.deque()
+        self.cond = threading.Condition()
+        self.stats = {"enqueued": 0, "dropped": 0, "coalesced": 0}
+
+    def put(self, item):
+        with self.cond:
+            self.stats["enqueued"] += 1
+            if len(self.items) >= self.maxsize:
+                if self.policy == "coalesce":
+                    self.items[-1] = item
+                    self.stats["coalesced"] += 1
+                    return
+                self.items.popleft()
+                self.stats["dropped"] += 1
+            self.items.append(item)
+            self.cond.notify()
+
+    def get(self, timeout=None):
+        with self.cond:
+            if not self.cond.wait_for(lambda: self.items, timeout):
+                return None
+            return self.items.popleft()
+
+    def __len__(self):
+        return len(self.items)
+
+
+# ============================
+# 调度：固定频率节拍 + 自适应采样间隔
+# ============================
+class TickScheduler:
+    """
+    基于 time.monotonic() 的固定频率调度，节拍对齐到 起点 + k*interval，
+    周期不会因采集/上报耗时而漂移；错过的节拍直接跳过，不会连续补跑。
+    """
+    def __init__(self, interval):
+        self.interval = interval
+        # 当前节拍的时间点
+        self.tick = time.monotonic()
+        self.skipped = 0
+
+    def wait(self):
+        """
+        睡眠到下一个节拍，返回本次跳过的节拍数。
+        """
+        self.tick += self.interval
+        now = time.monotonic()
+        skipped = 0
+        if now > self.tick:
+            skipped = int((now - self.tick) // self.interval) + 1
+            self.tick += skipped*self.interval
+            self.skipped += skipped
+        time.sleep(max(self.tick - now, 0))
+        return skipped
+
+
+class AdaptiveInterval:
+    """
+    指标平稳时逐步拉长采样间隔（每次 ×1.5，不超过 ceiling），
+    CPU / 内存（百分点）或网速（KB/s）相对参考值的变化超过阈值时立即回到最快频率。
+    """
+    GROWTH = 1.5
+
+    def __init__(self, fast, ceiling, threshold=5.0, net_threshold=100.0):
+        self.fast = fast
+        self.ceiling = max(ceiling, fast)
+        self.thresholds = {
+            "cpu_usage": threshold,
+            "mem_percent": threshold,
+            "sent_speed": net_threshold,
+            "recv_speed": net_threshold,
+        }
+        self.interval = fast
+        self.reference = None
+
+    def update(self, metrics):
+        reference = self.reference
+        changed = reference is None or any(
+            metrics.get(k) is not None and reference.get(k) is not None
+            and abs(metrics[k] - reference[k]) > limit
+            for k, limit in self.thresholds.items()
+        )
+        if changed:
+            # 以变化后的值作为新的参考，缓慢漂移同样会被发现
+            self.reference = dict(metrics)
+            self.interval = self.fast
+        else:
+            self.interval = min(self.interval*self.GROWTH, self.ceiling)
+        return self.interval
+
+
+# ============================
+# 客户端自身遥测
+# ============================
+class LatencyHistogram:
+    """
+    Prometheus 风格的延迟直方图（秒）；另记录自上次 window() 以来的均值与最大值。
+    """
+    BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self):
+        self.counts = [0]*(len(self.BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.window_sum = 0.0
+        self.window_count = 0
+        self.window_max = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(self.BUCKETS, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+        self.window_sum += seconds
+        self.window_count += 1
+        self.window_max = max(self.window_max, seconds)
+
+    def window(self):
+        """
+        返回 (平均毫秒, 最大毫秒) 并开始新窗口；窗口内无数据时返回 None。
+        """
+        if not self.window_count:
+            return None
+        result = (round(self.window_sum/self.window_count*1000, 2), round(self.window_max*1000, 2))
+        self.window_sum = 0.0
+        self.window_count = 0
+        self.window_max = 0.0
+        return result
+
+
+class AgentTelemetry:
+    """
+    记录各采集阶段与上报的耗时直方图、成功/失败计数以及进程自身的 RSS 与 CPU 时间，
+    可渲染为 Prometheus 文本格式，也可汇总进上报数据。
+    """
+    PREFIX = "hm_agent"
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # (指标名, 标签名, 标签值) -> LatencyHistogram
+        self.histograms = {}
+        # (指标名, 标签名, 标签值) -> 计数
+        self.counters = {}
+
+    def observe(self, metric, label, value, seconds):
+        key = (metric, label, value)
+        with self.lock:
+            hist = self.histograms.get(key)
+            if hist is None:
+                hist = self.histograms[key] = LatencyHistogram()
+            hist.observe(seconds)
+
+    def inc(self, metric, label=None, value=None, amount=1):
+        key = (metric, label, value)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def counter(self, metric, label=None, value=None):
+        return self.counters.get((metric, label, value), 0)
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe("stage_duration_seconds", "stage", name, time.perf_counter() - start)
+
+    @staticmethod
+    def process_usage():
+        """
+        返回 (RSS 字节, 累计 CPU 秒数)
+        """
+        times = os.times()
+        cpu_seconds = times.user + times.system
+        rss = None
+        if SYSTEM == "Windows":
+            rss = psutil.Process().memory_info().rss
+        else:
+            try:
+                # 读取自身信息，与 PROC_ROOT 配置无关
+                with open("/proc/self/statm") as f:
+                    rss = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+            except (OSError, ValueError, IndexError):
+                pass
+        return rss, cpu_seconds
+
+    def summary(self):
+        """
+        上报用的摘要：每个阶段 / 上报结果在本窗口内的平均与最大耗时（毫秒）、计数与进程资源。
+        """
+        with self.lock:
+            latency = {}
+            for (metric, label, value), hist in self.histograms.items():
+                window = hist.window()
+                if window is not None:
+                    name = value if metric == "stage_duration_seconds" else "upload_" + value
+                    latency[name] = {"avgMs": window[0], "maxMs": window[1]}
+        rss, cpu_seconds = self.process_usage()
+        return {
+            "latency": latency,
+            "uploads_ok": self.counter("uploads_total", "result", "success"),
+            "uploads_failed": self.counter("uploads_total", "result", "failure"),
+            "uploads_skipped": self.counter("uploads_total", "result", "skipped"),
+            "rss": rss,
+            "cpu_seconds": round(cpu_seconds, 2),
+        }
+
+    def render(self, gauges=None):
+        """
+        Prometheus 文本格式（exposition format 0.0.4）。
+        gauges：额外的 {指标名: 数值}，如队列深度。
+        """
+        lines = []
+        with self.lock:
+            typed = set()
+            for (metric, label, value), hist in sorted(self.histograms.items()):
+                name = "{}_{}".format(self.PREFIX, metric)
+                if name not in typed:
+                    typed.add(name)
+                    lines.append("# TYPE {} histogram".format(name))
+                cumulative = 0
+                for bound, count in zip(self.BUCKETS_LABELS, hist.counts):
+                    cumulative += count
+                    lines.append('{}_bucket{{{}="{}",le="{}"}} {}'.format(name, label, value, bound, cumulative))
+                lines.append('{}_sum{{{}="{}"}} {}'.format(name, label, value, repr(hist.sum)))
+                lines.append('{}_count{{{}="{}"}} {}'.format(name, label, value, hist.count))
+            for (metric, label, value), count in sorted(self.counters.items(), key=lambda kv: str(kv[0])):
+                name = "{}_{}".format(self.PREFIX, metric)
+                if name not in typed:
+                    typed.add(name)
+                    lines.append("# TYPE {} counter".format(name))
+                if label is None:
+                    lines.append("{} {}".format(name, count))
+                else:
+                    lines.append('{}{{{}="{}"}} {}'.format(name, label, value, count))
+
+        rss, cpu_seconds = self.process_usage()
+        all_gauges = {"cpu_seconds_total": round(cpu_seconds, 3)}
+        if rss is not None:
+            all_gauges["resident_memory_bytes"] = rss
+        all_gauges.update(gauges or {})
+        for metric, number in all_gauges.items():
+            name = "{}_{}".format(self.PREFIX, metric)
+            kind = "counter" if metric.endswith("_total") else "gauge"
+            lines.append("# TYPE {} {}".format(name, kind))
+            lines.append("{} {}".format(name, number))
+        return "\n".join(lines) + "\n"
+
+    BUCKETS_LABELS = tuple(repr(b) for b in LatencyHistogram.BUCKETS) + ("+Inf",)
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """
+    本地 /metrics 端点，server.monitor 为 SystemMonitor 实例。
+    """
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.server.monitor.render_metrics().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_metrics(owner, port):
+    """
+    在 127.0.0.1:port 上提供 owner.render_metrics() 的内容，返回 server；监听失败返回 None。
+    """
+    try:
+        server = ThreadingHTTPServer(("127.0.0.1", port), MetricsHandler)
+    except OSError as e:
+        logging.error("指标端口 {} 监听失败: {}".format(port, e))
+        return None
+    server.daemon_threads = True
+    server.monitor = owner
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logging.info("本地指标端点：http://127.0.0.1:{}/metrics".format(port))
+    return server
+
+
+# ============================
+# 采集项注册表
+# ============================
+class Collector:
+    """
+    一个采集项，func() 返回 {HostSample 字段: 值}。
+    interval：刷新间隔（秒），0 表示每个采样周期都采集；
+    static：只成功采集一次，之后一直沿用；
+    ttl：刷新失败时沿用旧结果的最长时间（秒），超过后清空，None 表示不过期。
+    """
+    # 采样周期的抖动容差，避免间隔恰好为采样周期整数倍时被推迟一个周期
+    DUE_SLACK = 0.1
+    # 静态采集项失败后的重试间隔（秒）
+    STATIC_RETRY = 60
+
+    def __init__(self, name, func, interval=0, ttl=None, static=False):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.ttl = ttl
+        self.static = static
+        self.values = {}
+        self.updated = None
+        self.next_due = 0.0
+
+    def due(self, now):
+        if self.static and self.updated is not None:
+            return False
+        return now + self.DUE_SLACK >= self.next_due
+
+    def collect(self, now):
+        self.values = self.func()
+        self.updated = now
+        self.next_due = now + self.interval
+
+    def failed(self, now):
+        self.next_due = now + (self.STATIC_RETRY if self.static else self.interval)
+        if self.ttl is not None and self.updated is not None and now - self.updated > self.ttl:
+            # 旧结果过期：列表清空，其余置为 None
+            self.values = {
+                key: [] if isinstance(value, (list, tuple)) else None
+                for key, value in self.values.items()
+            }
+
+
+class CollectorRegistry:
+    """
+    按注册顺序保存采集项，collect() 只运行到期的采集项，
+    其余沿用上次结果；单个采集项失败不影响其它采集项。
+    """
+    def __init__(self, telemetry):
+        self.telemetry = telemetry
+        self.collectors = collections.OrderedDict()
+
+    def register(self, name, func, interval=0, ttl=None, static=False):
+        if ttl is None and not static:
+            # 默认容忍连续 3 次刷新失败，且至少 10 秒
+            ttl = max(interval*3, 10)
+        self.collectors[name] = Collector(name, func, interval, ttl, static)
+
+    def configure(self, enabled=None, intervals=None):
+        """
+        enabled：启用的采集项名称，为空表示全部；intervals：{名称: 刷新间隔（秒）}。
+        """
+        intervals = intervals or {}
+        for name in list(enabled or []) + list(intervals):
+            if name not in self.collectors:
+                logging.warning("未知的采集项: {}".format(name))
+        if enabled:
+            for name in list(self.collectors):
+                if name not in enabled:
+                    del self.collectors[name]
+        for name, interval in intervals.items():
+            collector = self.collectors.get(name)
+            if collector is None:
+                continue
+            collector.interval = interval
+            if collector.ttl is not None:
+                collector.ttl = max(collector.ttl, interval*3)
+
+    @staticmethod
+    def parse_intervals(value):
+        """
+        解析 "disks=60,top_processes=10" 形式的刷新间隔配置
+        """
+        intervals = {}
+        for item in value.split(","):
+            name, sep, seconds = item.partition("=")
+            if not sep:
+                continue
+            try:
+                intervals[name.strip()] = float(seconds)
+            except ValueError:
+                logging.error("采集项 {} 的刷新间隔无效: {}".format(name.strip(), seconds))
+        return intervals
+
+    def names(self):
+        return list(self.collectors)
+
+    def static_values(self):
+        """
+        已成功采集的静态采集项：{名称: 结果}
+        """
+        return {
+            name: collector.values
+            for name, collector in self.collectors.items()
+            if collector.static and collector.updated is not None
+        }
+
+    def preload(self, values):
+        """
+        用缓存的结果填充静态采集项，使其不再执行。
+        """
+        now = time.monotonic()
+        for name, collector_values in values.items():
+            collector = self.collectors.get(name)
+            if collector is not None and collector.static and isinstance(collector_values, dict):
+                collector.values = collector_values
+                collector.updated = now
+
+    def collect(self, sample):
+        """
+        把所有采集项的结果（未到期的为缓存值）写入 sample。
+        """
+        now = time.monotonic()
+        for collector in self.collectors.values():
+            if collector.due(now):
+                try:
+                    with self.telemetry.stage(collector.name):
+                        collector.collect(now)
+                except Exception as e:
+                    collector.failed(now)
+                    self.telemetry.inc("collector_errors_total", "collector", collector.name)
+                    logging.error("采集项 {} 失败: {}".format(collector.name, e))
+            sample.update(collector.values)
+
+
+# ============================
+# 静态信息缓存
+# ============================
+class StaticFactsCache:
+    """
+    静态采集项（OS 名称、CPU 型号等）的结果按开机标识保存到文件，
+    客户端重启而系统未重启时直接复用，不再调用 wmic、解析 /proc/cpuinfo。
+    """
+    VERSION = 1
+
+    def __init__(self, path, boot_id):
+        self.path = path
+        self.boot_id = boot_id
+
+    def load(self):
+        """
+        返回 {采集项名称: 结果}；文件不存在、已损坏或开机标识不一致时返回空字典。
+        """
+        if not self.boot_id:
+            return {}
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                stored = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if not isinstance(stored, dict) or stored.get("version") != self.VERSION \
+                or stored.get("boot_id") != self.boot_id:
+            return {}
+        facts = stored.get("facts")
+        return facts if isinstance(facts, dict) else {}
+
+    def save(self, facts):
+        if not self.boot_id:
+            return
+        tmp = self.path + ".tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"version": self.VERSION, "boot_id": self.boot_id, "facts": facts}, f, ensure_ascii=False)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            logging.warning("静态信息缓存写入失败: {}".format(e))
+
+
+# ============================
+# 本地告警规则
+# ============================
+ALERT_PATH = "/api/host/alert"
+
+
+class AlertRule:
+    """
+    一条告警规则，如 "cpu_usage > 90 for 30s clear 80"：
+    条件在连续 for 秒内的每次采样都满足时触发，越过 clear（默认等于阈值）时恢复。
+    只保存条件开始满足的时刻与当前状态，每次评估 O(1)，不保留历史数据。
+    """
+    PATTERN = re.compile(
+        r"^\s*(?P<metric>[a-z0-9_]+)(?::(?P<target>\S+))?\s*(?P<op>>=|<=|>|<)\s*(?P<threshold>-?\d+(?:\.\d+)?)"
+        r"(?:\s+for\s+(?P<duration>\d+(?:\.\d+)?)s?)?"
+        r"(?:\s+clear\s+(?P<clear>-?\d+(?:\.\d+)?))?\s*$"
+    )
+    OPERATORS = {">": gt, ">=": ge, "<": lt, "<=": le}
+    # 由列表字段派生的指标：名称 -> (字段, 数值列)；"名称:挂载点/设备" 取单项，否则取各项最大值
+    DERIVED = {"disk_percent": ("disks", 3), "disk_util": ("disk_io", 5)}
+
+    def __init__(self, text, metric, op, threshold, duration=0.0, clear=None, target=None):
+        self.text = text
+        self.metric = metric
+        self.target = target
+        self.source = self.DERIVED.get(metric)
+        self.check = self.OPERATORS[op]
+        self.threshold = threshold
+        self.duration = duration
+        self.clear = threshold if clear is None else clear
+        self.firing = False
+        # 条件开始满足 / 触发的时刻（time.monotonic）
+        self.since = None
+        self.fired_at = None
+
+    @classmethod
+    def parse(cls, text):
+        text = text.strip()
+        m = cls.PATTERN.match(text)
+        if m is None:
+            raise ValueError("格式应为 \"指标 > 阈值 [for 秒数s] [clear 恢复阈值]\"")
+        metric, target, op = m.group("metric"), m.group("target"), m.group("op")
+        threshold = float(m.group("threshold"))
+        clear = m.group("clear")
+        clear = None if clear is None else float(clear)
+        if target is not None and metric not in cls.DERIVED:
+            raise ValueError("只有 {} 支持 \":挂载点/设备\"".format(" / ".join(cls.DERIVED)))
+        # 恢复阈值必须位于触发阈值的另一侧，形成回差
+        if clear is not None and (clear - threshold)*(1 if op[0] == ">" else -1) > 0:
+            raise ValueError("恢复阈值 {} 与触发方向不符".format(m.group("clear")))
+        return cls(text, metric, op, threshold, float(m.group("duration") or 0), clear, target)
+
+    def known(self, info):
+        return (self.source[0] if self.source else self.metric) in info
+
+    def value(self, info):
+        if self.source is None:
+            return info.get(self.metric)
+        key, column = self.source
+        values = [row[column] for row in info.get(key) or () if self.target is None or row[0] == self.target]
+        return max(values) if values else None
+
+    def evaluate(self, info, now):
+        """
+        状态变化时返回事件 dict，否则返回 None；指标缺失时保持原状态。
+        """
+        value = self.value(info)
+        if not isinstance(value, (int, float)):
+            return None
+        if self.firing:
+            if self.check(value, self.clear):
+                return None
+            self.firing = False
+            self.since = None
+            return self.event("resolved", value, self.clear, now - self.fired_at)
+        if not self.check(value, self.threshold):
+            self.since = None
+            return None
+        if self.since is None:
+            self.since = now
+        if now - self.since < self.duration:
+            return None
+        self.firing = True
+        self.fired_at = now
+        return self.event("firing", value, self.threshold, now - self.since)
+
+    def event(self, state, value, threshold, duration):
+        return {
+            "rule": self.text,
+            "metric": self.metric,
+            "target": self.target,
+            "state": state,
+            "value": value,
+            "threshold": threshold,
+            "duration": round(duration, 1),
+            "time": now_shanghai_str(),
+        }
+
+
+class AlertEngine:
+    """
+    每次采样后逐条评估告警规则；触发 / 恢复事件放入有界队列，
+    由独立的告警线程立即推送，不等待下一个上报周期。
+    """
+    QUEUE_SIZE = 100
+    RETRIES = 3
+
+    def __init__(self, rules, telemetry):
+        self.rules = rules
+        self.telemetry = telemetry
+        self.events = queue.Queue(self.QUEUE_SIZE)
+        self.checked = False
+
+    @staticmethod
+    def parse_rules(text):
+        """
+        每行一条规则，无效的规则记录日志后忽略。
+        """
+        rules = []
+        for line in text.splitlines():
+            if not line.strip():
+                continue
+            try:
+                rules.append(AlertRule.parse(line))
+            except ValueError as e:
+                logging.error("告警规则无效（{}）：{}".format(e, line.strip()))
+        return rules
+
+    def firing(self):
+        return sum(rule.firing for rule in self.rules)
+
+    def evaluate(self, info, now=None):
+        now = time.monotonic() if now is None else now
+        if not self.checked:
+            # 首次评估时提示拼写错误等永远取不到值的规则
+            self.checked = True
+            for rule in self.rules:
+                if not rule.known(info):
+                    logging.warning("告警规则引用了未采集的指标：{}".format(rule.text))
+        for rule in self.rules:
+            event = rule.evaluate(info, now)
+            if event is None:
+                continue
+            self.telemetry.inc("alerts_total", "state", event["state"])
+            logging.warning("告警{}：{}（当前值 {}）".format(
+                "触发" if event["state"] == "firing" else "恢复", rule.text, event["value"]))
+            try:
+                self.events.put_nowait(event)
+            except queue.Full:
+                self.telemetry.inc("alerts_dropped_total")
+                logging.error("告警队列已满，丢弃：{}".format(rule.text))
+
+    def worker(self, post):
+        """
+        post(event) 返回 "ok" / "retry" / "drop"；retry 时按带抖动的指数退避（约 1、2、4 秒）重试。
+        """
+        while True:
+            event = self.events.get()
+            backoff = Backoff(1, 4)
+            for _ in range(self.RETRIES):
+                if post(event) != "retry":
+                    break
+                time.sleep(backoff.next())
+            else:
+                self.telemetry.inc("alerts_dropped_total")
+                logging.error("告警推送失败，已放弃：{}".format(event["rule"]))
+
+
+# ============================
+# 参数读取
+# ============================
+# config.txt 中的可选项及默认值，按默认值类型解析
+DEFAULT_OPTIONS = {
+    "keep_alive": True,     # 复用 HTTP 长连接
+    "payload_format": "legacy",     # legacy（易读字符串）/ raw（数值，JSON）/ msgpack（数值，二进制）
+    "gzip": False,          # gzip 压缩请求体（需服务端支持 Content-Encoding: gzip）
+    "delta_upload": False,  # 增量上报：首次全量，之后只发送变化字段
+    "proc_root": "/proc",   # /proc 所在目录（容器中可指向挂载的宿主机 /proc）
+    "sys_root": "/sys",     # /sys 所在目录
+    "cgroup_path": "auto",  # 统计的 cgroup v2：auto（仅容器内统计自身所在 cgroup）/ self / off / 目录路径
+    "net_include": "",      # 参与统计的网卡（逗号分隔的通配符），为空表示全部
+    "net_exclude": "lo,docker*,veth*,br-*,virbr*,cni*,flannel*,Loopback*",  # 排除的网卡
+    "process_top_n": 0,     # 上报 CPU / 内存占用前 N 的进程，0 表示关闭
+    "process_interval": 5,  # 进程表扫描间隔（秒），即 top_processes 采集项的刷新间隔
+    "collectors": "",       # 启用的采集项（逗号分隔），为空表示全部
+    "collector_intervals": "",      # 采集项刷新间隔，如 "disks=60,cpu=1"
+    "static_cache": "static_cache.json",    # 静态信息缓存文件（相对程序目录），为空表示关闭
+    "sample_interval": 0.0, # 本地采样周期（秒），0 表示与上报周期相同
+    "upload_interval": 0.0, # 上报周期（秒），0 表示沿用默认值（2 秒，Linux 节能模式 3 秒）
+    "adaptive_interval": False,     # 自适应采样：平稳时拉长间隔，变化时恢复最快频率
+    "max_sample_interval": 30.0,    # 自适应采样的最长间隔（秒）
+    "adaptive_threshold": 5.0,      # CPU / 内存变化阈值（百分点）
+    "adaptive_net_threshold": 100.0,  # 网速变化阈值（KB/s）
+    "queue_size": 10,       # 待上报样本队列长度
+    "queue_policy": "drop_oldest",  # 队列满时：drop_oldest（丢最旧）/ coalesce（替换为最新）
+    "upload_workers": 1,    # 上报线程数（增量上报模式下固定为 1）
+    "metrics_port": 0,      # 本地 Prometheus 指标端口（仅监听 127.0.0.1），0 表示关闭
+    "spool_slots": 0,       # 上报失败样本的本地缓冲条数（spool.dat），0 表示关闭
+    "spool_slot_size": 8192,        # 单条缓冲样本的最大字节数（压缩后）
+    "spool_batch_size": 50,         # 恢复后每次批量补传的样本数
+    "spool_replay_order": "oldest", # 补传顺序：oldest（最旧优先）/ newest（最新优先）
+    "relay_host": "0.0.0.0",        # 中继模式监听地址
+    "relay_port": 8900,             # 中继模式监听端口
+    "relay_keys": "relay_keys.txt", # 中继允许的 secret_key 列表（每行一个，相对程序目录）
+    "relay_batch_size": 200,        # 中继每次向上游转发的主机数
+    "relay_flush_interval": 1.0,    # 中继转发周期（秒）
+    "relay_upstream_connections": 2,    # 中继到上游的并发长连接数
+    "relay_max_pending": 10000,     # 中继待转发主机数上限，超过后返回 503
+    "breaker_threshold": 3,         # 同一 API 地址连续失败多少次后熔断
+    "breaker_open_seconds": 5.0,    # 首次熔断时长（秒），之后每次翻倍，带随机抖动
+    "breaker_max_open_seconds": 300.0,  # 熔断时长上限（秒）
+    "alert_rule": "",               # 本地告警规则，可写多行，每行一条
+    "history_file": "",             # 本地历史数据文件（相对程序目录，如 history.rrd），为空表示关闭
+    "history_archives": "1:3600,60:1440,600:4320",  # 历史归档：步长秒数:行数，逗号分隔
+}
+# 可在 config.txt 中重复出现的配置项，多次出现时按行拼接
+REPEATABLE_OPTIONS = ("alert_rule",)
+
+
+def parse_option(default, value):
+    if isinstance(default, bool):
+        return value.lower() in ("1", "true", "yes", "on")
+    if isinstance(default, int):
+        return int(value)
+    if isinstance(default, float):
+        return float(value)
+    return value
+
+
+class ProcessParams:
+    def __init__(self):
+        self.secret_key = ''
+        self.api_address = ''
+        self.options = dict(DEFAULT_OPTIONS)
+        self.path = "config.txt"
+        self.real_path = real_path()
+
+    @staticmethod
+    def open(path):
+        with open(path, 'r', encoding="utf-8") as f:
+            return f.read()
+
+    @staticmethod
+    def write(path, content):
+        with open(path, 'w', encoding="utf-8") as f:
+            f.write(content)
+
+    def ask_user_params(self):
+        ask_list = ["api_address", "secret_key"]
+        result = ""
+        for item in ask_list:
+            user_input = input("请输入{}\n".format(item))
+            result += "{}={}\n".format(item, user_input)
+        self.write(os.path.join(self.real_path,self.path), result)
+
+    def check_params(self):
+        addresses = EndpointPool.split(self.api_address)
+        if self.secret_key and addresses and all(address.startswith("http") for address in addresses):
+            logging.info("参数检查通过")
+            return True
+        logging.error("密钥为空或 api 地址为空或 api 地址未以 http 开头")
+        return False
+
+    def load(self):
+        """
+        读取 config.txt（不存在时忽略），不校验参数、不提示输入。
+        """
+        if not os.path.exists(os.path.join(self.real_path, self.path)):
+            return
+        raw = self.open(os.path.join(self.real_path, self.path))
+        repeated = {}
+        for line in raw.splitlines():
+            if "=" not in line or line.lstrip().startswith("#"):
+                continue
+            key, value = line.split("=", 1)
+            key, value = key.strip(), value.strip()
+            if key == "secret_key":
+                self.secret_key = value
+            elif key == "api_address":
+                self.api_address = value
+            elif key in REPEATABLE_OPTIONS:
+                repeated.setdefault(key, []).append(value)
+            elif key in DEFAULT_OPTIONS:
+                try:
+                    self.options[key] = parse_option(DEFAULT_OPTIONS[key], value)
+                except ValueError:
+                    logging.error("配置项 {} 的值无效: {}".format(key, value))
+        for key, values in repeated.items():
+            self.options[key] = "\n".join(values)
+
+    def read_params(self):
+        self.load()
+        if self.check_params():
+            return self.api_address, self.secret_key
+
+        self.ask_user_params()
+        return self.read_params()
+
+
+# ============================
+# 主监控类
+# ============================
+# read_cpu_stat_all 每次切分的 cpu 行数
+CPU_STAT_CHUNK = 32
+# /proc/meminfo 中用到的字段
+MEMINFO_KEYS = (b"MemTotal:", b"MemAvailable:", b"MemFree:", b"SwapTotal:", b"SwapFree:")
+# get_*_memory() 返回值对应的字段
+MEMORY_KEYS = ("mem_total", "mem_used", "mem_percent", "swap_total", "swap_used", "swap_percent")
+# 参与窗口聚合与自适应采样判定的指标
+SAMPLE_METRIC_KEYS = (
+    "cpu_usage", "mem_percent", "swap_percent", "sent_speed", "recv_speed", "process_count",
+    "psi_cpu_some", "psi_memory_some", "psi_io_some", "cgroup_cpu_percent", "cgroup_mem_percent",
+)
+# /proc/pressure 中统计的 (资源, some/full)，对应 psi_<资源>_<some/full> 字段
+PSI_FIELDS = (("cpu", "some"), ("memory", "some"), ("memory", "full"), ("io", "some"), ("io", "full"))
+# snake_case 字段名 -> 上报用的小驼峰键，键集合固定，每个键只转换一次
+WIRE_KEYS = {}
+
+
+def wire_key(name):
+    key = WIRE_KEYS.get(name)
+    if key is None:
+        parts = name.split("_")
+        key = WIRE_KEYS[name] = parts[0] + "".join(p.capitalize() for p in parts[1:])
+    return key
+
+
+# ============================
+# 采样记录
+# ============================
+class HostSample:
+    """
+    一台主机的当前采样值。字段固定，用 __slots__ 保存，不为实例分配 __dict__；
+    字段名对应的上报键在类定义时算好，to_wire() 一次遍历直接生成上报 dict，
+    不再先复制 dict 转换易读格式、再逐键拆分转小驼峰。
+    OPTIONAL_FIELDS 只有对应采集项执行后才赋值，未赋值的字段不上报。
+    STATS_FIELDS 的值为 {snake_case 名称: 值} 的 dict，上报时其中的键同样转为小驼峰。
+    """
+    LIST_FIELDS = ("disks", "disk_io", "cpu_cores", "net_interfaces", "top_cpu_processes", "top_mem_processes")
+    BASE_FIELDS = (
+        "cpu_usage", "cpu_model", "cpu_count", "cpu_freq",
+        "mem_total", "mem_used", "mem_percent", "swap_total", "swap_used", "swap_percent",
+        "network_sent", "network_received", "network_pocket_sent", "process_count",
+    ) + LIST_FIELDS + (
+        "metric_stats", "agent_stats", "uptime", "sent_speed", "recv_speed", "os", "secret_key",
+    )
+    OPTIONAL_FIELDS = ("last_update",) + tuple("psi_{}_{}".format(r, k) for r, k in PSI_FIELDS) + (
+        "cgroup_path", "cgroup_cpu_limit", "cgroup_mem_current", "cgroup_mem_max", "cgroup_mem_percent",
+        "cgroup_cpu_usage", "cgroup_cpu_percent", "cgroup_throttled_percent", "cgroup_throttled_ms",
+        "cgroup_io_read_speed", "cgroup_io_write_speed", "cgroup_io_read_iops", "cgroup_io_write_iops",
+    )
+    STATS_FIELDS = ("metric_stats", "agent_stats")
+    FIELDS = BASE_FIELDS + OPTIONAL_FIELDS
+    FIELD_SET = frozenset(FIELDS)
+    WIRE_FIELDS = tuple((name, wire_key(name)) for name in FIELDS)
+    __slots__ = FIELDS
+
+    def __init__(self, secret_key):
+        for name in self.BASE_FIELDS:
+            setattr(self, name, None)
+        for name in self.LIST_FIELDS:
+            setattr(self, name, [])
+        self.metric_stats = {}
+        self.agent_stats = {}
+        self.secret_key = secret_key
+
+    def update(self, values):
+        for name, value in values.items():
+            setattr(self, name, value)
+
+    def get(self, name, default=None):
+        return getattr(self, name, default) if name in self.FIELD_SET else default
+
+    def __contains__(self, name):
+        return name in self.FIELD_SET and hasattr(self, name)
+
+    def to_dict(self):
+        """
+        snake_case 字段 dict（调试与基准测试用）
+        """
+        return {name: getattr(self, name) for name in self.FIELDS if hasattr(self, name)}
+
+    def to_wire(self, formatters=None):
+        """
+        生成上报 dict（小驼峰键）；formatters 为 {字段: 转换函数}，legacy 格式用于转换为易读字符串。
+        返回 dict 而不直接写出请求体：增量编码、本地缓冲与 msgpack 编码都以该 dict 为输入。
+        """
+        wire = {}
+        for name, key in self.WIRE_FIELDS:
+            value = getattr(self, name, HostSample)
+            if value is HostSample:
+                continue
+            if formatters is not None and value is not None and name in formatters:
+                value = formatters[name](value)
+            elif name in self.STATS_FIELDS:
+                value = {wire_key(k): v for k, v in value.items()}
+            wire[key] = value
+        return wire
+
+
+class SystemMonitor:
+    # 服务端 / 中继繁忙，稍后重试
+    TRANSIENT_CODES = (429, 503)
+
+    def __init__(self, secret_key, api_address, energy_saving_mode=False, options=None, autostart=True):
+        self.secret_key = secret_key
+        self.energy_saving_mode = energy_saving_mode
+        self.api_address = api_address
+        self.options = dict(DEFAULT_OPTIONS)
+        self.options.update(options or {})
+        self.delta_encoder = DeltaEncoder() if self.options["delta_upload"] else None
+        if self.delta_encoder is not None and not self.options["keep_alive"]:
+            logging.warning("delta_upload 需要 keep_alive=true：短连接模式下每次上报都是新连接，均发送全量快照")
+        # 增量基准所在的 API 地址序号与连接代号
+        self.delta_endpoint = None
+        self.delta_generation = None
+        # 多个 API 地址按健康状况故障转移，每个地址一个熔断器
+        self.endpoints = EndpointPool(
+            EndpointPool.split(api_address),
+            threshold=self.options["breaker_threshold"],
+            open_seconds=self.options["breaker_open_seconds"],
+            max_open_seconds=self.options["breaker_max_open_seconds"]
+        )
+        # legacy 上报易读字符串；raw / msgpack 上报数值（字节、KB/s、秒）
+        self.raw_payload = self.options["payload_format"] in ("raw", "msgpack")
+        self.wire_format = "msgpack" if self.options["payload_format"] == "msgpack" else "json"
+
+        # 采集线程与上报线程之间的有界队列；每个上报线程各持有一条长连接
+        self.sample_queue = SampleQueue(self.options["queue_size"], self.options["queue_policy"])
+        workers = max(self.options["upload_workers"], 1)
+        if self.delta_encoder is not None and workers > 1:
+            logging.warning("增量上报依赖上报顺序，上报线程数固定为 1")
+            workers = 1
+        self.transports = [
+            HttpTransport(keep_alive=self.options["keep_alive"], gzip_body=self.options["gzip"],
+                          headers={SECRET_KEY_HEADER: secret_key})
+            for _ in range(workers)
+        ]
+        self.replay_lock = threading.Lock()
+        self.pipeline_stats = {
+            "samples": 0,
+            "collect_errors": 0,
+            "skipped_ticks": 0,
+        }
+        self.telemetry = AgentTelemetry()
+        self.metrics_server = None
+
+        # 本地告警规则：每次采样后评估，状态变化时由告警线程立即推送
+        self.alerts = None
+        rules = AlertEngine.parse_rules(self.options["alert_rule"])
+        if rules:
+            self.alerts = AlertEngine(rules, self.telemetry)
+            self.alert_transport = HttpTransport(keep_alive=self.options["keep_alive"],
+                                                 headers={SECRET_KEY_HEADER: secret_key})
+
+        # 采样与上报周期相互独立；上报时附带窗口内各指标的聚合值
+        self.upload_interval = self.options["upload_interval"] or (
+            3 if energy_saving_mode and SYSTEM != "Windows" else 2
+        )
+        self.sample_interval = min(self.options["sample_interval"] or self.upload_interval, self.upload_interval)
+        self.aggregator = WindowAggregator()
+        self.adaptive = None
+        if self.options["adaptive_interval"]:
+            self.adaptive = AdaptiveInterval(
+                self.sample_interval,
+                self.options["max_sample_interval"],
+                threshold=self.options["adaptive_threshold"],
+                net_threshold=self.options["adaptive_net_threshold"]
+            )
+        self.scheduler = TickScheduler(self.sample_interval)
+        # 置位后采集 / 上报线程在当前一轮结束后退出
+        self.stop_event = threading.Event()
+        self.sample_metrics = {}
+        # 本地历史数据：固定大小的多分辨率归档，供 history 子命令查询
+        self.history = None
+        if self.options["history_file"]:
+            try:
+                self.history = MetricHistory(
+                    os.path.join(real_path(), self.options["history_file"]),
+                    SAMPLE_METRIC_KEYS,
+                    MetricHistory.parse_archives(self.options["history_archives"])
+                )
+            except (OSError, ValueError) as e:
+                logging.error("历史数据文件不可用，已关闭: {}".format(e))
+        self.spool = None
+        if self.options["spool_slots"] > 0:
+            self.spool = SampleSpool(
+                os.path.join(real_path(), "spool.dat"),
+                slot_count=self.options["spool_slots"],
+                slot_size=self.options["spool_slot_size"]
+            )
+        # 当前采样值；legacy 格式上报时按字段转换为易读字符串
+        self.sample = HostSample(secret_key)
+        self.wire_formatters = None if self.raw_payload else self.legacy_formatters()
+
+        top_n = self.options["process_top_n"]
+        self.process_table = ProcessTable(top_n) if top_n > 0 else None
+
+        # 网卡过滤规则及按网卡名缓存的判定结果
+        self.net_include = self.split_patterns(self.options["net_include"])
+        self.net_exclude = self.split_patterns(self.options["net_exclude"])
+        self.net_iface_filter = {}
+
+        # 磁盘：statvfs 超时保护，/sys/block 判定缓存
+        self.statvfs_guard = StatvfsGuard()
+        self.block_devices = {}
+
+        # 容器内统计所在的 cgroup v2
+        self.cgroup_dir = self.find_cgroup_dir() if SYSTEM == "Linux" else None
+        self.cgroup_name = None
+        if self.cgroup_dir is not None:
+            rel = os.path.relpath(self.cgroup_dir, sys_path("fs", "cgroup"))
+            self.cgroup_name = "/" if rel == "." else "/" + rel
+
+        # 常驻打开的 /proc 文件及解析缓存（cpu 行名、meminfo 字段偏移、网卡名）
+        self.proc = ProcReader()
+        self.cpu_names = []
+        self.cpu_raw_names = []
+        self.meminfo_offsets = dict.fromkeys(MEMINFO_KEYS, 0)
+        self.nic_names = {}
+
+        # CPU / 网络计数器快照，跨周期保存
+        self.sampler = CounterSampler()
+        self.prime_samplers()
+
+        # 各采集项按自身的刷新间隔惰性执行
+        self.collectors = self.register_collectors()
+
+        # 静态采集项的结果按开机标识缓存到文件，跨重启复用
+        self.static_cache = None
+        self.static_facts = {}
+        if self.options["static_cache"]:
+            self.static_cache = StaticFactsCache(
+                os.path.join(real_path(), self.options["static_cache"]), self.get_boot_id())
+            self.static_facts = self.static_cache.load()
+            self.collectors.preload(self.static_facts)
+
+        if autostart:
+            self.start()
+
+    def start(self):
+        if self.options["metrics_port"]:
+            self.start_metrics_server(self.options["metrics_port"])
+        threading.Thread(target=self.collect_worker, daemon=True).start()
+        if self.alerts is not None:
+            threading.Thread(target=self.alerts.worker, args=(self.post_alert,), daemon=True).start()
+        for transport in self.transports:
+            threading.Thread(target=self.upload_worker, args=(transport,), daemon=True).start()
+
+    def stop(self):
+        self.stop_event.set()
+
+    # ---------------------------------------
+    # 通用格式化方法
+    # ---------------------------------------
+    @staticmethod
+    def change_data_to_human_friendly(data):
+        for unit in ["B", "KB", "MB", "GB", "TB"]:
+            if data < 1024:
+                return "{} {}".format(round(data,2), unit)
+            data /= 1024
+        return "{} TB".format(round(data,2))
+
+    @staticmethod
+    def change_time_to_human_friendly(seconds):
+        units = [
+            # ("years", 365*86400),
+            # ("months", 30*86400),
+            ("days", 86400),
+            ("hours", 3600),
+            ("minutes", 60),
+            ("seconds", 1)
+        ]
+        result = []
+        for name, sec in units:
+            if seconds >= sec:
+                val = int(seconds // sec)
+                seconds %= sec
+                result.append("{}{}".format(val,name))
+        return " ".join(result) if result else "0s"
+
+    @staticmethod
+    def split_patterns(value):
+        return [p.strip() for p in value.split(",") if p.strip()]
+
+    # ---------------------------------------
+    # 网卡过滤与逐网卡 / 逐核速率
+    # ---------------------------------------
+    def net_iface_enabled(self, name):
+        enabled = self.net_iface_filter.get(name)
+        if enabled is None:
+            enabled = (
+                (not self.net_include or any(fnmatch.fnmatchcase(name, p) for p in self.net_include))
+                and not any(fnmatch.fnmatchcase(name, p) for p in self.net_exclude)
+            )
+            # veth 等网卡名会不断变化，避免缓存无限增长
+            if len(self.net_iface_filter) > 1024:
+                self.net_iface_filter.clear()
+            self.net_iface_filter[name] = enabled
+        return enabled
+
+    @staticmethod
+    def sum_net_counters(counters):
+        # 返回 (bytes_sent, bytes_recv, packets_sent)
+        return sum(counters[4::NET_FIELDS]), sum(counters[0::NET_FIELDS]), sum(counters[5::NET_FIELDS])
+
+    def get_net_interface_rates(self, names, counters):
+        """
+        每块网卡一项：(名称, 接收 KB/s, 发送 KB/s, 接收包/s, 发送包/s,
+        接收错误/s, 发送错误/s, 接收丢包/s, 发送丢包/s)
+        """
+        rates = self.sampler.rates("nic", counters, layout=names)
+        if rates is None:
+            return []
+        result = []
+        for i, name in enumerate(names):
+            r = rates[i*NET_FIELDS:(i+1)*NET_FIELDS]
+            result.append((
+                name, round(r[0]/1024, 2), round(r[4]/1024, 2),
+                round(r[1], 2), round(r[5], 2),
+                round(r[2], 2), round(r[6], 2),
+                round(r[3], 2), round(r[7], 2)
+            ))
+        return result
+
+    def get_disk_io_rates(self, names, counters):
+        """
+        每块磁盘一项：(设备, 读 KB/s, 写 KB/s, 读 IOPS, 写 IOPS, 利用率%)
+        """
+        deltas, elapsed = self.sampler.delta("disk_io", counters, layout=names)
+        if deltas is None:
+            return []
+        result = []
+        for i, name in enumerate(names):
+            d = [max(v, 0)/elapsed for v in deltas[i*DISK_IO_FIELDS:(i+1)*DISK_IO_FIELDS]]
+            result.append((
+                name, round(d[1]/1024, 2), round(d[3]/1024, 2),
+                round(d[0], 2), round(d[2], 2),
+                # busy_ms / 经过毫秒数
+                round(min(d[4]/10, 100), 2)
+            ))
+        return result
+
+    @classmethod
+    def legacy_formatters(cls):
+        """
+        legacy 上报格式：{字段: 转换函数}，字节数、网速、运行时间转换为易读字符串。
+        """
+        human = cls.change_data_to_human_friendly
+        formatters = dict.fromkeys(
+            ("mem_total", "mem_used", "swap_total", "swap_used", "network_sent", "network_received",
+             "cgroup_mem_current", "cgroup_mem_max"), human)
+        formatters.update(dict.fromkeys(("sent_speed", "recv_speed"), "{} KB/s".format))
+        formatters["uptime"] = cls.change_time_to_human_friendly
+        formatters["disks"] = lambda disks: [(d[0], human(d[1]), human(d[2]), d[3]) for d in disks]
+        formatters["top_cpu_processes"] = formatters["top_mem_processes"] = lambda rows: [
+            (pid, name, cmdline, cpu, human(rss)) for pid, name, cmdline, cpu, rss in rows
+        ]
+        return formatters
+
+    # ---------------------------------------
+    # OS 名称
+    # ---------------------------------------
+    @staticmethod
+    def get_os_pretty_name():
+        if SYSTEM == "Windows":
+            try:
+                result = subprocess.check_output("wmic os get Caption", shell=True)
+                lines = result.decode().strip().split("\n")
+                if len(lines) > 1:
+                    return lines[1].strip()
+            except:
+                pass
+            return "Windows {}".format(platform.release())
+
+        elif SYSTEM == "Linux":
+            try:
+                with open("/etc/os-release") as f:
+                    info = {}
+                    for line in f:
+                        if "=" in line:
+                            k, v = line.strip().split("=", 1)
+                            info[k] = v.strip('"')
+                return "{} {}".format(info.get('NAME','Linux'), info.get('VERSION',''))
+            except:
+                return "Linux {}".format(platform.release())
+
+        return SYSTEM
+
+    # ---------------------------------------
+    # 采集项
+    # ---------------------------------------
+    def register_collectors(self):
+        """
+        按平台注册采集项，config.txt 中的 collectors / collector_intervals
+        决定启用哪些以及各自的刷新间隔。
+        """
+        registry = CollectorRegistry(self.telemetry)
+        registry.register("os", self.collect_os, static=True)
+        if SYSTEM == "Linux":
+            registry.register("cpu_info", self.collect_linux_cpu_info, static=True)
+            registry.register("cpu", self.collect_linux_cpu)
+            registry.register("memory", self.collect_linux_memory)
+            registry.register("network", self.collect_linux_network)
+            registry.register("disks", self.collect_linux_disks, interval=60)
+            registry.register("disk_io", self.collect_linux_disk_io)
+            registry.register("processes", self.collect_linux_processes)
+            registry.register("uptime", self.collect_linux_uptime)
+            if self.psi_available():
+                registry.register("pressure", self.collect_linux_pressure)
+            if self.cgroup_dir is not None:
+                registry.register("cgroup", self.collect_linux_cgroup)
+        elif SYSTEM == "Windows":
+            registry.register("cpu_info", self.collect_windows_cpu_info, static=True)
+            registry.register("cpu", self.collect_windows_cpu)
+            registry.register("memory", self.collect_windows_memory)
+            registry.register("network", self.collect_windows_network)
+            registry.register("disks", self.collect_windows_disks, interval=60)
+            registry.register("disk_io", self.collect_windows_disk_io)
+            registry.register("processes", self.collect_windows_processes)
+            registry.register("uptime", self.collect_windows_uptime)
+        if self.process_table is not None:
+            registry.register("top_processes", self.collect_top_processes, interval=self.options["process_interval"])
+        registry.configure(
+            self.split_patterns(self.options["collectors"]),
+            registry.parse_intervals(self.options["collector_intervals"])
+        )
+        return registry
+
+    def collect_os(self):
+        return {"os": self.get_os_pretty_name()}
+
+    def persist_static_facts(self):
+        facts = self.collectors.static_values()
+        if facts != self.static_facts:
+            self.static_facts = facts
+            self.static_cache.save(facts)
+
+    @staticmethod
+    def get_boot_id():
+        """
+        本次开机的标识：Linux 为 boot_id（缺失时用 /proc/stat 的 btime），Windows 为开机时间。
+        """
+        if SYSTEM == "Windows":
+            return "btime-{}".format(int(psutil.boot_time()))
+        try:
+            with open(proc_path("sys", "kernel", "random", "boot_id")) as f:
+                return f.read().strip()
+        except OSError:
+            pass
+        try:
+            with open(proc_path("stat")) as f:
+                for line in f:
+                    if line.startswith("btime "):
+                        return "btime-{}".format(line.split()[1])
+        except OSError:
+            pass
+        return None
+
+    def network_values(self, names, counters, speed_func):
+        net_sent, net_recv, packets_sent = self.sum_net_counters(counters)
+        sent_speed, recv_speed = speed_func((net_sent, net_recv, packets_sent))
+        return {
+            "network_sent": net_sent,
+            "network_received": net_recv,
+            "network_pocket_sent": packets_sent,
+            "sent_speed": sent_speed,
+            "recv_speed": recv_speed,
+            "net_interfaces": self.get_net_interface_rates(names, counters),
+        }
+
+    def collect_top_processes(self):
+        # 进程数由每个周期运行的 processes 采集项提供；本采集项的值会缓存到下次扫描，
+        # 若一并返回进程数，会在之后的每个周期用旧值覆盖
+        _, top_cpu, top_mem = self.process_table.scan()
+        return {
+            "top_cpu_processes": top_cpu,
+            "top_mem_processes": top_mem,
+        }
+
+    # ---------------------------------------
+    # 计数器基线（启动时记录一次，首个周期即可算出速率）
+    # ---------------------------------------
+    def prime_samplers(self):
+        if SYSTEM == "Linux":
+            cpu_names, cpu_counters = self.read_cpu_stat_all()
+            self.get_linux_cpu_usage(cpu_counters[:CPU_STAT_FIELDS])
+            self.get_linux_cpu_cores(cpu_names, cpu_counters)
+            nic_names, nic_counters = self.read_net_dev_all()
+            self.get_linux_net_speed(self.sum_net_counters(nic_counters))
+            self.get_net_interface_rates(nic_names, nic_counters)
+            self.get_disk_io_rates(*self.read_diskstats())
+            try:
+                if self.cgroup_dir is not None:
+                    self.collect_linux_cgroup()
+                if os.path.exists(proc_path("pressure", "cpu")):
+                    self.collect_linux_pressure()
+            except (OSError, ValueError):
+                pass
+        elif SYSTEM == "Windows":
+            psutil.cpu_percent(interval=None)
+            psutil.cpu_percent(interval=None, percpu=True)
+            nic_names, nic_counters = self.read_windows_nics()
+            self.get_windows_realtime_network(self.sum_net_counters(nic_counters))
+            self.get_net_interface_rates(nic_names, nic_counters)
+            self.get_disk_io_rates(*self.read_windows_disk_io())
+
+    # ===========================================================
+    # LINUX SECTION
+    # ===========================================================
+    def read_cpu_stat(self):
+        with open(proc_path("stat")) as f:
+            for line in f:
+                if line.startswith("cpu "):
+                    parts = line.split()
+                    return list(map(int, parts[1:]))
+        return [0]*10
+
+    def read_cpu_stat_all(self):
+        """
+        读取 /proc/stat 开头的全部 cpu 行（汇总行 + 每个核心），
+        返回 (名称列表, 扁平 array)，每行固定 CPU_STAT_FIELDS 个计数器。
+        各行名称不变时复用同一个名称列表。
+        """
+        buf, size = self.proc.read("stat")
+        width = CPU_STAT_FIELDS + 1
+        raw_names = []
+        counters = array("Q")
+        pos = 0
+        # cpu 行位于文件开头，到第一行非 cpu 行为止；每次切分 CPU_STAT_CHUNK 行，兼顾速度与峰值内存
+        while buf.startswith(b"cpu", pos):
+            end = pos
+            lines = 0
+            while lines < CPU_STAT_CHUNK and buf.startswith(b"cpu", end):
+                newline = buf.find(b"\n", end, size)
+                end = size if newline < 0 else newline + 1
+                lines += 1
+            fields = buf[pos:end].split()
+            if len(fields) == lines*width:
+                raw_names.extend(fields[::width])
+                del fields[::width]
+                counters.extend(map(int, fields))
+            else:
+                # 旧内核的计数器不足 CPU_STAT_FIELDS 个：逐行补 0
+                for line in buf[pos:end].splitlines():
+                    parts = line.split()
+                    values = parts[1:width]
+                    raw_names.append(parts[0])
+                    counters.extend(map(int, values))
+                    counters.extend([0]*(CPU_STAT_FIELDS-len(values)))
+            pos = end
+        if raw_names != self.cpu_raw_names:
+            # 首次读取或 CPU 热插拔
+            self.cpu_raw_names = raw_names
+            self.cpu_names = [name.decode() for name in raw_names]
+        return self.cpu_names, counters
+
+    def get_linux_cpu_cores(self, names, counters):
+        """
+        每个核心一项：(名称, 使用率%, iowait%, steal%)
+        """
+        deltas, _ = self.sampler.delta("cpu_cores", counters, layout=names)
+        if deltas is None:
+            deltas = counters
+        cores = []
+        # 第 0 行是汇总的 "cpu" 行
+        for i in range(1, len(names)):
+            base = i*CPU_STAT_FIELDS
+            # user nice system idle iowait irq softirq steal（guest 已计入 user）
+            d = deltas[base:base+8]
+            total = sum(d)
+            if total <= 0:
+                cores.append((names[i], 0, 0, 0))
+                continue
+            cores.append((
+                names[i],
+                round((total-d[3]-d[4])/total*100, 2),
+                round(d[4]/total*100, 2),
+                round(d[7]/total*100, 2)
+            ))
+        return cores
+
+    def get_linux_cpu_usage(self, stat=None):
+        if stat is None:
+            stat = self.read_cpu_stat()
+        deltas, _ = self.sampler.delta("cpu", stat)
+        if deltas is None:
+            # 首次采样：使用开机以来的累计值
+            deltas = stat
+        total_delta = sum(deltas)
+        idle_delta = deltas[3]
+        if total_delta <= 0:
+            return 0
+        return round((1 - idle_delta/total_delta)*100, 2)
+
+    @staticmethod
+    def get_linux_cpu_model():
+        with open(proc_path("cpuinfo")) as f:
+            for line in f:
+                if "model name" in line:
+                    return line.split(":")[1].strip()
+        return "Unknown"
+
+    @staticmethod
+    def get_linux_cpu_freq():
+        with open(proc_path("cpuinfo")) as f:
+            for line in f:
+                if "cpu MHz" in line:
+                    return round(float(line.split(":")[1])/1000, 3)
+        return None
+
+    def read_meminfo(self):
+        """
+        只解析 MEMINFO_KEYS 中的字段，返回 {key: 字节数}；
+        记住每个字段上次所在的偏移，内容布局不变时无需查找。
+        """
+        buf, size = self.proc.read("meminfo")
+        offsets = self.meminfo_offsets
+        values = {}
+        for key in MEMINFO_KEYS:
+            pos = offsets[key]
+            if not buf.startswith(key, pos):
+                pos = buf.find(key, 0, size)
+                if pos < 0:
+                    continue
+                offsets[key] = pos
+            start = pos + len(key)
+            values[key] = int(buf[start:buf.index(b"kB", start, size)])*1024
+        return values
+
+    def get_linux_memory(self):
+        mem = self.read_meminfo()
+        mem_total = mem.get(b"MemTotal:", 0)
+        mem_free = mem.get(b"MemAvailable:", mem.get(b"MemFree:", 0))
+        mem_used = mem_total - mem_free
+        swap_total = mem.get(b"SwapTotal:", 0)
+        swap_free = mem.get(b"SwapFree:", 0)
+        swap_used = swap_total - swap_free
+        mem_percent = round(mem_used/mem_total*100, 2)
+        swap_percent = round(swap_used/max(swap_total,1)*100,2)
+        return mem_total, mem_used, mem_percent, swap_total, swap_used, swap_percent
+
+    def read_net_dev_all(self):
+        """
+        读取 /proc/net/dev 中通过过滤的网卡，
+        返回 (网卡名列表, 扁平 array)，每块网卡 NET_FIELDS 个计数器。
+        """
+        buf, size = self.proc.read("net", "dev")
+        names = []
+        counters = array("Q")
+        known = self.nic_names
+        # 前两行为表头
+        pos = buf.find(b"\n", buf.find(b"\n", 0, size) + 1, size) + 1
+        while 0 < pos < size:
+            end = buf.find(b"\n", pos, size)
+            if end < 0:
+                end = size
+            colon = buf.find(b":", pos, end)
+            if colon > 0:
+                raw = bytes(buf[pos:colon])
+                # 网卡名 -> (名称, 是否参与统计)，veth 等不断变化的网卡名避免无限增长
+                entry = known.get(raw)
+                if entry is None:
+                    if len(known) > 1024:
+                        known.clear()
+                    name = raw.strip().decode()
+                    entry = known[raw] = (name, self.net_iface_enabled(name))
+                if entry[1]:
+                    parts = buf[colon+1:end].split()
+                    names.append(entry[0])
+                    counters.extend(int(parts[i]) for i in NET_DEV_COLUMNS)
+            pos = end + 1
+        return names, counters
+
+    def read_net_dev(self):
+        return self.sum_net_counters(self.read_net_dev_all()[1])
+
+    def get_linux_net_speed(self, net=None):
+        sent, recv, _ = net or self.read_net_dev()
+        rates = self.sampler.rates("net", (sent, recv))
+        if rates is None:
+            return 0.0, 0.0
+        return round(rates[0]/1024, 2), round(rates[1]/1024, 2)
+
+    @staticmethod
+    def get_linux_process_count():
+        return sum(1 for pid in os.listdir(PROC_ROOT) if pid.isdigit())
+
+    @staticmethod
+    def read_mountinfo():
+        """
+        解析 /proc/self/mountinfo，返回 {挂载点: 文件系统类型}；
+        同一挂载点被多次挂载时以最上层（最后出现）为准。
+        """
+        mounts = {}
+        with open(proc_path("self", "mountinfo")) as f:
+            for line in f:
+                left, sep, right = line.partition(" - ")
+                fields = left.split()
+                if not sep or len(fields) < 5 or not right.strip():
+                    continue
+                # 挂载点中的空格等字符以 \040 形式转义
+                mount = re.sub(r"\\([0-7]{3})", lambda m: chr(int(m.group(1), 8)), fields[4])
+                mounts[mount] = right.split()[0]
+        return mounts
+
+    def get_linux_disks(self):
+        disks = []
+        for mount, fstype in self.read_mountinfo().items():
+            # 过滤虚拟挂载
+            if fstype in SKIP_FSTYPES or fstype in PSEUDO_FSTYPES:
+                continue
+
+            if any(mount.startswith(p) for p in SKIP_MOUNT_PREFIXES):
+                continue
+
+            st = self.statvfs_guard.statvfs(mount)
+            # f_blocks 为 0 的是伪文件系统，与 df 一致跳过
+            if st is None or st.f_blocks == 0:
+                continue
+
+            total = st.f_blocks*st.f_frsize
+            used = (st.f_blocks-st.f_bfree)*st.f_frsize
+            percent = round(used/max(total,1)*100,2)
+            disks.append((mount, total, used, percent))
+
+        return disks
+
+    def is_block_device(self, name):
+        # 只统计整盘（/sys/block 下的设备），分区会与整盘重复计数
+        enabled = self.block_devices.get(name)
+        if enabled is None:
+            enabled = (
+                not name.startswith(SKIP_BLOCK_PREFIXES)
+                and os.path.exists(sys_path("block", name.replace("/", "!")))
+            )
+            self.block_devices[name] = enabled
+        return enabled
+
+    def read_diskstats(self):
+        """
+        读取 /proc/diskstats，返回 (设备名列表, 扁平 array)，
+        每块磁盘 DISK_IO_FIELDS 个计数器。
+        """
+        names = []
+        counters = array("Q")
+        with open(proc_path("diskstats")) as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) < 14 or not self.is_block_device(parts[2]):
+                    continue
+                names.append(parts[2])
+                # 扇区固定按 512 字节计
+                counters.extend((
+                    int(parts[3]), int(parts[5])*512,
+                    int(parts[7]), int(parts[9])*512,
+                    int(parts[12])
+                ))
+        return names, counters
+
+    def get_linux_uptime(self):
+        buf, size = self.proc.read("uptime")
+        return float(buf[:buf.index(b" ", 0, size)])
+
+    # ---------------------------------------
+    # cgroup v2 与 PSI
+    # ---------------------------------------
+    @staticmethod
+    def in_container():
+        return (
+            os.path.exists("/.dockerenv") or os.path.exists("/run/.containerenv")
+            or bool(os.environ.get("container")) or "KUBERNETES_SERVICE_HOST" in os.environ
+        )
+
+    def find_cgroup_dir(self):
+        """
+        返回要统计的 cgroup v2 目录；关闭、不在容器内（auto）或不是 cgroup v2 时返回 None。
+        """
+        option = self.options["cgroup_path"]
+        root = sys_path("fs", "cgroup")
+        if option == "off" or not os.path.exists(os.path.join(root, "cgroup.controllers")):
+            return None
+        if option == "auto":
+            if not self.in_container():
+                return None
+            option = "self"
+        if option == "self":
+            option = "/"
+            try:
+                with open(proc_path("self", "cgroup")) as f:
+                    for line in f:
+                        # cgroup v2 的行形如 "0::/system.slice/docker-xxx.scope"
+                        if line.startswith("0::"):
+                            option = line[3:].strip()
+            except OSError:
+                pass
+            path = os.path.normpath(os.path.join(root, option.lstrip("/")))
+        else:
+            path = os.path.normpath(option if os.path.isabs(option) else os.path.join(root, option))
+        if not os.path.isdir(path):
+            logging.warning("cgroup 目录不存在: {}".format(path))
+            return None
+        return path
+
+    @staticmethod
+    def read_keyed_file(path):
+        """
+        解析 "key value" 形式的文件（如 cpu.stat）；文件不存在时返回空字典。
+        """
+        values = {}
+        try:
+            with open(path) as f:
+                for line in f:
+                    parts = line.split()
+                    if len(parts) == 2:
+                        values[parts[0]] = int(parts[1])
+        except OSError:
+            pass
+        return values
+
+    @staticmethod
+    def read_cgroup_value(path):
+        """
+        读取单值文件（memory.current / memory.max）；"max" 或文件不存在返回 None。
+        """
+        try:
+            with open(path) as f:
+                value = f.read().strip()
+        except OSError:
+            return None
+        return None if value == "max" else int(value)
+
+    def read_cgroup_cpu_limit(self):
+        # cpu.max："<quota> <period>" 或 "max <period>"
+        try:
+            with open(os.path.join(self.cgroup_dir, "cpu.max")) as f:
+                quota, period = f.read().split()
+        except (OSError, ValueError):
+            return None
+        if quota == "max":
+            return None
+        return round(int(quota)/int(period), 3)
+
+    def read_cgroup_io(self):
+        # io.stat 每行一块设备："8:0 rbytes=.. wbytes=.. rios=.. wios=.. ..."，汇总所有设备
+        totals = dict.fromkeys(("rbytes", "wbytes", "rios", "wios"), 0)
+        try:
+            with open(os.path.join(self.cgroup_dir, "io.stat")) as f:
+                for line in f:
+                    for item in line.split()[1:]:
+                        key, _, value = item.partition("=")
+                        if key in totals:
+                            totals[key] += int(value)
+        except OSError:
+            pass
+        return [totals["rbytes"], totals["wbytes"], totals["rios"], totals["wios"]]
+
+    def collect_linux_cgroup(self):
+        base = self.cgroup_dir
+        cpu = self.read_keyed_file(os.path.join(base, "cpu.stat"))
+        counters = [
+            cpu.get("usage_usec", 0), cpu.get("nr_periods", 0),
+            cpu.get("nr_throttled", 0), cpu.get("throttled_usec", 0)
+        ] + self.read_cgroup_io()
+        deltas, elapsed = self.sampler.delta("cgroup", counters)
+
+        cpu_limit = self.read_cgroup_cpu_limit()
+        mem_current = self.read_cgroup_value(os.path.join(base, "memory.current"))
+        mem_max = self.read_cgroup_value(os.path.join(base, "memory.max"))
+        values = {
+            "cgroup_path": self.cgroup_name,
+            "cgroup_cpu_limit": cpu_limit,
+            "cgroup_mem_current": mem_current,
+            "cgroup_mem_max": mem_max,
+            "cgroup_mem_percent": round(mem_current/mem_max*100, 2) if mem_current is not None and mem_max else None,
+            "cgroup_cpu_usage": None,
+            "cgroup_cpu_percent": None,
+            "cgroup_throttled_percent": None,
+            "cgroup_throttled_ms": None,
+            "cgroup_io_read_speed": None,
+            "cgroup_io_write_speed": None,
+            "cgroup_io_read_iops": None,
+            "cgroup_io_write_iops": None,
+        }
+        if deltas is not None:
+            d = [max(v, 0) for v in deltas]
+            # 使用的核数；相对 cpu.max 限额，无限额时相对整机核数
+            cores = d[0]/1e6/elapsed
+            values.update({
+                "cgroup_cpu_usage": round(cores, 3),
+                "cgroup_cpu_percent": round(cores/(cpu_limit or os.cpu_count() or 1)*100, 2),
+                # 被限流的调度周期占比，及每秒被限流的毫秒数
+                "cgroup_throttled_percent": round(d[2]/d[1]*100, 2) if d[1] else 0.0,
+                "cgroup_throttled_ms": round(d[3]/1000/elapsed, 2),
+                "cgroup_io_read_speed": round(d[4]/1024/elapsed, 2),
+                "cgroup_io_write_speed": round(d[5]/1024/elapsed, 2),
+                "cgroup_io_read_iops": round(d[6]/elapsed, 2),
+                "cgroup_io_write_iops": round(d[7]/elapsed, 2),
+            })
+        return values
+
+    @staticmethod
+    def read_pressure(resource):
+        """
+        解析 /proc/pressure/<resource>，返回 {"some": (avg10, total), "full": (avg10, total)}
+        """
+        result = {}
+        with open(proc_path("pressure", resource)) as f:
+            for line in f:
+                parts = line.split()
+                if not parts:
+                    continue
+                fields = dict(item.split("=", 1) for item in parts[1:])
+                result[parts[0]] = (float(fields["avg10"]), int(fields["total"]))
+        return result
+
+    @classmethod
+    def psi_available(cls):
+        """
+        内核以 psi=0 启动时 /proc/pressure 仍然存在，但读取返回 EOPNOTSUPP，
+        因此以实际读取一次为准。
+        """
+        try:
+            for resource in ("cpu", "memory", "io"):
+                cls.read_pressure(resource)
+        except OSError:
+            return False
+        return True
+
+    def collect_linux_pressure(self):
+        """
+        psi_<资源>_<some/full>：采样间隔内任务因该资源停顿的时间占比（%），
+        由 total（累计停顿微秒）的差值计算；首次采样使用内核的 avg10。
+        """
+        pressure = {}
+        for resource in ("cpu", "memory", "io"):
+            pressure[resource] = self.read_pressure(resource)
+        stats = [pressure[r].get(kind, (0.0, 0)) for r, kind in PSI_FIELDS]
+        rates = self.sampler.rates("pressure", [total for _, total in stats])
+        values = {}
+        for i, (resource, kind) in enumerate(PSI_FIELDS):
+            percent = stats[i][0] if rates is None else rates[i]/1e4
+            values["psi_{}_{}".format(resource, kind)] = round(min(percent, 100), 2)
+        return values
+
+    def collect_linux_cpu_info(self):
+        return {
+            "cpu_model": self.get_linux_cpu_model(),
+            "cpu_count": os.cpu_count(),
+            "cpu_freq": self.get_linux_cpu_freq(),
+        }
+
+    def collect_linux_cpu(self):
+        # 汇总行 + 每个核心，一次读取
+        names, counters = self.read_cpu_stat_all()
+        return {
+            "cpu_usage": self.get_linux_cpu_usage(counters[:CPU_STAT_FIELDS]),
+            "cpu_cores": self.get_linux_cpu_cores(names, counters),
+        }
+
+    def collect_linux_memory(self):
+        return dict(zip(MEMORY_KEYS, self.get_linux_memory()))
+
+    def collect_linux_network(self):
+        names, counters = self.read_net_dev_all()
+        return self.network_values(names, counters, self.get_linux_net_speed)
+
+    def collect_linux_disks(self):
+        return {"disks": self.get_linux_disks()}
+
+    def collect_linux_disk_io(self):
+        names, counters = self.read_diskstats()
+        return {"disk_io": self.get_disk_io_rates(names, counters)}
+
+    def collect_linux_processes(self):
+        return {"process_count": self.get_linux_process_count()}
+
+    def collect_linux_uptime(self):
+        return {"uptime": self.get_linux_uptime()}
+
+    # ===========================================================
+    # WINDOWS SECTION
+    # ===========================================================
+    @staticmethod
+    def get_windows_cpu_info():
+        cpu_model = platform.processor() or "Unknown"
+        cpu_count = psutil.cpu_count()
+        cpu_freq = psutil.cpu_freq()
+        return cpu_model, cpu_count, round(cpu_freq.max/1000,3)
+
+    @staticmethod
+    def get_windows_cpu_usage():
+        # interval=None：与上次调用之间的使用率，不阻塞
+        return psutil.cpu_percent(interval=None)
+
+    @staticmethod
+    def get_windows_memory():
+        mem = psutil.virtual_memory()
+        swap = psutil.swap_memory()
+        return mem.total, mem.used, mem.percent, swap.total, swap.used, swap.percent
+
+    def read_windows_nics(self):
+        """
+        与 read_net_dev_all 相同的布局：(网卡名列表, 扁平 array)
+        """
+        names = []
+        counters = array("Q")
+        for name, io in psutil.net_io_counters(pernic=True).items():
+            if not self.net_iface_enabled(name):
+                continue
+            names.append(name)
+            counters.extend((
+                io.bytes_recv, io.packets_recv, io.errin, io.dropin,
+                io.bytes_sent, io.packets_sent, io.errout, io.dropout
+            ))
+        return names, counters
+
+    def get_windows_net(self):
+        return self.sum_net_counters(self.read_windows_nics()[1])
+
+    @staticmethod
+    def get_windows_cpu_cores():
+        # Windows 没有 iowait / steal，对应位置填 0
+        return [
+            ("cpu{}".format(i), usage, 0, 0)
+            for i, usage in enumerate(psutil.cpu_percent(interval=None, percpu=True))
+        ]
+
+    @staticmethod
+    def get_windows_process_count():
+        return len(psutil.pids())
+
+    @staticmethod
+    def get_windows_disks():
+        partitions = psutil.disk_partitions()
+        disks = []
+        for part in partitions:
+            try:
+                usage = psutil.disk_usage(part.mountpoint)
+                disks.append((part.mountpoint, usage.total, usage.used, usage.percent))
+            except:
+                continue
+        return disks
+
+    @staticmethod
+    def read_windows_disk_io():
+        """
+        与 read_diskstats 相同的布局：(设备名列表, 扁平 array)
+        """
+        names = []
+        counters = array("Q")
+        for name, io in (psutil.disk_io_counters(perdisk=True) or {}).items():
+            names.append(name)
+            counters.extend((
+                io.read_count, io.read_bytes,
+                io.write_count, io.write_bytes,
+                # Windows 没有 busy_time，用读写耗时之和近似
+                getattr(io, "busy_time", io.read_time + io.write_time)
+            ))
+        return names, counters
+
+    @staticmethod
+    def get_windows_uptime():
+        return time.time() - psutil.boot_time()
+
+    # Windows 实时网速：与上次采集的计数器快照比较，不再 sleep
+    def get_windows_realtime_network(self, net=None):
+        sent, recv, _ = net or self.get_windows_net()
+        rates = self.sampler.rates("net", (sent, recv))
+        if rates is None:
+            return 0.0, 0.0
+        return round(rates[0]/1024, 2), round(rates[1]/1024, 2)
+
+    def collect_windows_cpu_info(self):
+        return dict(zip(("cpu_model", "cpu_count", "cpu_freq"), self.get_windows_cpu_info()))
+
+    def collect_windows_cpu(self):
+        return {
+            "cpu_usage": self.get_windows_cpu_usage(),
+            "cpu_cores": self.get_windows_cpu_cores(),
+        }
+
+    def collect_windows_memory(self):
+        return dict(zip(MEMORY_KEYS, self.get_windows_memory()))
+
+    def collect_windows_network(self):
+        names, counters = self.read_windows_nics()
+        return self.network_values(names, counters, self.get_windows_realtime_network)
+
+    def collect_windows_disks(self):
+        return {"disks": self.get_windows_disks()}
+
+    def collect_windows_disk_io(self):
+        names, counters = self.read_windows_disk_io()
+        return {"disk_io": self.get_disk_io_rates(names, counters)}
+
+    def collect_windows_processes(self):
+        return {"process_count": self.get_windows_process_count()}
+
+    def collect_windows_uptime(self):
+        return {"uptime": self.get_windows_uptime()}
+
+    # ===========================================================
+    # 上报
+    # ===========================================================
+    def update_info(self):
+        sample = self.sample
+        self.collectors.collect(sample)
+        sample.last_update = now_shanghai_str()
+        if self.static_cache is not None:
+            self.persist_static_facts()
+        # 原地更新，聚合、自适应采样与历史数据只读取其中的值
+        metrics = self.sample_metrics
+        for key in SAMPLE_METRIC_KEYS:
+            metrics[key] = sample.get(key)
+
+    def collect_info(self):
+        with self.telemetry.stage("collect"):
+            self.update_info()
+        self.aggregator.add(self.sample_metrics)
+        if self.history is not None:
+            with self.telemetry.stage("history"):
+                self.history.update(self.sample_metrics)
+        if self.alerts is not None:
+            self.alerts.evaluate(self.sample)
+
+    def get_agent_stats(self):
+        stats = {
+            "queue_depth": len(self.sample_queue),
+            "dropped_samples": self.sample_queue.stats["dropped"],
+            "coalesced_samples": self.sample_queue.stats["coalesced"],
+            "collect_errors": self.pipeline_stats["collect_errors"],
+            "skipped_ticks": self.pipeline_stats["skipped_ticks"],
+            "sample_interval": round(self.scheduler.interval, 2),
+            "api_endpoint": self.endpoints.current,
+            "api_failovers": self.endpoints.failovers,
+        }
+        if self.alerts is not None:
+            stats["alerts_firing"] = self.alerts.firing()
+        stats.update(self.telemetry.summary())
+        return stats
+
+    # ===========================================================
+    # 本地指标端点
+    # ===========================================================
+    def render_metrics(self):
+        return self.telemetry.render({
+            "queue_depth": len(self.sample_queue),
+            "samples_total": self.pipeline_stats["samples"],
+            "collect_errors_total": self.pipeline_stats["collect_errors"],
+            "skipped_ticks_total": self.pipeline_stats["skipped_ticks"],
+            "dropped_samples_total": self.sample_queue.stats["dropped"],
+            "coalesced_samples_total": self.sample_queue.stats["coalesced"],
+            "spooled_samples": len(self.spool) if self.spool is not None else 0,
+            "alerts_firing": self.alerts.firing() if self.alerts is not None else 0,
+            "api_endpoints_open": self.endpoints.open_count(),
+            "api_failovers_total": self.endpoints.failovers,
+        })
+
+    def start_metrics_server(self, port):
+        self.metrics_server = serve_metrics(self, port)
+
+    def build_snapshot(self):
+        """
+        生成一份待上报的全量样本（小驼峰），并开始新的聚合窗口。
+        """
+        sample = self.sample
+        sample.metric_stats = self.aggregator.summary()
+        sample.agent_stats = self.get_agent_stats()
+        return sample.to_wire(self.wire_formatters)
+
+    def post_data(self, path, data, transport, endpoint, generation=None):
+        url = self.endpoints.url(endpoint, path)
+        try:
+            return http_post(url, data=data, timeout=10, transport=transport,
+                             wire_format=self.wire_format, generation=generation)
+        except PayloadFormatRejected as e:
+            logging.warning("{}，回退为 JSON 上报".format(e))
+            self.wire_format = "json"
+            return http_post(url, data=data, timeout=10, transport=transport, generation=generation)
+
+    def defer_snapshot(self, snapshot):
+        """
+        样本未能送达：下次重新发送全量快照，全量样本写入本地缓冲，恢复后补传。
+        """
+        if self.delta_encoder is not None:
+            self.delta_encoder.reset()
+        if self.spool is not None:
+            self.spool.append(snapshot)
+
+    def upload_info(self, snapshot, transport, endpoint):
+        data = snapshot
+        generation = None
+        if self.delta_encoder is not None:
+            generation = transport.next_generation(self.endpoints.url(endpoint, "/"))
+            if endpoint != self.delta_endpoint or generation != self.delta_generation:
+                # 换了 API 地址或连接：新连接上先发全量
+                self.delta_encoder.reset()
+                self.delta_endpoint = endpoint
+            data = self.delta_encoder.encode(data)
+            if data["payloadType"] != "delta":
+                generation = None
+        try:
+            try:
+                text = self.post_data("/api/host/update_host_details", data, transport, endpoint, generation)
+            except ConnectionRenewed:
+                # 增量只在原连接上发送；连接刚被服务端关闭，改在新连接上发全量
+                self.delta_encoder.reset()
+                data = self.delta_encoder.encode(snapshot)
+                text = self.post_data("/api/host/update_host_details", data, transport, endpoint)
+            res = json.loads(text)
+            if res.get("code") in self.TRANSIENT_CODES:
+                raise UploadDeferred("服务端繁忙（{}）：{}".format(res["code"], res.get("message")))
+        except REQUEST_ERRORS + (UploadDeferred,):
+            # 请求失败、响应无法解析或服务端繁忙
+            self.defer_snapshot(snapshot)
+            raise
+        if self.delta_encoder is not None and self.delta_encoder.needs_resync(res):
+            logging.warning("服务端要求重新同步，下次上报全量快照")
+            self.delta_encoder.reset()
+            return
+        if res["code"] != 200:
+            logging.error("Failed to update host details: {}".format(res['message']))
+            os._exit(0)
+        if self.delta_encoder is not None:
+            self.delta_encoder.ack()
+            self.delta_generation = transport.generation
+        if self.spool is not None and len(self.spool) and self.replay_lock.acquire(False):
+            try:
+                self.replay_spool(transport, endpoint)
+            finally:
+                self.replay_lock.release()
+
+    def post_alert(self, event):
+        """
+        推送一条告警状态变化（始终为 JSON），返回 "ok" / "retry" / "drop"
+        """
+        endpoint = self.endpoints.acquire()
+        if endpoint is None:
+            return "retry"
+        data = dict(event, secretKey=self.secret_key)
+        try:
+            res = json.loads(http_post(self.endpoints.url(endpoint, ALERT_PATH), data,
+                                       timeout=10, transport=self.alert_transport))
+            code = res.get("code")
+        except REQUEST_ERRORS:
+            code = None
+        self.telemetry.inc("alert_posts_total", "result", "success" if code == 200 else "failure")
+        if code == 200:
+            self.endpoints.success(endpoint)
+            return "ok"
+        if code is None or code in self.TRANSIENT_CODES:
+            self.endpoints.failure(endpoint)
+            return "retry"
+        logging.error("服务端拒绝了告警（{}）：{}".format(code, res.get("message")))
+        return "drop"
+
+    def replay_spool(self, transport, endpoint):
+        """
+        API 恢复后，每次上报成功时从缓冲中批量补传一批样本。
+        """
+        batch = self.spool.peek(
+            self.options["spool_batch_size"],
+            newest_first=self.options["spool_replay_order"] == "newest"
+        )
+        if not batch:
+            return
+        try:
+            res = json.loads(self.post_data(
+                "/api/host/batch_update_host_details",
+                {"secretKey": self.secret_key, "samples": [data for _, data in batch]},
+                transport, endpoint
+            ))
+        except REQUEST_ERRORS as e:
+            logging.error("补传缓冲样本失败: {}".format(e))
+            return
+        if res.get("code") != 200:
+            logging.error("Failed to replay spooled samples: {}".format(res.get('message')))
+            return
+        self.spool.remove([seq for seq, _ in batch])
+        logging.info("已补传 {} 条缓冲样本，剩余 {} 条".format(len(batch), len(self.spool)))
+
+    # ===========================================================
+    # 后台线程：采集（固定节拍）-> 队列 -> 上报
+    # ===========================================================
+    def collect_worker(self):
+        self.scheduler.tick = next_upload = time.monotonic()
+        while not self.stop_event.is_set():
+            try:
+                self.collect_info()
+                self.pipeline_stats["samples"] += 1
+                if self.adaptive is not None:
+                    self.scheduler.interval = self.adaptive.update(self.sample_metrics)
+                now = time.monotonic()
+                if now >= next_upload:
+                    next_upload += self.upload_interval
+                    if next_upload <= now:
+                        next_upload = now + self.upload_interval
+                    with self.telemetry.stage("snapshot"):
+                        snapshot = self.build_snapshot()
+                    self.sample_queue.put(snapshot)
+            except Exception as e:
+                self.pipeline_stats["collect_errors"] += 1
+                logging.error(e)
+            # 按固定节拍采集，不受采集耗时与上报快慢影响；错过的节拍直接跳过
+            self.pipeline_stats["skipped_ticks"] += self.scheduler.wait()
+
+    def upload_worker(self, transport):
+        while not self.stop_event.is_set():
+            snapshot = self.sample_queue.get(timeout=1)
+            if snapshot is None:
+                continue
+            endpoint = self.endpoints.acquire()
+            if endpoint is None:
+                # 所有 API 地址都在熔断中：不发请求，样本直接写入缓冲，等熔断到期后的探测请求
+                self.defer_snapshot(snapshot)
+                self.telemetry.inc("uploads_total", "result", "skipped")
+                continue
+            start = time.perf_counter()
+            try:
+                self.upload_info(snapshot, transport, endpoint)
+                result = "success"
+                self.endpoints.success(endpoint)
+            except Exception as e:
+                result = "failure"
+                self.endpoints.failure(endpoint)
+                logging.error(e)
+            self.telemetry.observe("upload_duration_seconds", "result", result, time.perf_counter() - start)
+            self.telemetry.inc("uploads_total", "result", result)
+
+
+# ============================
+# 中继模式
+# ============================
+RELAY_UPDATE_PATH = "/api/host/update_host_details"
+RELAY_BATCH_PATH = "/api/host/batch_update_host_details"
+# 上游接收多台主机合并上报的接口：{"relayKey": ..., "hosts": [快照, ...]}
+RELAY_UPSTREAM_PATH = "/api/host/relay_update_host_details"
+
+
+class RelayHandler(BaseHTTPRequestHandler):
+    """
+    接收局域网内客户端的上报，server.relay 为 Relay 实例。
+    gzip 请求体必须在请求头中携带已授权的 secret_key，鉴权通过后才解压，
+    解压后的大小同样受 MAX_BODY 限制。
+    """
+    protocol_version = "HTTP/1.1"
+    MAX_BODY = 4 * 1024 * 1024
+
+    def do_POST(self):
+        relay = self.server.relay
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            length = -1
+        if length < 0 or length > self.MAX_BODY:
+            self.close_connection = True
+            self.reply(413, "请求体过大")
+            return
+        body = self.rfile.read(length)
+        key = self.headers.get(SECRET_KEY_HEADER)
+        gzipped = self.headers.get("Content-Encoding") == "gzip"
+        if (gzipped or key is not None) and not relay.key_allowed(key):
+            self.reply(*relay.result(403, "rejected", "secret_key 无效"))
+            return
+        try:
+            if gzipped:
+                inflater = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                body = inflater.decompress(body, self.MAX_BODY)
+                if inflater.unconsumed_tail:
+                    self.reply(*relay.result(413, "invalid", "请求体过大"))
+                    return
+            data = decode_payload(body, self.headers.get("Content-Type", WIRE_CONTENT_TYPES["json"]))
+        except Exception:
+            self.reply(400, "请求体无法解析")
+            return
+        self.reply(*relay.accept(self.path.split("?")[0], data))
+
+    def reply(self, code, message):
+        body = json.dumps({"code": code, "message": message}, ensure_ascii=False).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class Relay:
+    """
+    中继：接收局域网内客户端的上报，按 secretKey 合并（每台主机只保留最新快照，
+    增量上报合并到该主机的完整状态上），再通过少量长连接批量转发给上游 API。
+    待转发主机数达到上限时返回 503，客户端按上报失败处理并稍后重试。
+    """
+    # 待转发的补传批次上限
+    MAX_PASSTHROUGH = 100
+
+    def __init__(self, api_address, secret_key, options):
+        self.api_address = api_address
+        self.secret_key = secret_key
+        self.options = options
+        self.endpoints = EndpointPool(
+            EndpointPool.split(api_address),
+            threshold=options["breaker_threshold"],
+            open_seconds=options["breaker_open_seconds"],
+            max_open_seconds=options["breaker_max_open_seconds"]
+        )
+        self.batch_size = max(options["relay_batch_size"], 1)
+        self.max_pending = max(options["relay_max_pending"], 1)
+        self.flush_interval = options["relay_flush_interval"]
+        self.wire_format = "msgpack" if options["payload_format"] == "msgpack" else "json"
+
+        self.keys_path = os.path.join(real_path(), options["relay_keys"])
+        self.keys_mtime = None
+        self.keys_checked = 0
+        self.allowed_keys = set()
+
+        self.lock = threading.Lock()
+        self.ready = threading.Condition(self.lock)
+        # secretKey -> [fingerprint, 完整状态]
+        self.hosts = {}
+        # secretKey -> 待转发的最新快照
+        self.pending = collections.OrderedDict()
+        # 原样转发的 (接口, 请求体)：客户端补传的批次与告警
+        self.passthrough = collections.deque()
+        self.telemetry = AgentTelemetry()
+        self.transports = [
+            HttpTransport(keep_alive=True, gzip_body=options["gzip"])
+            for _ in range(max(options["relay_upstream_connections"], 1))
+        ]
+
+    # ---------------------------------------
+    # secret_key 白名单（文件变化时重新加载）
+    # ---------------------------------------
+    def load_keys(self):
+        mtime = os.stat(self.keys_path).st_mtime
+        if mtime == self.keys_mtime:
+            return
+        keys = set()
+        with open(self.keys_path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith("#"):
+                    keys.add(line)
+        self.allowed_keys = keys
+        self.keys_mtime = mtime
+        logging.info("已加载 {} 个允许中继的 secret_key".format(len(keys)))
+
+    def key_allowed(self, key):
+        now = time.monotonic()
+        if now - self.keys_checked > 5:
+            self.keys_checked = now
+            try:
+                self.load_keys()
+            except OSError as e:
+                logging.error("读取 {} 失败，沿用已加载的列表: {}".format(self.keys_path, e))
+        return isinstance(key, str) and key in self.allowed_keys
+
+    # ---------------------------------------
+    # 接收客户端上报
+    # ---------------------------------------
+    def accept(self, path, data):
+        """
+        返回 (code, message)，code 同时作为 HTTP 状态码。
+        """
+        if not isinstance(data, dict):
+            return self.result(400, "invalid", "请求体必须是对象")
+        if path not in (RELAY_UPDATE_PATH, RELAY_BATCH_PATH, ALERT_PATH):
+            return self.result(404, "invalid", "未知接口")
+        key = data.get("secretKey")
+        if not self.key_allowed(key):
+            return self.result(403, "rejected", "secret_key 无效")
+        if path == RELAY_BATCH_PATH:
+            return self.accept_batch(data)
+        if path == ALERT_PATH:
+            return self.accept_alert(data)
+        return self.accept_snapshot(key, data)
+
+    def result(self, code, label, message):
+        self.telemetry.inc("relay_requests_total", "result", label)
+        return code, message
+
+    def accept_snapshot(self, key, data):
+        with self.lock:
+            if key not in self.pending and len(self.pending) >= self.max_pending:
+                return self.result(503, "busy", "中继繁忙，请稍后重试")
+            host = self.hosts.get(key)
+            if data.get("payloadType") == "delta":
+                if host is None or host[0] != data.get("fingerprint"):
+                    return self.result(DeltaEncoder.RESYNC_CODE, "resync", "需要重新发送全量快照")
+                host[1].update(data)
+            else:
+                host = self.hosts[key] = [data.get("fingerprint"), dict(data)]
+            snapshot = dict(host[1])
+            snapshot.pop("payloadType", None)
+            snapshot.pop("fingerprint", None)
+            label = "coalesced" if key in self.pending else "accepted"
+            self.pending[key] = snapshot
+            if len(self.pending) >= self.batch_size:
+                self.ready.notify()
+        return self.result(200, label, "success")
+
+    def accept_batch(self, data):
+        if not isinstance(data.get("samples"), list):
+            return self.result(400, "invalid", "缺少 samples")
+        with self.lock:
+            if len(self.passthrough) >= self.MAX_PASSTHROUGH:
+                return self.result(503, "busy", "中继繁忙，请稍后重试")
+            self.passthrough.append((RELAY_BATCH_PATH, data))
+            self.ready.notify()
+        return self.result(200, "accepted", "success")
+
+    def accept_alert(self, data):
+        # 告警插到原样转发队列的队首，立即唤醒转发线程
+        with self.lock:
+            if len(self.passthrough) >= self.MAX_PASSTHROUGH:
+                return self.result(503, "busy", "中继繁忙，请稍后重试")
+            self.passthrough.appendleft((ALERT_PATH, data))
+            self.ready.notify()
+        return self.result(200, "alert", "success")
+
+    # ---------------------------------------
+    # 批量转发上游
+    # ---------------------------------------
+    def take_batch(self):
+        with self.lock:
+            self.ready.wait_for(
+                lambda: len(self.pending) >= self.batch_size or self.passthrough,
+                timeout=self.flush_interval
+            )
+            count = min(self.batch_size, len(self.pending))
+            batch = [self.pending.popitem(last=False)[1] for _ in range(count)]
+            replay = self.passthrough.popleft() if self.passthrough else None
+        return batch, replay
+
+    def requeue(self, batch):
+        # 转发失败的快照放回队首；期间收到的更新快照优先
+        with self.lock:
+            for snapshot in reversed(batch):
+                key = snapshot["secretKey"]
+                if key not in self.pending:
+                    self.pending[key] = snapshot
+                    self.pending.move_to_end(key, last=False)
+
+    def post_upstream(self, path, data, transport):
+        """
+        返回 "ok" / "retry" / "drop"
+        """
+        endpoint = self.endpoints.acquire()
+        if endpoint is None:
+            # 所有上游地址都在熔断中
+            return "retry"
+        url = self.endpoints.url(endpoint, path)
+        start = time.perf_counter()
+        try:
+            res = json.loads(http_post(url, data, transport=transport, wire_format=self.wire_format))
+            code = res.get("code")
+        except PayloadFormatRejected as e:
+            logging.warning("{}，回退为 JSON 转发".format(e))
+            self.wire_format = "json"
+            return "retry"
+        except REQUEST_ERRORS as e:
+            logging.error("中继转发失败: {}".format(e))
+            code = None
+        result = "success" if code == 200 else "failure"
+        self.telemetry.observe("upload_duration_seconds", "result", result, time.perf_counter() - start)
+        self.telemetry.inc("uploads_total", "result", result)
+        if code == 200:
+            self.endpoints.success(endpoint)
+            return "ok"
+        if code is None or code in SystemMonitor.TRANSIENT_CODES:
+            self.endpoints.failure(endpoint)
+            return "retry"
+        logging.error("上游拒绝了中继转发（{}）：{}".format(code, res.get("message")))
+        return "drop"
+
+    def upstream_worker(self, transport):
+        while True:
+            batch, replay = self.take_batch()
+            failed = False
+            if replay is not None:
+                if self.post_upstream(replay[0], replay[1], transport) == "retry":
+                    failed = True
+                    with self.lock:
+                        self.passthrough.appendleft(replay)
+            if batch:
+                outcome = self.post_upstream(
+                    RELAY_UPSTREAM_PATH, {"relayKey": self.secret_key, "hosts": batch}, transport)
+                if outcome == "retry":
+                    failed = True
+                    self.requeue(batch)
+                elif outcome == "ok":
+                    self.telemetry.inc("relay_forwarded_hosts_total", amount=len(batch))
+            if failed:
+                time.sleep(self.flush_interval)
+
+    def render_metrics(self):
+        return self.telemetry.render({
+            "relay_pending_hosts": len(self.pending),
+            "relay_known_hosts": len(self.hosts),
+            "relay_passthrough_batches": len(self.passthrough),
+            "api_endpoints_open": self.endpoints.open_count(),
+            "api_failovers_total": self.endpoints.failovers,
+        })
+
+    def start(self):
+        self.load_keys()
+        server = ThreadingHTTPServer((self.options["relay_host"], self.options["relay_port"]), RelayHandler)
+        server.daemon_threads = True
+        server.relay = self
+        for transport in self.transports:
+            threading.Thread(target=self.upstream_worker, args=(transport,), daemon=True).start()
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        if self.options["metrics_port"]:
+            serve_metrics(self, self.options["metrics_port"])
+        logging.info("中继已启动：{}:{} -> {}".format(
+            self.options["relay_host"], self.options["relay_port"], self.api_address))
+        return server
+
+
+# ============================
+# 退出处理
+# ============================
+def exit_func():
+    global IS_EXITED
+    IS_EXITED = True
+
+
+def handle_exit(signum, frame):
+    exit_func()
+
+
+atexit.register(exit_func)
+signal.signal(signal.SIGINT, handle_exit)
+signal.signal(signal.SIGTERM, handle_exit)
+
+
+# ============================
+# 主流程
+# ============================
+def main(energy_saving_mode=False):
+    global PROC_ROOT, SYS_ROOT
+    params = ProcessParams()
+    api_address, secret_key = params.read_params()
+    PROC_ROOT = params.options["proc_root"]
+    SYS_ROOT = params.options["sys_root"]
+
+    # ⚠ 可根据需要设为 True
+    SystemMonitor(secret_key, api_address, energy_saving_mode=energy_saving_mode, options=params.options)
+    logging.info("客户端正常运行")
+    while True:
+        if IS_EXITED:
+            break
+        time.sleep(1)
+
+
+def relay_main():
+    params = ProcessParams()
+    api_address, secret_key = params.read_params()
+    relay = Relay(api_address, secret_key, params.options)
+    try:
+        server = relay.start()
+    except OSError as e:
+        logging.error("中继启动失败: {}".format(e))
+        return
+    while not IS_EXITED:
+        time.sleep(1)
+    server.shutdown()
+
+
+HISTORY_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_history_time(value, now):
+    """
+    相对时长（90s / 30m / 2h / 7d，表示 now 之前）或上海时间 "YYYY-MM-DD HH:MM[:SS]"，返回时间戳。
+    """
+    value = value.strip()
+    if value[-1:] in HISTORY_UNITS and value[:-1].isdigit():
+        return now - int(value[:-1])*HISTORY_UNITS[value[-1]]
+    for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M"):
+        try:
+            local = datetime.strptime(value, fmt) - timedelta(hours=8)
+        except ValueError:
+            continue
+        return (local - datetime(1970, 1, 1)).total_seconds()
+    raise ValueError("无法解析时间：{}".format(value))
+
+
+def history_main(argv):
+    import argparse
+    parser = argparse.ArgumentParser(prog="client.py history", description="查询本机历史指标")
+    parser.add_argument("metric", nargs="?", help="指标名，省略时列出文件中的指标与归档")
+    parser.add_argument("--since", default="1h",
+                        help="起始时间：相对时长（90s / 30m / 2h / 7d）或 \"YYYY-MM-DD HH:MM[:SS]\"（上海时间）")
+    parser.add_argument("--until", default=None, help="结束时间，格式同 --since，默认为当前时间")
+    parser.add_argument("--step", type=int, default=None, help="使用指定步长（秒）的归档，默认取覆盖起始时间的最细归档")
+    parser.add_argument("--summary", action="store_true", help="只输出区间汇总")
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出")
+    parser.add_argument("--file", default=None, help="历史数据文件，默认取 config.txt 中的 history_file")
+    args = parser.parse_args(argv)
+
+    path = args.file
+    if path is None:
+        params = ProcessParams()
+        params.load()
+        if not params.options["history_file"]:
+            print("未启用本地历史数据：在 config.txt 中设置 history_file（如 history_file=history.rrd），或用 --file 指定文件")
+            return 1
+        path = os.path.join(real_path(), params.options["history_file"])
+    try:
+        history = MetricHistory(path)
+    except (OSError, ValueError) as e:
+        print("无法打开历史数据文件: {}".format(e))
+        return 1
+
+    if args.metric is None:
+        print("{}（{:.1f} KB）".format(path, history.size()/1024))
+        print("指标: {}".format(", ".join(history.metrics)))
+        for step, rows in history.archives:
+            print("归档: 步长 {} 秒 x {} 行，覆盖 {:.1f} 小时".format(step, rows, step*rows/3600))
+        return 0
+
+    now = time.time()
+    try:
+        start = parse_history_time(args.since, now)
+        end = now if args.until is None else parse_history_time(args.until, now)
+        step, points = history.read(args.metric, start, end, args.step, now=now)
+    except ValueError as e:
+        print(e)
+        return 1
+
+    if args.summary:
+        total = sum(count for _, _, _, count in points)
+        result = {
+            "metric": args.metric,
+            "step": step,
+            "from": shanghai_time_str(points[0][0]) if points else None,
+            "to": shanghai_time_str(points[-1][0]) if points else None,
+            "points": len(points),
+            "samples": total,
+            "avg": round(sum(avg*count for _, avg, _, count in points)/total, 2) if total else None,
+            "min_avg": round(min(p[1] for p in points), 2) if points else None,
+            "max": round(max(p[2] for p in points), 2) if points else None,
+        }
+        if args.json:
+            print(json.dumps(result, ensure_ascii=False))
+        else:
+            for key, value in result.items():
+                print("{:<10}{}".format(key, value))
+        return 0
+
+    if args.json:
+        print(json.dumps({"metric": args.metric, "step": step, "points": [
+            {"time": shanghai_time_str(ts), "avg": round(avg, 2), "max": round(peak, 2), "samples": count}
+            for ts, avg, peak, count in points
+        ]}, ensure_ascii=False))
+        return 0
+    print("{}（步长 {} 秒，{} 个点）".format(args.metric, step, len(points)))
+    print("{:<22}{:>12}{:>12}{:>9}".format("time", "avg", "max", "samples"))
+    for ts, avg, peak, count in points:
+        print("{:<22}{:>12.2f}{:>12.2f}{:>9}".format(shanghai_time_str(ts), avg, peak, count))
+    return 0
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ["relay"]:
+        relay_main()
+    elif sys.argv[1:2] == ["history"]:
+        sys.exit(history_main(sys.argv[2:]))
+    else:
+        main(True)
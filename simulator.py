@@ -0,0 +1,407 @@
+# -*- encoding: utf-8 -*-
+"""
+@File    :   simulator.py
+@Description:   上报链路的集群模拟器 / 压测工具
+
+用法：
+  python simulator.py [--hosts 1000] [--interval 2] [--duration 20] [--workers 4]
+                      [--format legacy|raw|msgpack] [--gzip] [--delta] [--no-keep-alive]
+      在本机启动一个模拟的 /api/host/update_host_details 服务（独立进程），
+      由 --workers 个进程、每个进程一个 asyncio 事件循环驱动 --hosts 台虚拟主机，
+      每台主机按 --interval 秒上报合成指标（HostSample.to_wire，编码路径与 SystemMonitor 相同）。
+      输出实际请求速率、延迟分位数、线路字节数与每台主机的客户端 CPU 开销。
+
+  python simulator.py --compare [--hosts 1000] ...
+      依次运行各上报格式与模式，输出对比表
+
+  --target http://10.0.0.5:8900
+      不启动模拟服务，直接压测已有的服务端或中继（python client.py relay）
+"""
+
+import argparse
+import asyncio
+import gzip
+import json
+import multiprocessing
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import urlsplit
+
+import bench
+import client
+
+
+UPDATE_PATH = "/api/host/update_host_details"
+
+# --compare 运行的场景：(名称, format, gzip, delta, keep_alive)
+COMPARE_SCENARIOS = [
+    ("legacy", "legacy", False, False, True),
+    ("legacy no-keepalive", "legacy", False, False, False),
+    ("raw", "raw", False, False, True),
+    ("raw+gzip", "raw", True, False, True),
+    ("raw+delta", "raw", False, True, True),
+    ("msgpack", "msgpack", False, False, True),
+    ("msgpack+gzip", "msgpack", True, False, True),
+    ("msgpack+delta", "msgpack", False, True, True),
+]
+
+
+def raise_fd_limit():
+    """
+    每台虚拟主机一条连接，尽量把打开文件数上限调到硬上限。
+    """
+    try:
+        import resource
+    except ImportError:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if hard == resource.RLIM_INFINITY or hard > soft:
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard if hard != resource.RLIM_INFINITY else 1 << 20, hard))
+        except (ValueError, OSError):
+            pass
+
+
+# ============================
+# 模拟服务端
+# ============================
+async def serve_connection(reader, writer, stats, latency, decode):
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            headers = {}
+            while True:
+                header = await reader.readline()
+                if header in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = header.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+            body = await reader.readexactly(int(headers.get("content-length", 0)))
+            stats["requests"] += 1
+            stats["bytes"] += len(line) + len(body)
+            if decode:
+                if headers.get("content-encoding") == "gzip":
+                    body = gzip.decompress(body)
+                client.decode_payload(body, headers.get("content-type", "application/json"))
+            if latency:
+                await asyncio.sleep(latency)
+            out = b'{"code": 200, "message": "success"}'
+            writer.write(
+                b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nContent-Length: "
+                + str(len(out)).encode() + b"\r\n\r\n" + out
+            )
+            await writer.drain()
+            if headers.get("connection", "").lower() == "close":
+                break
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+def run_mock_server(port_queue, stop, result_queue, latency, decode):
+    stats = {"requests": 0, "bytes": 0}
+
+    async def main():
+        server = await asyncio.start_server(
+            lambda r, w: serve_connection(r, w, stats, latency, decode),
+            "127.0.0.1", 0, backlog=4096
+        )
+        port_queue.put(server.sockets[0].getsockname()[1])
+        start_cpu = time.process_time()
+        while not stop.is_set():
+            await asyncio.sleep(0.2)
+        server.close()
+        stats["process_cpu"] = time.process_time() - start_cpu
+
+    raise_fd_limit()
+    asyncio.run(main())
+    result_queue.put(stats)
+
+
+# ============================
+# 虚拟主机
+# ============================
+class VirtualHost:
+    """
+    一台虚拟主机：合成指标随机游走，状态保存在 HostSample 中，编码路径与
+    SystemMonitor.build_snapshot + upload_info 一致（HostSample.to_wire / 增量 / msgpack / gzip），
+    通过 asyncio 连接上报。
+    """
+    def __init__(self, index, args, formatters=None):
+        self.rnd = random.Random(index)
+        self.sample = bench.synthetic_sample(args.cores, args.nics, args.disks, args.top_processes, seed=index)
+        self.sample.secret_key = "{:032x}".format(index)
+        self.interval = args.interval
+        # legacy 格式的转换函数，raw / msgpack 为 None（与 SystemMonitor.wire_formatters 相同）
+        self.formatters = formatters
+        self.wire_format = "msgpack" if args.format == "msgpack" else "json"
+        self.gzip = args.gzip
+        self.keep_alive = args.keep_alive
+        self.delta_encoder = client.DeltaEncoder() if args.delta else None
+        self.reader = None
+        self.writer = None
+
+    def tick(self):
+        rnd = self.rnd
+        sample = self.sample
+        walk = lambda v, step: round(min(max(v + rnd.uniform(-step, step), 0), 100), 2)
+        sample.cpu_usage = walk(sample.cpu_usage, 5)
+        sample.mem_percent = walk(sample.mem_percent, 1)
+        sample.mem_used = int(sample.mem_total * sample.mem_percent / 100)
+        sample.sent_speed = round(rnd.uniform(0, 1e4), 2)
+        sample.recv_speed = round(rnd.uniform(0, 1e4), 2)
+        sample.network_sent += int(sample.sent_speed * 1024 * self.interval)
+        sample.network_received += int(sample.recv_speed * 1024 * self.interval)
+        sample.network_pocket_sent += rnd.randint(0, 5000)
+        sample.process_count += rnd.randint(-3, 3)
+        sample.cpu_cores = [(name, walk(usage, 5), iowait, steal) for name, usage, iowait, steal in sample.cpu_cores]
+        sample.uptime += self.interval
+        sample.last_update = client.now_shanghai_str()
+
+    def encode(self):
+        data = self.sample.to_wire(self.formatters)
+        if self.delta_encoder is not None:
+            data = self.delta_encoder.encode(data)
+        body, headers = client.encode_payload(data, self.wire_format)
+        payload_size = len(body)
+        if self.gzip and len(body) >= 256:
+            body = gzip.compress(body, compresslevel=5)
+            headers["Content-Encoding"] = "gzip"
+        headers[client.SECRET_KEY_HEADER] = self.sample.secret_key
+        return body, headers, payload_size
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+    async def post(self, host, port, body, headers):
+        """
+        返回 (状态码, 响应 bytes, 发送字节数, 是否新建连接)
+        """
+        fresh = self.writer is None
+        if fresh:
+            self.reader, self.writer = await asyncio.open_connection(host, port)
+        head = "POST {} HTTP/1.1\r\nHost: {}:{}\r\nContent-Length: {}\r\nConnection: {}\r\n".format(
+            UPDATE_PATH, host, port, len(body), "keep-alive" if self.keep_alive else "close")
+        head += "".join("{}: {}\r\n".format(k, v) for k, v in headers.items()) + "\r\n"
+        request = head.encode("latin-1") + body
+        self.writer.write(request)
+        await self.writer.drain()
+        status = int((await self.reader.readline()).split()[1])
+        length = 0
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            if name.strip().lower() == "content-length":
+                length = int(value)
+        content = await self.reader.readexactly(length)
+        if not self.keep_alive:
+            self.close()
+        return status, content, len(request), fresh
+
+
+async def run_host(vhost, host, port, start, deadline, stats):
+    loop = asyncio.get_running_loop()
+    # 各主机的上报时刻在一个周期内均匀错开
+    tick = start + vhost.rnd.uniform(0, vhost.interval)
+    while tick < deadline:
+        delay = tick - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        vhost.tick()
+        body, headers, payload_size = vhost.encode()
+        sent = time.perf_counter()
+        try:
+            status, content, wire, fresh = await asyncio.wait_for(vhost.post(host, port, body, headers), 10)
+            ok = status == 200 and json.loads(content.decode()).get("code") == 200
+        except Exception:
+            vhost.close()
+            ok, wire, fresh = False, 0, False
+        stats["latencies"].append(time.perf_counter() - sent)
+        stats["requests"] += 1
+        stats["wire_bytes"] += wire
+        stats["payload_bytes"] += payload_size
+        stats["connections"] += fresh
+        if ok:
+            if vhost.delta_encoder is not None:
+                vhost.delta_encoder.ack()
+        else:
+            stats["errors"] += 1
+            if vhost.delta_encoder is not None:
+                vhost.delta_encoder.reset()
+        # 固定节拍；上报耗时超过周期时跳过错过的节拍
+        tick += vhost.interval
+        now = loop.time()
+        if tick < now:
+            missed = int((now - tick) // vhost.interval) + 1
+            stats["skipped"] += missed
+            tick += missed * vhost.interval
+    vhost.close()
+
+
+def run_worker(args, first, count, host, port, start_at):
+    raise_fd_limit()
+    stats = {"requests": 0, "errors": 0, "skipped": 0, "wire_bytes": 0,
+             "payload_bytes": 0, "connections": 0, "latencies": []}
+    formatters = None if args.format in ("raw", "msgpack") else client.SystemMonitor.legacy_formatters()
+    vhosts = [VirtualHost(i, args, formatters) for i in range(first, first + count)]
+
+    async def main():
+        loop = asyncio.get_running_loop()
+        # 各进程在同一时刻开始；CPU 只统计上报阶段，不含虚拟主机的初始化
+        await asyncio.sleep(max(start_at - time.time(), 0))
+        start = loop.time()
+        cpu_start = time.process_time()
+        await asyncio.gather(*[
+            run_host(v, host, port, start, start + args.duration, stats) for v in vhosts
+        ])
+        stats["cpu"] = time.process_time() - cpu_start
+
+    asyncio.run(main())
+    return stats
+
+
+# ============================
+# 场景运行与汇总
+# ============================
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(int(len(sorted_values) * p), len(sorted_values) - 1)]
+
+
+def run_scenario(args):
+    server = None
+    if args.target:
+        parts = urlsplit(args.target)
+        host, port = parts.hostname, parts.port or 80
+    else:
+        port_queue, result_queue = multiprocessing.Queue(), multiprocessing.Queue()
+        stop = multiprocessing.Event()
+        server = multiprocessing.Process(
+            target=run_mock_server,
+            args=(port_queue, stop, result_queue, args.server_latency / 1000, not args.no_decode),
+            daemon=True
+        )
+        server.start()
+        host, port = "127.0.0.1", port_queue.get(timeout=10)
+
+    workers = max(min(args.workers, args.hosts), 1)
+    share, extra = divmod(args.hosts, workers)
+    start_at = time.time() + 1 + args.hosts / 5000
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = []
+        first = 0
+        for i in range(workers):
+            count = share + (1 if i < extra else 0)
+            futures.append(pool.submit(run_worker, args, first, count, host, port, start_at))
+            first += count
+        results = [f.result() for f in futures]
+
+    server_stats = None
+    if server is not None:
+        stop.set()
+        server_stats = result_queue.get(timeout=10)
+        server.join(timeout=5)
+
+    total = {key: sum(r[key] for r in results) for key in
+             ("requests", "errors", "skipped", "wire_bytes", "payload_bytes", "connections", "cpu")}
+    latencies = sorted(lat for r in results for lat in r["latencies"])
+    requests = max(total["requests"], 1)
+    return {
+        "req_s": total["requests"] / args.duration,
+        "target_req_s": args.hosts / args.interval,
+        "requests": total["requests"],
+        "errors": total["errors"],
+        "skipped": total["skipped"],
+        "connections": total["connections"],
+        "p50": percentile(latencies, 0.50) * 1000,
+        "p90": percentile(latencies, 0.90) * 1000,
+        "p99": percentile(latencies, 0.99) * 1000,
+        "max": (latencies[-1] if latencies else 0.0) * 1000,
+        "wire_per_req": total["wire_bytes"] / requests,
+        "payload_per_req": total["payload_bytes"] / requests,
+        "wire_mb_s": total["wire_bytes"] / args.duration / 1024**2,
+        "client_us_req": total["cpu"] / requests * 1e6,
+        # 每台主机每秒消耗的客户端 CPU（µs）
+        "client_us_host_s": total["cpu"] / args.hosts / args.duration * 1e6,
+        "client_cores": total["cpu"] / args.duration,
+        "server_us_req": (server_stats["process_cpu"] / max(server_stats["requests"], 1) * 1e6
+                          if server_stats else None),
+    }
+
+
+def describe(args):
+    return "hosts={} interval={}s duration={}s workers={} format={} gzip={} delta={} keep-alive={}".format(
+        args.hosts, args.interval, args.duration, args.workers, args.format,
+        "on" if args.gzip else "off", "on" if args.delta else "off", "on" if args.keep_alive else "off")
+
+
+def print_report(args, r):
+    print(describe(args))
+    print("requests   {} ({:.1f} req/s, target {:.1f})  errors {}  skipped ticks {}  connections {}".format(
+        r["requests"], r["req_s"], r["target_req_s"], r["errors"], r["skipped"], r["connections"]))
+    print("latency    p50 {:.2f} ms  p90 {:.2f} ms  p99 {:.2f} ms  max {:.2f} ms".format(
+        r["p50"], r["p90"], r["p99"], r["max"]))
+    print("wire       {:.0f} B/request (payload {:.0f} B)  {:.2f} MB/s".format(
+        r["wire_per_req"], r["payload_per_req"], r["wire_mb_s"]))
+    print("client CPU {:.1f} µs/request  {:.1f} µs per host-second  {:.2f} cores total".format(
+        r["client_us_req"], r["client_us_host_s"], r["client_cores"]))
+    if r["server_us_req"] is not None:
+        print("mock server CPU {:.1f} µs/request".format(r["server_us_req"]))
+
+
+def print_compare(rows):
+    print("{:<22}{:>10}{:>9}{:>9}{:>10}{:>12}{:>12}{:>8}".format(
+        "scenario", "req/s", "p50 ms", "p99 ms", "B/req", "client µs", "server µs", "errors"))
+    for name, r in rows:
+        print("{:<22}{:>10.1f}{:>9.2f}{:>9.2f}{:>10.0f}{:>12.1f}{:>12}{:>8}".format(
+            name, r["req_s"], r["p50"], r["p99"], r["wire_per_req"], r["client_us_req"],
+            "-" if r["server_us_req"] is None else "{:.1f}".format(r["server_us_req"]), r["errors"]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="上报链路集群模拟器")
+    parser.add_argument("--hosts", type=int, default=1000, help="虚拟主机数")
+    parser.add_argument("--interval", type=float, default=2.0, help="每台主机的上报周期（秒）")
+    parser.add_argument("--duration", type=float, default=20.0, help="运行时长（秒）")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="压测进程数")
+    parser.add_argument("--format", choices=("legacy", "raw", "msgpack"), default="legacy")
+    parser.add_argument("--gzip", action="store_true")
+    parser.add_argument("--delta", action="store_true", help="增量上报")
+    parser.add_argument("--no-keep-alive", dest="keep_alive", action="store_false")
+    parser.add_argument("--compare", action="store_true", help="依次运行所有格式 / 模式并对比")
+    parser.add_argument("--target", help="压测已有服务，如 http://127.0.0.1:8900；默认启动模拟服务")
+    parser.add_argument("--server-latency", type=float, default=0.0, help="模拟服务的处理延迟（毫秒）")
+    parser.add_argument("--no-decode", action="store_true", help="模拟服务不解码请求体")
+    parser.add_argument("--cores", type=int, default=8, help="每台虚拟主机的核心数")
+    parser.add_argument("--nics", type=int, default=2)
+    parser.add_argument("--disks", type=int, default=4)
+    parser.add_argument("--top-processes", type=int, default=0)
+    args = parser.parse_args()
+    raise_fd_limit()
+
+    if not args.compare:
+        print_report(args, run_scenario(args))
+        return 0
+
+    rows = []
+    for name, fmt, use_gzip, delta, keep_alive in COMPARE_SCENARIOS:
+        args.format, args.gzip, args.delta, args.keep_alive = fmt, use_gzip, delta, keep_alive
+        print("running {} ...".format(name), file=sys.stderr)
+        rows.append((name, run_scenario(args)))
+    print_compare(rows)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
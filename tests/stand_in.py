@@ -0,0 +1,114 @@
+# -*- encoding: utf-8 -*-
+"""
+测试用的本地 API 替身（http.server）：统计连接数与请求字节，记录解码后的请求体，
+按 mode 返回成功、繁忙、重同步或直接断开连接，可注入响应延迟。
+"""
+import gzip
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import client  # noqa: E402
+
+# 测试输出中不打印客户端日志
+logging.disable(logging.CRITICAL)
+
+UPDATE_PATH = "/api/host/update_host_details"
+
+# mode -> 响应 code（"reset" 不返回响应，直接断开连接）
+MODE_CODES = {"ok": 200, "busy": 503, "resync": 409}
+
+
+class StandInServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), StandInHandler)
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.body_bytes = 0
+        # [(path, 解码后的请求体)]
+        self.requests = []
+        self.mode = "ok"
+        # 每个请求在响应前等待的秒数
+        self.delay = 0
+        # 每处理 close_every 个请求后主动断开连接（0 表示不断开）
+        self.close_every = 0
+        self.thread = None
+
+    def get_request(self):
+        sock, addr = super().get_request()
+        with self.lock:
+            self.connections += 1
+        return sock, addr
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, args=(0.05,), daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    @property
+    def base_url(self):
+        return "http://127.0.0.1:{}".format(self.server_address[1])
+
+    def url(self, path=UPDATE_PATH):
+        return self.base_url + path
+
+    def bodies(self, path=UPDATE_PATH):
+        with self.lock:
+            return [body for p, body in self.requests if p == path]
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # 响应头与响应体分两次写出，避免 Nagle + 延迟 ACK 拖慢每个请求
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        with server.lock:
+            server.body_bytes += len(body)
+            mode, delay = server.mode, server.delay
+        if delay:
+            time.sleep(delay)
+        if mode == "reset":
+            self.close_connection = True
+            return
+        if self.headers.get("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+        data = client.decode_payload(body, self.headers.get("Content-Type", ""))
+        with server.lock:
+            server.requests.append((self.path, data))
+            count = len(server.requests)
+            drop = server.close_every and count % server.close_every == 0
+        out = json.dumps({"code": MODE_CODES[mode], "message": mode}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(out)))
+        self.end_headers()
+        self.wfile.write(out)
+        if drop:
+            self.close_connection = True
+
+    def log_message(self, format, *args):
+        pass
+
+
+def quiet_options(**options):
+    """
+    不写任何本地文件、不启动后台线程的 SystemMonitor 选项
+    """
+    base = {"static_cache": "", "history_file": "", "spool_slots": 0, "metrics_port": 0}
+    base.update(options)
+    return base
@@ -0,0 +1,85 @@
+# -*- encoding: utf-8 -*-
+"""
+增量上报：连接重建后、顶层字段消失时必须发送全量快照。
+"""
+import unittest
+from unittest import mock
+
+from stand_in import StandInServer, client, quiet_options
+
+
+class DeltaUploadTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = StandInServer().start()
+        self.monitor = self.make_monitor(keep_alive=True)
+
+    def tearDown(self):
+        self.server.stop()
+
+    def make_monitor(self, **options):
+        monitor = client.SystemMonitor(
+            "k", self.server.base_url, autostart=False,
+            options=quiet_options(delta_upload=True, payload_format="raw", **options))
+        for transport in monitor.transports:
+            self.addCleanup(transport.close)
+        return monitor
+
+    def upload(self, tick, monitor=None, **fields):
+        monitor = monitor or self.monitor
+        snapshot = {"secretKey": "k", "lastUpdate": tick, "os": "Linux", "cpuUsage": tick % 3}
+        snapshot.update(fields)
+        monitor.upload_info(snapshot, monitor.transports[0], 0)
+
+    def payload_types(self):
+        return [body["payloadType"] for body in self.server.bodies()]
+
+    def test_deltas_follow_full_on_same_connection(self):
+        for tick in range(5):
+            self.upload(tick)
+        self.assertEqual(self.payload_types(), ["full"] + ["delta"] * 4)
+        self.assertEqual(self.server.connections, 1)
+
+    def test_full_snapshot_after_reconnect(self):
+        # 服务端每 3 个请求断开连接：每条新连接上的第一个上报都是全量
+        self.server.close_every = 3
+        for tick in range(9):
+            self.upload(tick)
+        self.assertEqual(self.payload_types(), ["full", "delta", "delta"] * 3)
+        self.assertEqual(self.server.connections, 3)
+
+    def test_delta_never_sent_on_renewed_connection(self):
+        # 发送前未察觉连接已关闭：增量不重发到新连接上，而是在新连接上改发全量
+        self.server.close_every = 3
+        with mock.patch.object(client.HttpTransport, "dropped", staticmethod(lambda sock: False)):
+            for tick in range(9):
+                self.upload(tick)
+        self.assertEqual(self.payload_types(), ["full", "delta", "delta"] * 3)
+        self.assertEqual(self.server.connections, 3)
+
+    def test_full_snapshot_when_key_disappears(self):
+        self.upload(0, psiCpuSome=1.5)
+        self.upload(1, psiCpuSome=2.5)
+        self.upload(2)
+        self.upload(3)
+        self.assertEqual(self.payload_types(), ["full", "delta", "full", "delta"])
+        self.assertNotIn("psiCpuSome", self.server.bodies()[2])
+
+    def test_removed_list_items_travel_in_delta(self):
+        self.upload(0, disks=[["/", "ext4", 10, 50.0], ["/data", "xfs", 20, 10.0]])
+        self.upload(1, disks=[["/", "ext4", 10, 50.0]])
+        bodies = self.server.bodies()
+        self.assertEqual(bodies[1]["payloadType"], "delta")
+        self.assertEqual(bodies[1]["disks"], [["/", "ext4", 10, 50.0]])
+
+    def test_short_connections_always_send_full(self):
+        # 短连接模式下每次上报都是新连接
+        monitor = self.make_monitor(keep_alive=False)
+        for tick in range(4):
+            self.upload(tick, monitor=monitor)
+        self.assertEqual(self.payload_types(), ["full"] * 4)
+        self.assertEqual(self.server.connections, 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,125 @@
+# -*- encoding: utf-8 -*-
+"""
+熔断与故障转移：两个替身 API 按指令失败 / 恢复，上报经 upload_worker 发出，
+覆盖熔断、半开探测、恢复切回以及 api_address 备用地址。
+"""
+import time
+import unittest
+
+from stand_in import StandInServer, client, quiet_options
+
+OPEN_SECONDS = 0.2
+
+
+class EndpointPoolTest(unittest.TestCase):
+
+    def test_probe_in_flight_is_not_a_failover(self):
+        pool = client.EndpointPool(["http://a", "http://b"], threshold=2,
+                                   open_seconds=OPEN_SECONDS, max_open_seconds=OPEN_SECONDS)
+        pool.failure(0)
+        pool.failure(0)
+        self.assertEqual(pool.acquire(), 1)
+        self.assertEqual(pool.failovers, 1)
+        time.sleep(OPEN_SECONDS + 0.05)
+        # 主地址熔断到期：一个探测请求发往主地址，探测结果出来之前其余请求继续使用备用地址
+        self.assertEqual(pool.acquire(), 0)
+        self.assertEqual([pool.acquire() for _ in range(10)], [1] * 10)
+        self.assertEqual(pool.failovers, 1)
+        self.assertEqual(pool.current, 1)
+        pool.success(0)
+        self.assertEqual(pool.acquire(), 0)
+        self.assertEqual(pool.failovers, 2)
+        self.assertEqual(pool.current, 0)
+
+
+class FailoverUploadTest(unittest.TestCase):
+
+    def setUp(self):
+        self.primary = StandInServer().start()
+        self.backup = StandInServer().start()
+        self.addCleanup(self.primary.stop)
+        self.addCleanup(self.backup.stop)
+        self.monitor = client.SystemMonitor(
+            "k", "{},{}".format(self.primary.base_url, self.backup.base_url), autostart=False,
+            options=quiet_options(breaker_threshold=2, breaker_open_seconds=OPEN_SECONDS,
+                                  breaker_max_open_seconds=OPEN_SECONDS, payload_format="raw"))
+        for transport in self.monitor.transports:
+            self.addCleanup(transport.close)
+        self.tick = 0
+
+    def upload(self, count=1):
+        """
+        经真实的 upload_worker 上报 count 个样本；样本取完后置位 stop_event 结束工作循环
+        """
+        snapshots = []
+        for _ in range(count):
+            self.tick += 1
+            snapshots.append({"secretKey": "k", "lastUpdate": self.tick, "tick": self.tick})
+        snapshots.reverse()
+
+        def get(timeout=None):
+            if snapshots:
+                return snapshots.pop()
+            self.monitor.stop()
+            return None
+
+        self.monitor.sample_queue.get = get
+        self.monitor.stop_event.clear()
+        self.monitor.upload_worker(self.monitor.transports[0])
+
+    def ticks(self, server):
+        return [body["tick"] for body in server.bodies()]
+
+    def uploads(self, result):
+        return self.monitor.telemetry.counter("uploads_total", "result", result)
+
+    def breaker(self, index):
+        return self.monitor.endpoints.breakers[index]
+
+    def test_breaker_opens_and_fails_over_to_backup(self):
+        self.primary.mode = "busy"
+        self.upload(2)
+        self.assertEqual(self.breaker(0).state, client.CircuitBreaker.OPEN)
+        self.upload(3)
+        # 熔断期间不再请求主地址，样本改发备用地址
+        self.assertEqual(len(self.primary.bodies()), 2)
+        self.assertEqual(self.ticks(self.backup), [3, 4, 5])
+        self.assertEqual(self.monitor.endpoints.current, 1)
+        self.assertEqual(self.monitor.endpoints.failovers, 1)
+
+    def test_failed_half_open_probe_reopens(self):
+        self.primary.mode = "reset"
+        self.upload(3)
+        time.sleep(OPEN_SECONDS + 0.05)
+        self.upload(3)
+        # 到期后第一个样本作为探测发往主地址，失败后再次熔断，其余样本仍发往备用地址
+        self.assertEqual(self.breaker(0).state, client.CircuitBreaker.OPEN)
+        self.assertEqual(self.ticks(self.backup), [3, 5, 6])
+        self.assertEqual(self.monitor.endpoints.failovers, 1)
+        self.assertEqual(self.uploads("failure"), 3)
+
+    def test_recovered_primary_takes_over_again(self):
+        self.primary.mode = "busy"
+        self.upload(3)
+        self.primary.mode = "ok"
+        time.sleep(OPEN_SECONDS + 0.05)
+        self.upload(3)
+        self.assertEqual(self.breaker(0).state, client.CircuitBreaker.CLOSED)
+        # 1、2 为熔断前返回繁忙的请求
+        self.assertEqual(self.ticks(self.primary), [1, 2, 4, 5, 6])
+        self.assertEqual(self.ticks(self.backup), [3])
+        self.assertEqual(self.monitor.endpoints.current, 0)
+        self.assertEqual(self.monitor.endpoints.failovers, 2)
+
+    def test_all_endpoints_open_skips_requests(self):
+        self.primary.mode = self.backup.mode = "busy"
+        self.upload(4)
+        self.upload(3)
+        # 两个地址各失败 2 次后全部熔断，之后的样本不再发请求
+        self.assertEqual(self.uploads("failure"), 4)
+        self.assertEqual(self.uploads("skipped"), 3)
+        self.assertIsNone(self.monitor.endpoints.acquire())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,46 @@
+# -*- encoding: utf-8 -*-
+"""
+MetricHistory 归档选择：--since 1h 这类整点区间应选用恰好覆盖它的最细归档。
+"""
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from stand_in import client
+
+
+class MetricHistoryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.history = client.MetricHistory(
+            os.path.join(self.dir, "history.rrd"), ("cpu_usage",),
+            client.MetricHistory.parse_archives("1:3600,60:1440,600:4320"))
+        self.addCleanup(self.history.close)
+
+    def test_one_hour_uses_one_second_archive(self):
+        now = time.time()
+        for offset in range(10):
+            self.history.update({"cpu_usage": 50.0 + offset}, now - offset)
+        for _ in range(50):
+            now = time.time()
+            start = client.parse_history_time("1h", now)
+            step, points = self.history.read("cpu_usage", start, now, now=now)
+            self.assertEqual(step, 1)
+        self.assertEqual(len(points), 10)
+
+    def test_longer_ranges_use_coarser_archives(self):
+        now = 1700000000.5
+        self.assertEqual(self.history.pick_archive(now - 3601 - 1, now), 1)
+        self.assertEqual(self.history.pick_archive(now - 86400, now), 1)
+        self.assertEqual(self.history.pick_archive(now - 2 * 86400, now), 2)
+        # 都不覆盖时取跨度最长的归档
+        self.assertEqual(self.history.pick_archive(now - 365 * 86400, now), 2)
+        self.assertEqual(self.history.pick_archive(now - 60, now, step=600), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+# -*- encoding: utf-8 -*-
+"""
+HostSample.to_wire 的上报格式（客户端、bench 与 simulator 共用的唯一编码路径）。
+"""
+import unittest
+
+from stand_in import client
+
+
+def make_sample():
+    sample = client.HostSample("k" * 32)
+    sample.update({
+        "cpu_usage": 12.5,
+        "mem_total": 64 * 1024 ** 3,
+        "mem_used": 1536 * 1024 ** 2,
+        "network_sent": 1000,
+        "sent_speed": 12.5,
+        "uptime": 90061,
+        "disks": [("/", 512 * 1024 ** 3, 128 * 1024 ** 3, 25.0)],
+        "top_cpu_processes": [(1, "init", "/sbin/init", 0.5, 8 * 1024 ** 2)],
+        "metric_stats": {"cpu_usage": {"min": 1.0, "p95": 9.0}},
+        "agent_stats": {"queue_depth": 0, "api_failovers": 1},
+        "psi_cpu_some": 0.25,
+    })
+    return sample
+
+
+class HostSampleWireTest(unittest.TestCase):
+
+    def test_raw_wire_keys_and_values(self):
+        wire = make_sample().to_wire()
+        self.assertEqual(wire["cpuUsage"], 12.5)
+        self.assertEqual(wire["memTotal"], 64 * 1024 ** 3)
+        self.assertEqual(wire["psiCpuSome"], 0.25)
+        self.assertEqual(wire["secretKey"], "k" * 32)
+        self.assertEqual(wire["metricStats"], {"cpuUsage": {"min": 1.0, "p95": 9.0}})
+        self.assertEqual(wire["agentStats"], {"queueDepth": 0, "apiFailovers": 1})
+        # 未赋值的可选字段不上报，基础字段始终上报
+        self.assertNotIn("lastUpdate", wire)
+        self.assertNotIn("cgroupPath", wire)
+        self.assertIsNone(wire["swapTotal"])
+        self.assertEqual(wire["topMemProcesses"], [])
+
+    def test_legacy_wire_values(self):
+        wire = make_sample().to_wire(client.SystemMonitor.legacy_formatters())
+        self.assertEqual(wire["memTotal"], "64.0 GB")
+        self.assertEqual(wire["memUsed"], "1.5 GB")
+        self.assertEqual(wire["networkSent"], "1000 B")
+        self.assertEqual(wire["sentSpeed"], "12.5 KB/s")
+        self.assertEqual(wire["uptime"], "1days 1hours 1minutes 1seconds")
+        self.assertEqual(wire["disks"], [("/", "512.0 GB", "128.0 GB", 25.0)])
+        self.assertEqual(wire["topCpuProcesses"], [(1, "init", "/sbin/init", 0.5, "8.0 MB")])
+        # 未采集的值保持 None，不做转换
+        self.assertIsNone(wire["swapTotal"])
+        self.assertEqual(wire["agentStats"], {"queueDepth": 0, "apiFailovers": 1})
+
+    def test_wire_keys_match_field_order(self):
+        wire = make_sample().to_wire()
+        expected = [key for name, key in client.HostSample.WIRE_FIELDS if name in make_sample()]
+        self.assertEqual(list(wire), expected)
+
+    def test_sample_has_no_instance_dict(self):
+        sample = make_sample()
+        self.assertFalse(hasattr(sample, "__dict__"))
+        with self.assertRaises(AttributeError):
+            sample.unknown_field = 1
+
+
+if __name__ == "__main__":
+    unittest.main()
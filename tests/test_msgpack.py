@@ -0,0 +1,70 @@
+# -*- encoding: utf-8 -*-
+"""
+msgpack 子集编码：各类型在长度 / 取值边界上编码后经 decode_payload 还原为原值。
+"""
+import unittest
+
+from stand_in import client
+
+INTS = [
+    0, 1, 0x7f, 0x80, 0xff, 0x100, 0xffff, 0x10000, 0xffffffff, 0x100000000, 2**64 - 1,
+    -1, -0x20, -0x21, -0x80, -0x81, -0x8000, -0x8001, -0x80000000, -0x80000001, -2**63,
+]
+FLOATS = [0.0, -0.0, 0.5, -2.25, 12.34, 0.1, 1e-7, 123456.78, 3.5e38, -1e300, float("inf")]
+
+
+def roundtrip(obj):
+    body, headers = client.encode_payload(obj, "msgpack")
+    return client.decode_payload(body, headers["Content-Type"])
+
+
+class MsgpackRoundTripTest(unittest.TestCase):
+
+    def assertRoundTrip(self, obj):
+        decoded = roundtrip(obj)
+        self.assertEqual(decoded, obj)
+        self.assertIs(type(decoded), type(obj))
+
+    def test_ints(self):
+        for value in INTS:
+            with self.subTest(value=value):
+                self.assertRoundTrip(value)
+
+    def test_int_widths(self):
+        self.assertEqual(len(client.msgpack_dumps(0x7f)), 1)
+        self.assertEqual(len(client.msgpack_dumps(-0x20)), 1)
+        self.assertEqual(len(client.msgpack_dumps(0xff)), 2)
+        self.assertEqual(len(client.msgpack_dumps(-0x8001)), 5)
+        self.assertEqual(len(client.msgpack_dumps(2**64 - 1)), 9)
+
+    def test_floats_are_exact(self):
+        for value in FLOATS:
+            with self.subTest(value=value):
+                self.assertRoundTrip(value)
+        # 0.5 可用 float32 精确表示，12.34 不行
+        self.assertEqual(client.msgpack_dumps(0.5)[0], 0xca)
+        self.assertEqual(client.msgpack_dumps(12.34)[0], 0xcb)
+
+    def test_str_and_bytes_lengths(self):
+        for n in (0, 31, 32, 0xff, 0x100, 0xffff, 0x10000):
+            with self.subTest(n=n):
+                self.assertRoundTrip("a" * n)
+                self.assertRoundTrip(b"\x00" * n)
+        self.assertRoundTrip("中文主机名")
+
+    def test_containers(self):
+        for n in (0, 15, 16, 0xffff, 0x10000):
+            with self.subTest(n=n):
+                self.assertRoundTrip(list(range(n)))
+                self.assertRoundTrip({"k{}".format(i): i for i in range(n)})
+
+    def test_nested(self):
+        self.assertRoundTrip({
+            "none": None, "flags": [True, False],
+            "disks": [{"device": "/dev/sda1", "usage": 42.17, "total": 0xffffffff + 1}],
+            "nested": {"a": {"b": [[], {}, -1, 1.5]}},
+        })
+
+
+if __name__ == "__main__":
+    unittest.main()
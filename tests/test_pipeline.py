@@ -0,0 +1,83 @@
+# -*- encoding: utf-8 -*-
+"""
+采集 / 上报流水线：替身服务端注入延迟让上报卡住时，采集节拍保持稳定，
+队列按 drop_oldest / coalesce 策略丢弃或合并样本。
+"""
+import threading
+import time
+import unittest
+
+from stand_in import StandInServer, client, quiet_options
+
+
+class PipelineStallTest(unittest.TestCase):
+    INTERVAL = 0.1
+    DURATION = 2.0
+    UPLOAD_DELAY = 0.5
+    QUEUE_SIZE = 3
+
+    def setUp(self):
+        self.server = StandInServer().start()
+        self.server.delay = self.UPLOAD_DELAY
+        self.addCleanup(self.server.stop)
+
+    def run_pipeline(self, policy):
+        monitor = client.SystemMonitor(
+            "k", self.server.base_url, autostart=False,
+            options=quiet_options(sample_interval=self.INTERVAL, upload_interval=self.INTERVAL,
+                                  queue_size=self.QUEUE_SIZE, queue_policy=policy, payload_format="raw"))
+        for transport in monitor.transports:
+            self.addCleanup(transport.close)
+        ticks = []
+        collect_info = monitor.collect_info
+
+        def timed_collect():
+            ticks.append(time.monotonic())
+            collect_info()
+
+        monitor.collect_info = timed_collect
+        threads = [threading.Thread(target=monitor.collect_worker, daemon=True)] + [
+            threading.Thread(target=monitor.upload_worker, args=(t,), daemon=True) for t in monitor.transports]
+        for thread in threads:
+            thread.start()
+        time.sleep(self.DURATION)
+        monitor.stop()
+        for thread in threads:
+            thread.join(self.UPLOAD_DELAY + 2)
+            self.assertFalse(thread.is_alive())
+        return monitor, ticks
+
+    def assert_steady(self, monitor, ticks):
+        gaps = [b - a for a, b in zip(ticks, ticks[1:])]
+        expected = self.DURATION / self.INTERVAL
+        self.assertGreaterEqual(len(ticks), expected * 0.8)
+        self.assertLess(max(gaps), self.INTERVAL * 2)
+        self.assertAlmostEqual(sum(gaps) / len(gaps), self.INTERVAL, delta=self.INTERVAL * 0.1)
+        self.assertEqual(monitor.pipeline_stats["collect_errors"], 0)
+        # 上报被拖慢：只有少量样本送达
+        self.assertLessEqual(len(self.server.bodies()), self.DURATION / self.UPLOAD_DELAY + 1)
+
+    def test_drop_oldest_under_stalled_uploads(self):
+        monitor, ticks = self.run_pipeline("drop_oldest")
+        self.assert_steady(monitor, ticks)
+        stats = monitor.sample_queue.stats
+        self.assertEqual(stats["coalesced"], 0)
+        # 入队的样本要么送达、要么仍在队列 / 上报中，其余都按 drop_oldest 丢弃
+        self.assertGreaterEqual(stats["dropped"], stats["enqueued"] - len(self.server.bodies()) - self.QUEUE_SIZE - 1)
+        self.assertGreater(stats["dropped"], 0)
+        self.assertLessEqual(len(monitor.sample_queue), self.QUEUE_SIZE)
+
+    def test_coalesce_under_stalled_uploads(self):
+        monitor, ticks = self.run_pipeline("coalesce")
+        self.assert_steady(monitor, ticks)
+        stats = monitor.sample_queue.stats
+        self.assertEqual(stats["dropped"], 0)
+        self.assertGreaterEqual(stats["coalesced"], stats["enqueued"] - len(self.server.bodies()) - self.QUEUE_SIZE - 1)
+        self.assertGreater(stats["coalesced"], 0)
+        # 送达的样本按采集顺序排列
+        updates = [body["lastUpdate"] for body in self.server.bodies()]
+        self.assertEqual(updates, sorted(updates))
+
+
+if __name__ == "__main__":
+    unittest.main()
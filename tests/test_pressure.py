@@ -0,0 +1,50 @@
+# -*- encoding: utf-8 -*-
+"""
+PSI 采集项：/proc/pressure 存在但读取失败（内核 psi=0 时返回 EOPNOTSUPP）则不注册。
+/proc 使用 bench.py 生成的合成目录。
+"""
+import errno
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from stand_in import client, quiet_options
+
+import bench
+
+
+@unittest.skipUnless(client.SYSTEM == "Linux", "PSI 仅适用于 Linux")
+class PressureRegistrationTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix="hm_psi_")
+        self.addCleanup(shutil.rmtree, self.root, True)
+        old_roots = client.PROC_ROOT, client.SYS_ROOT
+        self.addCleanup(setattr, client, "PROC_ROOT", old_roots[0])
+        self.addCleanup(setattr, client, "SYS_ROOT", old_roots[1])
+        client.PROC_ROOT, client.SYS_ROOT = bench.build_proc_fixture(self.root, pids=5)
+
+    def make_monitor(self):
+        monitor = client.SystemMonitor("0" * 32, "http://127.0.0.1", autostart=False, options=quiet_options())
+        self.addCleanup(monitor.proc.close)
+        return monitor
+
+    def test_readable_pressure_is_registered(self):
+        monitor = self.make_monitor()
+        self.assertIn("pressure", monitor.collectors.names())
+        monitor.collect_info()
+        self.assertEqual(monitor.pipeline_stats["collect_errors"], 0)
+        self.assertIn("psi_cpu_some", monitor.sample_metrics)
+
+    def test_unsupported_pressure_is_skipped(self):
+        def read_pressure(resource):
+            raise OSError(errno.EOPNOTSUPP, "Operation not supported")
+
+        with mock.patch.object(client.SystemMonitor, "read_pressure", staticmethod(read_pressure)):
+            monitor = self.make_monitor()
+        self.assertNotIn("pressure", monitor.collectors.names())
+
+
+if __name__ == "__main__":
+    unittest.main()
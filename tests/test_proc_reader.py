@@ -0,0 +1,80 @@
+# -*- encoding: utf-8 -*-
+"""
+常驻打开的 /proc 文件：超过初始 4 KB 缓冲区的文件首次读取即完整解析，
+稳态读取不产生持续的内存分配。/proc 使用 bench.py 生成的合成目录。
+"""
+import os
+import shutil
+import tempfile
+import tracemalloc
+import unittest
+
+from stand_in import client, quiet_options
+
+import bench
+
+CORES = 128
+NICS = 64
+
+
+class ProcReaderTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.root = tempfile.mkdtemp(prefix="hm_proc_")
+        cls.old_roots = client.PROC_ROOT, client.SYS_ROOT
+        client.PROC_ROOT, client.SYS_ROOT = bench.build_proc_fixture(cls.root, cores=CORES, nics=NICS, pids=50)
+
+    @classmethod
+    def tearDownClass(cls):
+        client.PROC_ROOT, client.SYS_ROOT = cls.old_roots
+        shutil.rmtree(cls.root, ignore_errors=True)
+
+    def make_monitor(self):
+        # 构造时即读取 /proc/stat、/proc/net/dev（prime_samplers），缓冲区从 4 KB 开始
+        return client.SystemMonitor("0" * 32, "http://127.0.0.1", autostart=False,
+                                    options=quiet_options(net_exclude="lo"))
+
+    def test_fixture_exceeds_initial_buffer(self):
+        for parts in (("stat",), ("net", "dev")):
+            self.assertGreater(os.path.getsize(client.proc_path(*parts)), 4096)
+
+    def test_reader_returns_grown_buffer(self):
+        reader = client.ProcReader()
+        self.addCleanup(reader.close)
+        for parts in (("stat",), ("net", "dev")):
+            buf, size = reader.read(*parts)
+            with open(client.proc_path(*parts), "rb") as f:
+                self.assertEqual(bytes(buf[:size]), f.read())
+
+    def test_first_read_parses_every_line(self):
+        monitor = self.make_monitor()
+        monitor.proc.close()
+        names, counters = monitor.read_cpu_stat_all()
+        self.assertEqual(len(names), CORES + 1)
+        self.assertEqual(len(counters), (CORES + 1) * client.CPU_STAT_FIELDS)
+        monitor.proc.close()
+        names, counters = monitor.read_net_dev_all()
+        self.assertEqual(len(names), NICS)
+        self.assertEqual(len(counters), NICS * client.NET_FIELDS)
+
+    def test_steady_state_reads_do_not_allocate(self):
+        monitor = self.make_monitor()
+        cases = (monitor.read_cpu_stat_all, monitor.read_net_dev_all, monitor.get_linux_memory,
+                 monitor.get_linux_uptime)
+        for func in cases:
+            func()
+        tracemalloc.start()
+        try:
+            for func in cases:
+                base, _ = tracemalloc.get_traced_memory()
+                for _ in range(50):
+                    func()
+                retained, _ = tracemalloc.get_traced_memory()
+                self.assertLess(retained - base, 1024, func.__name__)
+        finally:
+            tracemalloc.stop()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,135 @@
+# -*- encoding: utf-8 -*-
+"""
+中继：多个模拟客户端经中继上报，替身上游只收到合并后的批次；
+未授权的 gzip 请求不解压，解压后超过上限的请求返回 413。
+"""
+import gzip
+import http.client
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from stand_in import StandInServer, client, quiet_options
+
+AGENTS = 20
+UPLOADS = 5
+
+
+class RelayTest(unittest.TestCase):
+
+    def setUp(self):
+        self.upstream = StandInServer().start()
+        self.addCleanup(self.upstream.stop)
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.keys = ["agent-{:02d}".format(i) for i in range(AGENTS)]
+        keys_path = os.path.join(self.dir, "relay_keys.txt")
+        with open(keys_path, "w", encoding="utf-8") as f:
+            f.write("# 测试\n" + "\n".join(self.keys) + "\n")
+        options = dict(client.DEFAULT_OPTIONS)
+        options.update(relay_host="127.0.0.1", relay_port=0, relay_keys=keys_path, relay_flush_interval=0.1,
+                       relay_batch_size=50, relay_upstream_connections=1, breaker_open_seconds=0.2)
+        self.relay = client.Relay(self.upstream.base_url, "relay-key", options)
+        self.server = self.relay.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.relay_url = "http://127.0.0.1:{}".format(self.server.server_address[1])
+
+    def make_agent(self, key):
+        monitor = client.SystemMonitor(
+            key, self.relay_url, autostart=False,
+            options=quiet_options(delta_upload=True, gzip=True, payload_format="raw"))
+        for transport in monitor.transports:
+            self.addCleanup(transport.close)
+        return monitor
+
+    def forwarded(self):
+        """
+        上游收到的 {secretKey: 最新快照}
+        """
+        hosts = {}
+        for body in self.upstream.bodies(client.RELAY_UPSTREAM_PATH):
+            self.assertEqual(body["relayKey"], "relay-key")
+            for snapshot in body["hosts"]:
+                hosts[snapshot["secretKey"]] = snapshot
+        return hosts
+
+    def wait_forwarded(self, expected_tick, timeout=5):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            hosts = self.forwarded()
+            if len(hosts) == AGENTS and all(h["tick"] == expected_tick for h in hosts.values()):
+                return hosts
+            time.sleep(0.05)
+        self.fail("上游没有收到全部主机的最新快照：{}".format(self.forwarded()))
+
+    def upload_round(self, agents, tick):
+        for key, monitor in agents.items():
+            snapshot = {"secretKey": key, "lastUpdate": tick, "os": "Linux", "tick": tick,
+                        "cpuUsage": tick * 1.5, "disks": [["/", "ext4", 1, 10.0]] * 30}
+            monitor.upload_info(snapshot, monitor.transports[0], 0)
+
+    def post(self, body, headers):
+        conn = http.client.HTTPConnection("127.0.0.1", self.server.server_address[1], timeout=10)
+        self.addCleanup(conn.close)
+        conn.request("POST", client.RELAY_UPDATE_PATH, body=body, headers=headers)
+        resp = conn.getresponse()
+        return resp.status, json.loads(resp.read())
+
+    def test_agents_are_coalesced_and_batched(self):
+        agents = {key: self.make_agent(key) for key in self.keys}
+        for tick in range(UPLOADS):
+            self.upload_round(agents, tick)
+        hosts = self.wait_forwarded(UPLOADS - 1)
+        # 增量在中继侧合并成完整快照后转发，协议字段不外泄
+        for key, snapshot in hosts.items():
+            self.assertEqual(snapshot["cpuUsage"], (UPLOADS - 1) * 1.5)
+            self.assertEqual(len(snapshot["disks"]), 30)
+            self.assertNotIn("payloadType", snapshot)
+        batches = self.upstream.bodies(client.RELAY_UPSTREAM_PATH)
+        self.assertLess(len(batches), AGENTS * UPLOADS // 4)
+        self.assertLessEqual(self.upstream.connections, 1)
+        # 客户端以 gzip 上报（中继按请求头中的 secret_key 鉴权后解压）
+        for monitor in agents.values():
+            stats = monitor.transports[0].stats
+            self.assertLess(stats["wire_bytes"], stats["payload_bytes"])
+
+    def test_upstream_outage_requeues_hosts(self):
+        agents = {key: self.make_agent(key) for key in self.keys}
+        self.upstream.mode = "busy"
+        self.upload_round(agents, 0)
+        time.sleep(0.3)
+        self.upload_round(agents, 1)
+        self.upstream.mode = "ok"
+        self.upstream.requests.clear()
+        hosts = self.wait_forwarded(1)
+        self.assertEqual(sorted(hosts), self.keys)
+
+    def test_gzip_with_unknown_key_is_rejected_before_decompression(self):
+        bomb = gzip.compress(bytes(64 * 1024 * 1024), compresslevel=9)
+        inflated = []
+        real = client.zlib.decompressobj
+        client.zlib.decompressobj = lambda *a: inflated.append(a) or real(*a)
+        self.addCleanup(setattr, client.zlib, "decompressobj", real)
+        headers = {"Content-Encoding": "gzip", "Content-Type": "application/json"}
+        self.assertEqual(self.post(bomb, headers)[0], 403)
+        self.assertEqual(self.post(bomb, dict(headers, **{client.SECRET_KEY_HEADER: "intruder"}))[0], 403)
+        self.assertEqual(inflated, [])
+
+    def test_gzip_bomb_with_valid_key_is_capped(self):
+        bomb = gzip.compress(bytes(64 * 1024 * 1024), compresslevel=9)
+        status, body = self.post(bomb, {"Content-Encoding": "gzip", "Content-Type": "application/json",
+                                        client.SECRET_KEY_HEADER: self.keys[0]})
+        self.assertEqual(status, 413)
+
+    def test_plain_body_with_unknown_key_is_rejected(self):
+        body = json.dumps({"secretKey": "intruder", "lastUpdate": 0}).encode("utf-8")
+        self.assertEqual(self.post(body, {"Content-Type": "application/json"})[0], 403)
+        self.assertEqual(self.upstream.bodies(client.RELAY_UPSTREAM_PATH), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
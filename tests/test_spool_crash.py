@@ -0,0 +1,85 @@
+# -*- encoding: utf-8 -*-
+"""
+SampleSpool 崩溃安全：子进程不停写入时被 SIGKILL，重启后只回放 CRC 校验通过的完整样本，
+已回放（删除）的样本不会再次出现。
+"""
+import os
+import random
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+from stand_in import client
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SLOT_COUNT = 64
+
+# 子进程：从 base 开始连续写入样本，直到被杀
+WRITER = """
+import sys
+sys.path.insert(0, {root!r})
+import client
+spool = client.SampleSpool(sys.argv[1], slot_count={slots}, slot_size=4096)
+n = int(sys.argv[2])
+print("ready", flush=True)
+while True:
+    spool.append({{"n": n, "body": "x" * (n % 1500) + str(n)}})
+    n += 1
+"""
+
+
+@unittest.skipUnless(hasattr(signal, "SIGKILL"), "需要 SIGKILL")
+class SpoolCrashTest(unittest.TestCase):
+    ROUNDS = 25
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.path = os.path.join(self.dir, "spool.dat")
+        self.script = WRITER.format(root=ROOT, slots=SLOT_COUNT)
+
+    def kill_writer_midway(self, base):
+        proc = subprocess.Popen([sys.executable, "-c", self.script, self.path, str(base)],
+                                stdout=subprocess.PIPE)
+        self.assertEqual(proc.stdout.readline().strip(), b"ready")
+        time.sleep(random.uniform(0.005, 0.05))
+        proc.send_signal(signal.SIGKILL)
+        proc.wait()
+        proc.stdout.close()
+        self.assertEqual(proc.returncode, -signal.SIGKILL)
+
+    def test_replay_after_sigkill(self):
+        random.seed(7)
+        replayed = set()
+        for round_no in range(self.ROUNDS):
+            self.kill_writer_midway(round_no * 10 ** 6)
+
+            spool = client.SampleSpool(self.path, slot_count=SLOT_COUNT, slot_size=4096)
+            records = spool.peek(SLOT_COUNT)
+            self.assertEqual(len(records), len(spool))
+            self.assertLessEqual(len(records), SLOT_COUNT)
+            seqs = [seq for seq, _ in records]
+            self.assertEqual(seqs, sorted(set(seqs)))
+            for seq, data in records:
+                n = data["n"]
+                # 内容完整（没有半写的样本），且未被回放过
+                self.assertEqual(data["body"], "x" * (n % 1500) + str(n))
+                self.assertNotIn(n, replayed)
+                replayed.add(n)
+            # 模拟回放成功：删除后重新打开，不应再出现
+            spool.remove(seqs)
+            spool.close()
+            spool = client.SampleSpool(self.path, slot_count=SLOT_COUNT, slot_size=4096)
+            self.assertEqual(len(spool), 0)
+            # 新写入的序号接着已有的最大序号，不会与旧样本重复
+            spool.close()
+        self.assertGreater(len(replayed), self.ROUNDS)
+
+
+if __name__ == "__main__":
+    unittest.main()
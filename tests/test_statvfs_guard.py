@@ -0,0 +1,58 @@
+# -*- encoding: utf-8 -*-
+"""
+StatvfsGuard：慢挂载点超时后，在卡住的调用返回之前不再派发新线程。
+"""
+import os
+import threading
+import unittest
+from unittest import mock
+
+from stand_in import client
+
+
+class StatvfsGuardTest(unittest.TestCase):
+
+    def setUp(self):
+        self.release = threading.Event()
+        self.calls = []
+        real_statvfs = os.statvfs
+
+        def slow_statvfs(path):
+            self.calls.append(path)
+            if path == "/slow":
+                self.release.wait(10)
+            return real_statvfs("/")
+
+        patcher = mock.patch.object(client.os, "statvfs", slow_statvfs)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.release.set)
+        self.guard = client.StatvfsGuard(timeout=0.05, retry_after=0)
+
+    def test_slow_mount_holds_at_most_one_thread(self):
+        threads = threading.active_count()
+        for _ in range(20):
+            self.assertIsNone(self.guard.statvfs("/slow"))
+            self.assertIsNotNone(self.guard.statvfs("/"))
+        self.assertEqual(self.calls.count("/slow"), 1)
+        # 一个卡住的线程 + 一个服务其它挂载点的线程
+        self.assertLessEqual(threading.active_count() - threads, 2)
+
+    def test_mount_is_retried_after_stuck_call_returns(self):
+        self.assertIsNone(self.guard.statvfs("/slow"))
+        self.release.set()
+        self.assertTrue(self.guard.hung["/slow"][1].wait(1))
+        self.assertIsNotNone(self.guard.statvfs("/slow"))
+        self.assertNotIn("/slow", self.guard.hung)
+
+    def test_retry_after_still_applies(self):
+        self.guard.retry_after = 600
+        self.assertIsNone(self.guard.statvfs("/slow"))
+        self.release.set()
+        self.guard.hung["/slow"][1].wait(1)
+        self.assertIsNone(self.guard.statvfs("/slow"))
+        self.assertEqual(self.calls.count("/slow"), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
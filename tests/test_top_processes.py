@@ -0,0 +1,53 @@
+# -*- encoding: utf-8 -*-
+"""
+Top N 进程：扫描间隔较长时，process_count 仍由每个周期运行的 processes 采集项更新，
+不会被缓存的扫描结果覆盖。/proc 使用 bench.py 生成的合成目录。
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+from stand_in import client, quiet_options
+
+import bench
+
+PIDS = 20
+
+
+class TopProcessesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix="hm_top_")
+        self.addCleanup(shutil.rmtree, self.root, True)
+        old_roots = client.PROC_ROOT, client.SYS_ROOT
+        self.addCleanup(setattr, client, "PROC_ROOT", old_roots[0])
+        self.addCleanup(setattr, client, "SYS_ROOT", old_roots[1])
+        client.PROC_ROOT, client.SYS_ROOT = bench.build_proc_fixture(self.root, pids=PIDS)
+        self.monitor = client.SystemMonitor(
+            "0" * 32, "http://127.0.0.1", autostart=False,
+            options=quiet_options(process_top_n=3, process_interval=3600))
+        self.addCleanup(self.monitor.proc.close)
+
+    def spawn(self, count):
+        with open(client.proc_path("1", "stat")) as f:
+            stat = f.read()
+        for pid in range(PIDS + 1, PIDS + count + 1):
+            os.makedirs(client.proc_path(str(pid)))
+            with open(client.proc_path(str(pid), "stat"), "w") as f:
+                f.write(stat.replace("1 (", "{} (".format(pid), 1))
+
+    @unittest.skipUnless(client.SYSTEM == "Linux", "合成 /proc 仅适用于 Linux 采集项")
+    def test_process_count_tracks_processes_collector(self):
+        self.monitor.collect_info()
+        self.assertEqual(self.monitor.sample_metrics["process_count"], PIDS)
+        self.assertEqual(len(self.monitor.sample.get("top_cpu_processes")), 3)
+        self.spawn(5)
+        # top_processes 尚未到刷新时间，进程数仍随 processes 采集项变化
+        self.monitor.collect_info()
+        self.assertEqual(self.monitor.sample_metrics["process_count"], PIDS + 5)
+        self.assertEqual(self.monitor.sample.get("process_count"), PIDS + 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+# -*- encoding: utf-8 -*-
+"""
+HttpTransport 长连接测试：本地 http.server 替身统计连接数与收到的字节数。
+
+运行：python -m unittest discover -s tests
+"""
+import json
+import unittest
+
+from stand_in import StandInServer, client
+
+
+class HttpTransportTest(unittest.TestCase):
+    POSTS = 50
+
+    def setUp(self):
+        self.server = StandInServer().start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def post_many(self, transport, count=POSTS):
+        for i in range(count):
+            text = client.http_post(self.server.url(), {"seq": i, "pad": "x" * 512}, transport=transport)
+            self.assertEqual(json.loads(text)["code"], 200)
+
+    def seqs(self):
+        return [body["seq"] for body in self.server.bodies()]
+
+    def test_keep_alive_reuses_one_connection(self):
+        transport = client.HttpTransport(keep_alive=True)
+        self.post_many(transport)
+        transport.close()
+        self.assertEqual(self.server.connections, 1)
+        self.assertEqual(transport.stats["connections_opened"], 1)
+        self.assertEqual(transport.stats["wire_bytes"], self.server.body_bytes)
+        self.assertEqual(self.seqs(), list(range(self.POSTS)))
+
+    def test_without_keep_alive_opens_connection_per_post(self):
+        transport = client.HttpTransport(keep_alive=False)
+        self.post_many(transport)
+        self.assertEqual(self.server.connections, self.POSTS)
+        self.assertEqual(transport.stats["connections_opened"], self.POSTS)
+
+    def test_gzip_body_shrinks_wire_bytes(self):
+        transport = client.HttpTransport(keep_alive=True, gzip_body=True)
+        self.post_many(transport)
+        transport.close()
+        self.assertEqual(self.server.connections, 1)
+        self.assertEqual(transport.stats["wire_bytes"], self.server.body_bytes)
+        self.assertLess(self.server.body_bytes, transport.stats["payload_bytes"] // 4)
+        self.assertEqual(self.server.bodies()[-1]["pad"], "x" * 512)
+
+    def test_reconnects_after_server_closes(self):
+        self.server.close_every = 10
+        transport = client.HttpTransport(keep_alive=True)
+        self.post_many(transport)
+        transport.close()
+        # 服务端每 10 个请求断开一次：请求一个不少、一个不重
+        self.assertEqual(self.seqs(), list(range(self.POSTS)))
+        self.assertEqual(self.server.connections, self.POSTS // 10)
+        self.assertEqual(transport.generation, self.POSTS // 10)
+
+
+if __name__ == "__main__":
+    unittest.main()